@@ -0,0 +1,139 @@
+"""
+Control de admisión: estima cuánto costará un trabajo (segundos de proceso)
+a partir de la duración del audio, leída solo de la cabecera, y de las
+opciones elegidas, y decide si se encola tal cual, se encola con opciones
+más baratas o se rechaza para no romper el objetivo de latencia.
+"""
+import os
+import threading
+
+import soundfile as sf
+
+# Segundos de proceso por segundo de audio, aproximados con GPU. Son solo el
+# punto de partida: `observe` los corrige con la duración real de cada trabajo.
+SEPARATION_RTF = 0.05
+SYNTHESIS_RTF = 0.03
+F0_RTF = {
+    "pm": 0.005,
+    "dio": 0.02,
+    "fcpe": 0.01,
+    "rmvpe": 0.02,
+    "harvest": 0.3,
+    "crepe": 0.5,
+}
+DIFFUSION_RTF_PER_STEP = 0.004
+ENHANCER_RTF = 0.02
+
+# Opciones más baratas que se prueban, en orden, antes de rechazar un trabajo
+CHEAP_F0_PREDICTOR = "pm"
+CHEAP_K_STEP = 20
+
+# Si la cabecera no se puede leer se supone un MP3 de esta tasa
+FALLBACK_BITRATE = 128000
+
+
+def audio_duration(path):
+    """
+    Duración en segundos sin decodificar el audio. Si soundfile no reconoce
+    el formato se estima por el tamaño del archivo.
+    """
+    try:
+        return sf.info(str(path)).duration
+    except RuntimeError:
+        return os.path.getsize(path) * 8 / FALLBACK_BITRATE
+
+
+def estimate_cost(duration, f0_predictor="pm", n_targets=1, shallow_diffusion=False, k_step=100,
+                  enhancer=False):
+    """
+    Segundos de proceso previstos, sin calibrar. La separación, el troceado
+    y la F0 se pagan una vez; la síntesis, una vez por objetivo.
+    """
+    per_target = SYNTHESIS_RTF
+    if shallow_diffusion:
+        per_target += DIFFUSION_RTF_PER_STEP * k_step
+    if enhancer:
+        per_target += ENHANCER_RTF
+    shared = SEPARATION_RTF + F0_RTF.get(f0_predictor, max(F0_RTF.values()))
+    return duration * (shared + per_target * n_targets)
+
+
+class Decision:
+    def __init__(self, admitted, cost, wait, infer_args, downgraded=None):
+        self.admitted = admitted
+        self.cost = cost
+        self.wait = wait
+        self.infer_args = infer_args
+        # {opción: (valor pedido, valor usado)} si se abarató el trabajo
+        self.downgraded = downgraded or {}
+
+    def to_dict(self):
+        info = {"estimated_seconds": round(self.cost, 1), "estimated_wait_seconds": round(self.wait, 1)}
+        if self.downgraded:
+            info["downgraded"] = {k: {"requested": a, "used": b} for k, (a, b) in self.downgraded.items()}
+        return info
+
+
+class AdmissionController:
+    def __init__(self, workers, slo_seconds, shallow_diffusion=False, enhancer=False):
+        self.workers = max(1, workers)
+        self.slo_seconds = slo_seconds
+        self.shallow_diffusion = shallow_diffusion
+        self.enhancer = enhancer
+        # real / estimado, media móvil exponencial de los trabajos terminados
+        self.calibration = 1.0
+        self._lock = threading.Lock()
+
+    def cost(self, duration, infer_args, n_targets=1):
+        return self.calibration * estimate_cost(duration,
+                                                f0_predictor=infer_args.get("f0_predictor", "pm"),
+                                                n_targets=n_targets,
+                                                shallow_diffusion=self.shallow_diffusion,
+                                                k_step=infer_args.get("k_step", 100),
+                                                enhancer=self.enhancer)
+
+    def _downgrades(self, infer_args):
+        """
+        Variantes cada vez más baratas de `infer_args`, con lo que se cambió.
+        """
+        args, changed = dict(infer_args), {}
+        if args.get("f0_predictor", CHEAP_F0_PREDICTOR) != CHEAP_F0_PREDICTOR:
+            changed["f0_predictor"] = (args["f0_predictor"], CHEAP_F0_PREDICTOR)
+            args["f0_predictor"] = CHEAP_F0_PREDICTOR
+            yield dict(args), dict(changed)
+        if self.shallow_diffusion and args.get("k_step", 100) > CHEAP_K_STEP:
+            changed["k_step"] = (args.get("k_step", 100), CHEAP_K_STEP)
+            args["k_step"] = CHEAP_K_STEP
+            yield dict(args), dict(changed)
+
+    def decide(self, duration, infer_args, backlog, n_targets=1, allow_downgrade=True):
+        """
+        `backlog` son los segundos de proceso pendientes de los trabajos ya
+        admitidos. Se admite si el trabajo terminaría dentro del objetivo de
+        latencia; si no, se prueba con opciones más baratas y, si tampoco,
+        se rechaza. Con la cola vacía siempre se admite (con lo más barato
+        permitido), porque esperar no lo haría más rápido.
+        """
+        wait = backlog / self.workers
+        cost = self.cost(duration, infer_args, n_targets)
+        if wait + cost <= self.slo_seconds:
+            return Decision(True, cost, wait, infer_args)
+        best = Decision(backlog == 0, cost, wait, infer_args)
+        if allow_downgrade:
+            for args, changed in self._downgrades(infer_args):
+                cost = self.cost(duration, args, n_targets)
+                best = Decision(backlog == 0, cost, wait, args, changed)
+                if wait + cost <= self.slo_seconds:
+                    best.admitted = True
+                    break
+        return best
+
+    def observe(self, estimated, actual, alpha=0.2):
+        """
+        Ajusta la calibración con la duración real de un trabajo terminado.
+        """
+        if not estimated or actual <= 0:
+            return
+        with self._lock:
+            ratio = self.calibration * actual / estimated
+            self.calibration = (1 - alpha) * self.calibration + alpha * ratio
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# pipeline.py crea las carpetas de datos al importarse: en las pruebas, fuera del repositorio
+os.environ.setdefault("VC_DATA_DIR", tempfile.mkdtemp(prefix="vc-test-data-"))
@@ -0,0 +1,190 @@
+"""
+Caché en disco direccionada por contenido, con tamaño máximo y expulsión LRU.
+Cada entrada es una carpeta `<root>/<clave>/` con uno o varios archivos; el
+último acceso se guarda como mtime de la carpeta.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+HASH_CHUNK = 1024 * 1024
+STALE_TMP_SECONDS = 3600
+
+
+def hash_file(path, algorithm="sha256"):
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+
+def fingerprint_file(path):
+    """
+    Hash del contenido de un archivo grande (p. ej. un checkpoint), recordado
+    mientras no cambien su tamaño ni su mtime.
+    """
+    path = str(Path(path).resolve())
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _file_hashes_lock:
+        cached = _file_hashes.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    digest = hash_file(path)
+    with _file_hashes_lock:
+        _file_hashes[path] = (stamp, digest)
+    return digest
+
+
+def make_key(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _dir_size(path):
+    return sum(f.stat().st_size for f in Path(path).iterdir() if f.is_file())
+
+
+def link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class DiskCache:
+    def __init__(self, root, max_bytes, on_event=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # on_event("hit" | "miss" | "eviction"), para contarlos también fuera
+        # de este proceso (los contadores de abajo solo ven los suyos)
+        self.on_event = on_event
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._sizes = {}
+        for entry in self.root.iterdir():
+            if entry.name.startswith("."):
+                # restos de una escritura interrumpida (si son recientes, quizá
+                # los esté escribiendo otro proceso)
+                if time.time() - entry.stat().st_mtime > STALE_TMP_SECONDS:
+                    shutil.rmtree(entry, ignore_errors=True)
+            elif entry.is_dir():
+                self._sizes[entry.name] = _dir_size(entry)
+
+    @property
+    def size(self):
+        return sum(self._sizes.values())
+
+    def get(self, key):
+        """
+        Devuelve la carpeta de la entrada (y la marca como usada) o None.
+        """
+        entry = self.root / key
+        with self._lock:
+            hit = entry.is_dir()
+            if not hit:
+                self._sizes.pop(key, None)
+                self.misses += 1
+            else:
+                if key not in self._sizes:
+                    # guardada por otro proceso que comparte la carpeta
+                    self._sizes[key] = _dir_size(entry)
+                os.utime(entry)
+                self.hits += 1
+        self._emit("hit" if hit else "miss")
+        return entry if hit else None
+
+    def put(self, key, files):
+        """
+        Guarda `files` ({nombre: ruta}) bajo `key`. Los archivos se enlazan o
+        copian, así que el llamador conserva los originales.
+        """
+        tmp = Path(tempfile.mkdtemp(prefix=".", dir=str(self.root)))
+        try:
+            for name, src in files.items():
+                link_or_copy(src, tmp / name)
+            size = _dir_size(tmp)
+            with self._lock:
+                entry = self.root / key
+                if entry.exists():
+                    shutil.rmtree(entry, ignore_errors=True)
+                os.replace(tmp, entry)
+                self._sizes[key] = size
+                evicted = self._evict()
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self._emit("eviction", evicted)
+        return self.root / key
+
+    def _emit(self, event, n=1):
+        if self.on_event is not None:
+            for _ in range(n):
+                self.on_event(event)
+
+    def _rescan(self):
+        # otros procesos pueden haber añadido o expulsado entradas
+        sizes = {}
+        for entry in self.root.iterdir():
+            if entry.is_dir() and not entry.name.startswith("."):
+                sizes[entry.name] = self._sizes.get(entry.name)
+                if sizes[entry.name] is None:
+                    try:
+                        sizes[entry.name] = _dir_size(entry)
+                    except FileNotFoundError:
+                        del sizes[entry.name]
+        self._sizes = sizes
+
+    def _evict(self):
+        """
+        Expulsa las entradas menos usadas hasta caber en max_bytes y devuelve
+        cuántas expulsó.
+        """
+        if self.size <= self.max_bytes:
+            return 0
+        self._rescan()
+        if self.size <= self.max_bytes:
+            return 0
+        entries = []
+        for key in self._sizes:
+            try:
+                entries.append(((self.root / key).stat().st_mtime, key))
+            except FileNotFoundError:
+                entries.append((0, key))
+        entries.sort()
+        evicted = 0
+        for _, key in entries:
+            if self.size <= self.max_bytes:
+                break
+            shutil.rmtree(self.root / key, ignore_errors=True)
+            del self._sizes[key]
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            self._rescan()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._sizes),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
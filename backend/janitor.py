@@ -0,0 +1,189 @@
+"""
+Conserje de disco: mantiene data/uploads, data/results y data/segments por
+debajo de una cuota de bytes, borrando primero lo que lleva más tiempo sin
+usarse, y recupera al arrancar las carpetas de trabajos que quedaron a medias.
+"""
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import metrics
+
+RECLAIMED_BYTES = metrics.REGISTRY.counter("vc_disk_reclaimed_bytes_total",
+                                           "Bytes liberados por el conserje de disco", ["area", "reason"])
+RECLAIMED_ENTRIES = metrics.REGISTRY.counter("vc_disk_reclaimed_entries_total",
+                                             "Archivos o carpetas borrados por el conserje de disco",
+                                             ["area", "reason"])
+
+
+def entry_size(path):
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def last_access(path):
+    st = os.stat(path)
+    return max(st.st_atime, st.st_mtime)
+
+
+def last_change(path):
+    """
+    Última modificación de `path` o, si es una carpeta, de lo más reciente que
+    contenga: escribir en un archivo existente no cambia el mtime de su carpeta.
+    """
+    newest = os.stat(path).st_mtime
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                newest = max(newest, os.stat(os.path.join(root, name)).st_mtime)
+            except FileNotFoundError:
+                pass
+    return newest
+
+
+def touch_access(path):
+    """
+    Marca un archivo como usado sin cambiar su mtime (que decide, p. ej., si
+    una recodificación sigue siendo válida).
+    """
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except FileNotFoundError:
+        pass
+
+
+def remove_entry(path):
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class DiskJanitor:
+    def __init__(self, interval=300):
+        self.interval = interval
+        # nombre -> (carpeta, bytes máximos)
+        self.areas = {}
+        self.usage = {}
+        self._in_use = set()
+        # rutas extra que no se tocan, p. ej. las de los trabajos sin terminar
+        self.in_use = lambda: ()
+        self._lock = threading.Lock()
+        self._thread = None
+        metrics.REGISTRY.gauge("vc_disk_usage_bytes", "Bytes ocupados por área en la última pasada",
+                               lambda: {(name,): size for name, size in self.usage.items()}, ["area"])
+        metrics.REGISTRY.gauge("vc_disk_quota_bytes", "Cuota de bytes por área",
+                               lambda: {(name,): quota for name, (_, quota) in self.areas.items()}, ["area"])
+
+    def add_area(self, name, root, max_bytes):
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        self.areas[name] = (root, max_bytes)
+
+    def protect(self, path):
+        """
+        Excluye `path` de la limpieza mientras un trabajo lo esté usando.
+        """
+        with self._lock:
+            self._in_use.add(Path(path).resolve())
+
+    def release(self, path):
+        with self._lock:
+            self._in_use.discard(Path(path).resolve())
+
+    def _protected(self):
+        with self._lock:
+            protected = set(self._in_use)
+        return protected | {Path(p).resolve() for p in self.in_use()}
+
+    def _reclaim(self, area, path, reason, size=None):
+        if size is None:
+            size = entry_size(path)
+        remove_entry(path)
+        RECLAIMED_BYTES.inc(size, area=area, reason=reason)
+        RECLAIMED_ENTRIES.inc(area=area, reason=reason)
+        return size
+
+    def reclaim_orphans(self, areas, suffixes=(".part",), grace_seconds=3600):
+        """
+        Al arrancar, una carpeta en `areas` que no esté en uso es de un
+        trabajo que ya no existe, igual que los archivos a medio escribir
+        (`suffixes`); los trabajos sin terminar (`in_use`) conservan las
+        suyas. Otro proceso de la API puede estar usando una que aún no es
+        de ningún trabajo (una subida en curso, los tramos que sirve), así
+        que solo se borra lo que lleva `grace_seconds` sin modificarse.
+        Devuelve los bytes liberados.
+        """
+        reclaimed = 0
+        in_use = self._protected()
+        cutoff = time.time() - grace_seconds
+        for name, (root, _) in self.areas.items():
+            for entry in root.iterdir():
+                if entry.resolve() in in_use:
+                    continue
+                if not ((name in areas and entry.is_dir()) or entry.name.endswith(suffixes)):
+                    continue
+                try:
+                    if last_change(entry) > cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                reclaimed += self._reclaim(name, entry, "orphan")
+        if reclaimed:
+            print(f"[INFO] Recuperados {reclaimed} bytes de trabajos interrumpidos")
+        return reclaimed
+
+    def sweep(self):
+        """
+        Una pasada: en cada área que supere su cuota borra las entradas menos
+        usadas recientemente, salvo las que estén en uso. Devuelve los bytes
+        liberados.
+        """
+        reclaimed = 0
+        for name, (root, max_bytes) in self.areas.items():
+            in_use = self._protected()
+            entries = []
+            total = 0
+            for entry in root.iterdir():
+                try:
+                    size = entry_size(entry)
+                    entries.append((last_access(entry), size, entry))
+                except FileNotFoundError:
+                    continue
+                total += size
+            entries.sort()
+            for _, size, entry in entries:
+                if total <= max_bytes:
+                    break
+                if entry.resolve() in in_use:
+                    continue
+                reclaimed += self._reclaim(name, entry, "quota", size)
+                total -= size
+            self.usage[name] = total
+        return reclaimed
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="disk-janitor", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[WARN] Limpieza de disco fallida: {e}")
+            time.sleep(self.interval)
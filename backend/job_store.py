@@ -0,0 +1,308 @@
+"""
+Almacén de trabajos en SQLite, compartido entre el proceso de la API y los
+procesos worker. Cada trabajo guarda la función a ejecutar y sus argumentos
+en JSON; los workers los reclaman con un lease que renuevan mientras trabajan,
+así que un trabajo cuyo worker muere vuelve a la cola.
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    fn TEXT,
+    payload TEXT,
+    workdir TEXT,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    stages TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    cost REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_job ON events (job_id, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _dumps(value):
+    return json.dumps(value, default=str)
+
+
+class JobStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        try:
+            # bases de datos creadas antes de meta.updated_at
+            self._conn.execute("ALTER TABLE meta ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        self._lock = threading.Lock()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _transaction(self, fn):
+        # BEGIN IMMEDIATE: reclamar un trabajo no puede intercalarse con otro worker
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- lado de la API ---
+
+    def insert(self, job_id, fn, args, kwargs, workdir=None, cost=0.0, status=QUEUED, result=None,
+               max_queued=None):
+        """
+        Crea un trabajo. Con `max_queued`, devuelve False sin crearlo si ya
+        hay tantos en espera.
+        """
+        now = time.time()
+
+        def insert(conn):
+            if max_queued is not None:
+                queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+                if queued >= max_queued:
+                    return False
+            finished = now if status in FINISHED else None
+            conn.execute(
+                "INSERT INTO jobs (id, fn, payload, workdir, status, progress, result, cost, created_at,"
+                " started_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, fn, _dumps({"args": args, "kwargs": kwargs}), str(workdir) if workdir else None,
+                 status, 1.0 if status == DONE else 0.0, _dumps(result), cost, now, finished, finished))
+            return True
+
+        return self._transaction(insert)
+
+    def get(self, job_id):
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def unfinished(self):
+        return self._execute("SELECT * FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING))
+
+    def count(self, status):
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,))[0][0]
+
+    def finished_since(self, since):
+        """
+        (coste estimado, segundos reales, finished_at) de los trabajos
+        terminados con éxito después de `since`.
+        """
+        return self._execute(
+            "SELECT cost, finished_at - started_at, finished_at FROM jobs"
+            " WHERE status = ? AND finished_at > ? AND started_at IS NOT NULL ORDER BY finished_at",
+            (DONE, since))
+
+    def request_cancel(self, job_id):
+        """
+        Un trabajo en espera se cancela al momento; uno en ejecución se marca
+        y el worker lo detiene en su siguiente actualización.
+        """
+        now = time.time()
+
+        def cancel(conn):
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                         (CANCELLED, now, job_id, QUEUED))
+            cancelled_now = conn.execute("SELECT changes()").fetchone()[0]
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING))
+            return cancelled_now
+
+        if self._transaction(cancel):
+            self.publish(job_id, "end", self.to_dict(self.get(job_id)))
+            return True
+        return False
+
+    def forget_old(self, keep_finished):
+        def forget(conn):
+            conn.execute(
+                "DELETE FROM events WHERE job_id IN (SELECT id FROM jobs WHERE status IN (?, ?, ?)"
+                " ORDER BY finished_at DESC LIMIT -1 OFFSET ?)", (*FINISHED, keep_finished))
+            conn.execute(
+                "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status IN (?, ?, ?)"
+                " ORDER BY finished_at DESC LIMIT -1 OFFSET ?)", (*FINISHED, keep_finished))
+
+        self._transaction(forget)
+
+    def events(self, job_id, after=0):
+        return [(row["seq"], row["event"], json.loads(row["data"])) for row in self._execute(
+            "SELECT seq, event, data FROM events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after))]
+
+    def requeue_worker(self, worker, max_attempts, reason):
+        """
+        Devuelve a la cola los trabajos de un worker que ha muerto, o los da
+        por fallidos si ya agotaron sus intentos. Devuelve sus ids.
+        """
+        return self._requeue("worker = ?", (worker,), max_attempts, reason)
+
+    def requeue_expired(self, max_attempts, reason):
+        return self._requeue("lease_until < ?", (time.time(),), max_attempts, reason)
+
+    def _requeue(self, where, params, max_attempts, reason):
+        now = time.time()
+
+        def requeue(conn):
+            rows = conn.execute(f"SELECT id, attempts, cancel_requested FROM jobs WHERE status = ? AND {where}",
+                                (RUNNING, *params)).fetchall()
+            for row in rows:
+                if row["cancel_requested"]:
+                    conn.execute("UPDATE jobs SET status = ?, finished_at = ?, worker = NULL WHERE id = ?",
+                                 (CANCELLED, now, row["id"]))
+                elif row["attempts"] >= max_attempts:
+                    conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ?, worker = NULL"
+                                 " WHERE id = ?", (FAILED, reason, now, row["id"]))
+                else:
+                    conn.execute("UPDATE jobs SET status = ?, error = ?, worker = NULL, lease_until = NULL"
+                                 " WHERE id = ?", (QUEUED, reason, row["id"]))
+            return [row["id"] for row in rows]
+
+        ids = self._transaction(requeue)
+        for job_id in ids:
+            row = self.get(job_id)
+            if row["status"] in FINISHED:
+                self.publish(job_id, "end", self.to_dict(row))
+            else:
+                self.publish(job_id, "status", {"status": QUEUED, "retry": row["attempts"], "error": reason})
+        return ids
+
+    def set_meta(self, key, value):
+        self._execute("INSERT OR REPLACE INTO meta (key, value, updated_at) VALUES (?, ?, ?)",
+                      (key, _dumps(value), time.time()))
+
+    def get_meta(self, key, since=None):
+        """
+        Con `since`, solo si se publicó después.
+        """
+        rows = self._execute("SELECT value FROM meta WHERE key = ? AND updated_at >= ?", (key, since or 0))
+        return json.loads(rows[0]["value"]) if rows else None
+
+    # --- lado del worker ---
+
+    def claim(self, worker, lease_seconds):
+        """
+        Reclama el trabajo en espera más antiguo para `worker`, o None.
+        """
+        now = time.time()
+
+        def claim(conn):
+            row = conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                               (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1,"
+                " started_at = ?, cancel_requested = 0 WHERE id = ?",
+                (RUNNING, worker, now + lease_seconds, now, row["id"]))
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+        return self._transaction(claim)
+
+    # Las escrituras del worker solo valen mientras el trabajo siga siendo suyo:
+    # si su lease caducó y el trabajo volvió a la cola (o ya lo tiene otro
+    # worker), no cambian nada.
+
+    def owns(self, job_id, worker):
+        rows = self._execute("SELECT 1 FROM jobs WHERE id = ? AND worker = ? AND status = ?", (job_id, worker, RUNNING))
+        return bool(rows)
+
+    def renew(self, job_id, worker, lease_seconds):
+        """
+        Devuelve False si el trabajo ya no es de `worker`.
+        """
+        def renew(conn):
+            conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?",
+                         (time.time() + lease_seconds, job_id, worker, RUNNING))
+            return conn.execute("SELECT changes()").fetchone()[0] > 0
+
+        return self._transaction(renew)
+
+    def update(self, job_id, worker, stage, progress, stages):
+        """
+        Guarda el avance. Devuelve True si se ha pedido cancelar el trabajo,
+        False si no y None si el trabajo ya no es de `worker`.
+        """
+        def update(conn):
+            conn.execute("UPDATE jobs SET stage = ?, progress = ?, stages = ? WHERE id = ? AND worker = ? AND status = ?",
+                         (stage, progress, _dumps(stages), job_id, worker, RUNNING))
+            if not conn.execute("SELECT changes()").fetchone()[0]:
+                return None
+            return bool(conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+        return self._transaction(update)
+
+    def finish(self, job_id, worker, status, result=None, error=None):
+        """
+        Devuelve False, sin tocar el trabajo, si ya no es de `worker`.
+        """
+        def finish(conn):
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, worker = NULL,"
+                " lease_until = NULL, progress = CASE WHEN ? = ? THEN 1.0 ELSE progress END"
+                " WHERE id = ? AND worker = ? AND status = ?",
+                (status, _dumps(result), error, time.time(), status, DONE, job_id, worker, RUNNING))
+            return conn.execute("SELECT changes()").fetchone()[0] > 0
+
+        if not self._transaction(finish):
+            return False
+        self.publish(job_id, "end", self.to_dict(self.get(job_id)))
+        return True
+
+    def publish(self, job_id, event, data):
+        self._execute("INSERT INTO events (job_id, event, data) VALUES (?, ?, ?)", (job_id, event, _dumps(data)))
+
+    @staticmethod
+    def to_dict(row):
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "progress": row["progress"],
+            "stages": json.loads(row["stages"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
@@ -0,0 +1,309 @@
+"""
+Cola de trabajos en segundo plano para el backend: los endpoints encolan en
+un almacén SQLite y devuelven un id al instante, y un grupo de procesos
+worker, cada uno con sus propios modelos y su parte de los hilos de torch,
+procesa los trabajos. Si un worker muere, sus trabajos vuelven a la cola.
+"""
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+import metrics
+from job_store import CANCELLED, DONE, FAILED, FINISHED, QUEUED, RUNNING, JobStore  # noqa: F401
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLost(Exception):
+    """
+    El worker perdió el lease del trabajo (volvió a la cola o lo tiene otro
+    worker): debe abandonarlo sin escribir nada más en él.
+    """
+
+
+def _qualname(fn):
+    return f"{fn.__module__}.{fn.__qualname__}"
+
+
+def _resolve(name):
+    module, _, attr = name.rpartition(".")
+    return getattr(importlib.import_module(module), attr)
+
+
+class Job:
+    """
+    Un trabajo tal como está en el almacén. En el worker, `update` y
+    `publish` escriben en él, y `update` es también el punto donde un trabajo
+    en ejecución se entera de que lo han cancelado.
+    """
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+        self.id = row["id"]
+        self.worker = row["worker"]
+        self.status = row["status"]
+        self.stage = row["stage"]
+        self.progress = row["progress"]
+        self.stages = json.loads(row["stages"])
+        self.cost = row["cost"]
+        self.workdir = row["workdir"]
+        self.attempts = row["attempts"]
+        self.created_at = row["created_at"]
+        self.started_at = row["started_at"]
+        self.finished_at = row["finished_at"]
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def result(self):
+        return self.to_dict()["result"]
+
+    def update(self, stage, progress=0.0):
+        """
+        Registra el avance de una etapa.
+        """
+        self.stage = stage
+        self.progress = progress
+        self.stages[stage] = progress
+        cancelled = self._store.update(self.id, self.worker, stage, progress, self.stages)
+        if cancelled is None:
+            raise JobLost(self.id)
+        if cancelled:
+            raise JobCancelled(self.id)
+        self.publish("progress", {"stage": stage, "progress": progress})
+
+    def publish(self, event, data):
+        self._store.publish(self.id, event, data)
+
+    def owned(self):
+        """
+        False si el worker ya no tiene el trabajo: sus archivos son entonces
+        del intento que lo tenga ahora.
+        """
+        return self._store.owns(self.id, self.worker)
+
+    def to_dict(self):
+        return JobStore.to_dict(self._row)
+
+
+def _heartbeat(store, job_id, worker, lease_seconds, stop):
+    # un error al renovar (p. ej. la base de datos bloqueada) no detiene el
+    # latido; si el lease se pierde, el trabajo se entera en su próximo update
+    while not stop.wait(lease_seconds / 3):
+        try:
+            if not store.renew(job_id, worker, lease_seconds):
+                print(f"[WARN] {worker} perdió el lease del trabajo {job_id}")
+                return
+        except Exception:
+            traceback.print_exc()
+
+
+def _worker_main(name, db_path, setup, torch_threads, lease_seconds, poll_seconds, metrics_queue):
+    """
+    Bucle de un proceso worker: prepara los modelos con `setup(store,
+    torch_threads)` y ejecuta los trabajos que va reclamando.
+    """
+    metrics.forward_to(metrics_queue)
+    store = JobStore(db_path)
+    if setup:
+        _resolve(setup)(store, torch_threads)
+    print(f"[INFO] Worker {name} listo (pid {os.getpid()}, {torch_threads} hilos)")
+    while True:
+        row = store.claim(name, lease_seconds)
+        if row is None:
+            time.sleep(poll_seconds)
+            continue
+        job = Job(store, row)
+        job.publish("status", {"status": RUNNING, "worker": name, "attempt": job.attempts})
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(store, job.id, name, lease_seconds, stop), daemon=True).start()
+        try:
+            try:
+                payload = json.loads(row["payload"])
+                result = _resolve(row["fn"])(job, *payload["args"], **payload["kwargs"])
+            except JobCancelled:
+                finished = store.finish(job.id, name, CANCELLED)
+            except JobLost:
+                finished = False
+            except Exception as e:
+                traceback.print_exc()
+                finished = store.finish(job.id, name, FAILED, error=str(e))
+            else:
+                finished = store.finish(job.id, name, DONE, result)
+            if not finished:
+                print(f"[WARN] {name} abandona el trabajo {job.id}: ya no es suyo")
+        finally:
+            stop.set()
+
+
+class JobManager:
+    def __init__(self, db_path, max_workers=1, max_queued=16, keep_finished=1000,
+                 worker_setup=None, torch_threads=None, lease_seconds=60, max_attempts=3, poll_seconds=0.5):
+        self.db_path = str(db_path)
+        self.store = JobStore(db_path)
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        # "modulo.funcion" que cada worker llama al arrancar con (store, torch_threads)
+        self.worker_setup = _qualname(worker_setup) if callable(worker_setup) else worker_setup
+        # los núcleos se reparten entre los workers para no sobresuscribir torch
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // max(1, max_workers))
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self._ctx = multiprocessing.get_context("spawn")
+        self._metrics_queue = None
+        self._procs = {}
+        self._observed_until = time.time()
+        self._started = False
+        self._started_at = None
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        self._started_at = time.time()
+        # Otros procesos de la API (uvicorn --workers, o el anterior durante un
+        # reinicio) pueden tener sus workers usando la misma base de datos: solo
+        # vuelven a la cola los trabajos cuyo lease ya caducó
+        requeued = self.store.requeue_expired(self.max_attempts, "El worker dejó de responder")
+        if requeued:
+            print(f"[INFO] {len(requeued)} trabajos interrumpidos vuelven a la cola")
+        self._metrics_queue = self._ctx.Queue()
+        for slot in range(self.max_workers):
+            self._spawn(slot)
+        threading.Thread(target=self._supervise, name="job-supervisor", daemon=True).start()
+        threading.Thread(target=self._drain_metrics, name="job-metrics", daemon=True).start()
+        metrics.REGISTRY.gauge("vc_worker_resident_memory_bytes", "Memoria residente de cada worker",
+                               lambda: {(name,): metrics.process_rss_bytes(proc.pid)
+                                        for name, proc in self._procs.values()}, ["worker"])
+
+    def _spawn(self, slot):
+        name = f"worker-{slot}-{uuid.uuid4().hex[:8]}"
+        proc = self._ctx.Process(target=_worker_main, name=name, daemon=True,
+                                 args=(name, self.db_path, self.worker_setup, self.torch_threads,
+                                       self.lease_seconds, self.poll_seconds, self._metrics_queue))
+        proc.start()
+        self._procs[slot] = (name, proc)
+
+    def _supervise(self):
+        while True:
+            time.sleep(1)
+            try:
+                for slot, (name, proc) in list(self._procs.items()):
+                    if proc.is_alive():
+                        continue
+                    print(f"[WARN] {name} terminó con código {proc.exitcode}; se reinicia")
+                    self.store.requeue_worker(name, self.max_attempts,
+                                              f"El worker terminó inesperadamente (código {proc.exitcode})")
+                    self._spawn(slot)
+                self.store.requeue_expired(self.max_attempts, "El worker dejó de responder")
+                self.store.forget_old(self.keep_finished)
+            except Exception:
+                traceback.print_exc()
+
+    def _drain_metrics(self):
+        while True:
+            try:
+                metrics.apply(self._metrics_queue.get())
+            except (EOFError, OSError):
+                return
+            except queue.Empty:
+                continue
+
+    def wait_meta(self, key, timeout=None):
+        """
+        Espera a que un worker publique `key` (p. ej. la descripción de los
+        modelos cargados) y la devuelve. Tras `start`, solo vale lo publicado
+        desde entonces, por un worker de este pool u otro igual de reciente.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            value = self.store.get_meta(key, since=self._started_at)
+            if value is not None:
+                return value
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"Ningún worker publicó {key}")
+            time.sleep(self.poll_seconds)
+
+    def queued(self):
+        return self.store.count(QUEUED)
+
+    def running(self):
+        return self.store.count(RUNNING)
+
+    def unfinished(self):
+        return [Job(self.store, row) for row in self.store.unfinished()]
+
+    def backlog(self):
+        """
+        Segundos de proceso estimados que quedan en los trabajos sin terminar.
+        """
+        now = time.time()
+        total = 0.0
+        for job in self.unfinished():
+            if job.status == QUEUED:
+                total += job.cost
+            elif job.status == RUNNING:
+                # un trabajo que se alarga sigue contando algo hasta que acaba
+                total += max(job.cost - (now - job.started_at), 0.1 * job.cost)
+        return total
+
+    def collect_finished(self):
+        """
+        (coste estimado, segundos reales) de los trabajos terminados desde la
+        última llamada, para calibrar el control de admisión.
+        """
+        rows = self.store.finished_since(self._observed_until)
+        if rows:
+            self._observed_until = rows[-1][2]
+        return [(cost, seconds) for cost, seconds, _ in rows]
+
+    def submit(self, fn, *args, workdir=None, cost=0.0, **kwargs):
+        """
+        Encola `fn(job, *args, **kwargs)`. `fn` debe ser una función de nivel
+        de módulo y los argumentos, serializables en JSON, porque se ejecuta
+        en otro proceso. Lanza QueueFullError si la cola está llena.
+        """
+        job_id = str(uuid.uuid4())
+        if not self.store.insert(job_id, _qualname(fn), args, kwargs, workdir=workdir, cost=cost,
+                                 max_queued=self.max_queued):
+            raise QueueFullError(f"Hay {self.max_queued} trabajos en espera")
+        return self.get(job_id)
+
+    def complete(self, result):
+        """
+        Registra un trabajo ya terminado (p. ej. servido desde la caché).
+        """
+        job_id = str(uuid.uuid4())
+        self.store.insert(job_id, None, [], {}, status=DONE, result=result)
+        self.store.publish(job_id, "end", JobStore.to_dict(self.store.get(job_id)))
+        return self.get(job_id)
+
+    def get(self, job_id):
+        row = self.store.get(job_id)
+        return Job(self.store, row) if row is not None else None
+
+    def events(self, job_id, after=0):
+        return self.store.events(job_id, after)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            self.store.request_cancel(job_id)
+            job = self.get(job_id)
+        return job
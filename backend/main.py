@@ -1,14 +1,26 @@
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import hashlib
+import json
+import mimetypes
 import os
 from pathlib import Path
 import shutil
-import subprocess
 import uuid
-import librosa
-import soundfile as sf
-import sys
+
+from admission import AdmissionController, audio_duration
+from disk_cache import make_key
+from janitor import DiskJanitor, touch_access
+from jobs import CANCELLED, JobManager, QueueFullError
+import metrics
+import pipeline
+from pipeline import (DATA_DIR, RESULTS_DIR, SEGMENTS_DIR, UPLOAD_DIR, feature_cache, publish_cached, result_cache,
+                      run_multi_pipeline, run_pipeline, stem_cache)
+from transfer import DOWNLOAD_FORMATS, UploadTooLarge, ranged_file_response, save_upload, transcode
+from worker import resolve_infer_args
 
 app = FastAPI()
 
@@ -20,121 +32,333 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Definir la raíz absoluta del proyecto
-PROJECT_ROOT = Path(__file__).resolve().parent.parent
-DATA_DIR = PROJECT_ROOT / "data"
-UPLOAD_DIR = DATA_DIR / "uploads"
-RESULTS_DIR = DATA_DIR / "results"
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+MAX_UPLOAD_BYTES = int(os.environ.get("VC_MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+# Cola de trabajos en SQLite: cada uno de los VC_MAX_CONCURRENT_JOBS procesos
+# worker carga sus propios modelos y usa VC_TORCH_THREADS hilos (por defecto,
+# los núcleos repartidos entre los workers). Un trabajo cuyo worker muere se
+# reintenta hasta VC_JOB_MAX_ATTEMPTS veces.
+MAX_CONCURRENT_JOBS = int(os.environ.get("VC_MAX_CONCURRENT_JOBS", "1"))
+MAX_QUEUED_JOBS = int(os.environ.get("VC_MAX_QUEUED_JOBS", "16"))
+TORCH_THREADS = int(os.environ.get("VC_TORCH_THREADS", "0")) or None
+JOB_MAX_ATTEMPTS = int(os.environ.get("VC_JOB_MAX_ATTEMPTS", "3"))
+# Tiempo máximo que la API espera a que el primer worker cargue los modelos
+WORKER_STARTUP_TIMEOUT = float(os.environ.get("VC_WORKER_STARTUP_TIMEOUT_S", "600"))
+jobs = JobManager(DATA_DIR / "jobs.sqlite3", max_workers=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS,
+                  worker_setup=pipeline.setup_worker, torch_threads=TORCH_THREADS,
+                  max_attempts=JOB_MAX_ATTEMPTS)
+# Control de admisión: un trabajo nuevo debería terminar en menos de este tiempo
+LATENCY_SLO_SECONDS = float(os.environ.get("VC_LATENCY_SLO_S", "900"))
+admission = AdmissionController(MAX_CONCURRENT_JOBS, LATENCY_SLO_SECONDS)
+ADMISSION_DECISIONS = metrics.REGISTRY.counter("vc_admission_decisions_total",
+                                               "Decisiones del control de admisión", ["decision"])
+metrics.REGISTRY.gauge("vc_admission_backlog_seconds", "Segundos de proceso estimados pendientes", jobs.backlog)
+metrics.REGISTRY.gauge("vc_admission_calibration", "Factor real/estimado del modelo de coste",
+                       lambda: admission.calibration)
+# Cada cuánto revisa /jobs/{id}/events si hay eventos nuevos
+EVENTS_POLL_SECONDS = 0.25
+# Máximo de combinaciones (locutor, tono) por trabajo de /process-multi/
+MAX_TARGETS = int(os.environ.get("VC_MAX_TARGETS", "8"))
+
+# Cuotas de disco: al superarlas se borra primero lo que lleva más tiempo sin usarse
+UPLOADS_QUOTA_BYTES = int(os.environ.get("VC_UPLOADS_QUOTA_MB", "2048")) * 1024 * 1024
+RESULTS_QUOTA_BYTES = int(os.environ.get("VC_RESULTS_QUOTA_MB", "4096")) * 1024 * 1024
+SEGMENTS_QUOTA_BYTES = int(os.environ.get("VC_SEGMENTS_QUOTA_MB", "1024")) * 1024 * 1024
+janitor = DiskJanitor(interval=int(os.environ.get("VC_JANITOR_INTERVAL_S", "300")))
+janitor.add_area("uploads", UPLOAD_DIR, UPLOADS_QUOTA_BYTES)
+janitor.add_area("results", RESULTS_DIR, RESULTS_QUOTA_BYTES)
+janitor.add_area("segments", SEGMENTS_DIR, SEGMENTS_QUOTA_BYTES)
+# Las carpetas de los trabajos sin terminar no se tocan, aunque sean de un arranque anterior
+janitor.in_use = lambda: [p for job in jobs.unfinished() for p in (job.workdir, SEGMENTS_DIR / job.id) if p]
+# Al arrancar, las carpetas sin trabajo se borran solo tras este tiempo sin cambios: pueden
+# ser de otro proceso de la API (una subida que aún no es trabajo, tramos que sirve)
+ORPHAN_GRACE_SECONDS = int(os.environ.get("VC_ORPHAN_GRACE_S", "3600"))
+
+# Descripción de los modelos que publica el primer worker al cargarlos
+MODEL = {}
+
+# Métricas que se leen en el momento del scrape (las cachés, solo los accesos de la API)
+metrics.REGISTRY.gauge("vc_jobs_queued", "Trabajos en espera", jobs.queued)
+metrics.REGISTRY.gauge("vc_jobs_running", "Trabajos en ejecución", jobs.running)
+CACHES = {"results": result_cache, "stems": stem_cache}
+if feature_cache is not None:
+    CACHES["features"] = feature_cache
+metrics.REGISTRY.gauge("vc_cache_bytes", "Bytes ocupados por cada caché",
+                       lambda: {(name,): c.stats()["bytes"] for name, c in CACHES.items()}, ["cache"])
+# Los aciertos, fallos y expulsiones están en vc_cache_events_total: casi todas
+# las búsquedas ocurren en los workers, y los contadores de estos objetos solo
+# ven las del proceso de la API
+
+@app.on_event("startup")
+def load_models():
+    # Los modelos se cargan en los workers; la API solo necesita su descripción
+    jobs.start()
+    MODEL.update(jobs.wait_meta("model", timeout=WORKER_STARTUP_TIMEOUT))
+    admission.shallow_diffusion = MODEL["shallow_diffusion"]
+    admission.enhancer = MODEL["enhancer"]
+    janitor.reclaim_orphans({"uploads", "segments"}, grace_seconds=ORPHAN_GRACE_SECONDS)
+    janitor.start()
 
 @app.post("/upload-song/")
 async def upload_song(file: UploadFile = File(...)):
     # Guarda el archivo subido
-    out_path = UPLOAD_DIR / file.filename
-    with open(out_path, "wb") as f:
-        f.write(await file.read())
+    filename = Path(file.filename).name
+    out_path = UPLOAD_DIR / filename
+    try:
+        with metrics.time_stage("upload"):
+            await save_upload(file, out_path, MAX_UPLOAD_BYTES)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
     # Aquí deberías llamar al pipeline de separación y conversión de voz
     # Simulación de procesamiento
-    return {"status": "uploaded", "filename": file.filename}
+    return {"status": "uploaded", "filename": filename}
 
 @app.get("/download/{filename}")
-def download_result(filename: str):
-    result_path = RESULTS_DIR / filename
+def download_result(filename: str, request: Request, format: str = None):
+    """
+    Descarga un resultado tal cual o, con `format` (wav, flac u opus),
+    recodificado. Admite cabecera Range. La primera descarga de cada formato
+    espera a que termine la recodificación; después queda guardada en disco.
+    """
+    result_path = RESULTS_DIR / Path(filename).name
     if not result_path.exists():
         return JSONResponse(status_code=404, content={"error": "Archivo no encontrado"})
-    return FileResponse(result_path, media_type="audio/wav", filename=filename)
+    touch_access(result_path)
+    if format is None:
+        media_type = mimetypes.guess_type(result_path.name)[0] or "application/octet-stream"
+        return ranged_file_response(result_path, request.headers.get("range"), media_type, result_path.name)
+    if format not in DOWNLOAD_FORMATS:
+        return JSONResponse(status_code=400, content={"error": f"Formato no soportado: {format}"})
+    path = transcode(result_path, format)
+    touch_access(path)
+    media_type = DOWNLOAD_FORMATS[format][3]
+    return ranged_file_response(path, request.headers.get("range"), media_type, path.name)
 
-def mezclar_voces_instrumental(voz_path, instrumental_path, output_path, voz_gain=1.0, instrumental_gain=1.0):
+def admit(input_path, infer_args, n_targets=1, allow_downgrade=True):
     """
-    Mezcla la voz clonada y el instrumental, ajustando volúmenes si es necesario.
+    Consulta al control de admisión. Devuelve (decisión, respuesta 429 o None).
     """
-    voz, sr = librosa.load(voz_path, sr=None)
-    instrumental, _ = librosa.load(instrumental_path, sr=sr)
-    # Ajustar longitudes
-    min_len = min(len(voz), len(instrumental))
-    voz = voz[:min_len] * voz_gain
-    instrumental = instrumental[:min_len] * instrumental_gain
-    mezcla = voz + instrumental
-    # Normalizar para evitar clipping
-    mezcla = mezcla / max(1.01, abs(mezcla).max())
-    sf.write(output_path, mezcla, sr)
+    for estimated, actual in jobs.collect_finished():
+        admission.observe(estimated, actual)
+    decision = admission.decide(audio_duration(input_path), infer_args, jobs.backlog(),
+                                n_targets=n_targets, allow_downgrade=allow_downgrade)
+    if not decision.admitted:
+        ADMISSION_DECISIONS.inc(decision="rejected")
+        retry_after = max(1, int(decision.wait + decision.cost - admission.slo_seconds))
+        return decision, JSONResponse(status_code=429, headers={"Retry-After": str(retry_after)},
+                                      content={"error": "El servidor está saturado, inténtalo más tarde",
+                                               **decision.to_dict()})
+    ADMISSION_DECISIONS.inc(decision="downgraded" if decision.downgraded else "accepted")
+    return decision, None
 
-@app.post("/process/")
-async def process_song(file: UploadFile = File(...)):
+def diffusion_steps(k_step):
     """
-    Pipeline completo: recibe canción, separa voz, convierte, clona voz y devuelve resultado.
+    `k_step` pedido, o None (el valor por defecto) si el modelo no usa
+    difusión superficial: ahí no cambia el resultado y no debe cambiar su
+    clave en la caché.
     """
-    # 1. Guardar archivo temporal
-    job_id = str(uuid.uuid4())
-    temp_dir = UPLOAD_DIR / job_id
+    return k_step if MODEL.get("shallow_diffusion") else None
+
+def result_cache_key(audio_hash, infer_args):
+    return make_key(audio_hash, MODEL["fingerprint"], json.dumps(infer_args, sort_keys=True))
+
+def discard_upload(temp_dir):
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    janitor.release(temp_dir)
+
+async def receive_upload(file):
+    """
+    Guarda la subida en una carpeta temporal propia. Devuelve
+    (carpeta, ruta, sha256) o lanza UploadTooLarge.
+    """
+    temp_dir = UPLOAD_DIR / str(uuid.uuid4())
     temp_dir.mkdir(parents=True, exist_ok=True)
-    input_path = temp_dir / file.filename
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
+    janitor.protect(temp_dir)
+    input_path = temp_dir / Path(file.filename).name
+    audio_hash = hashlib.sha256()
+    try:
+        with metrics.time_stage("upload"):
+            await save_upload(file, input_path, MAX_UPLOAD_BYTES, hasher=audio_hash)
+    except UploadTooLarge:
+        discard_upload(temp_dir)
+        raise
     print("Archivo guardado en:", input_path, "¿Existe?", input_path.exists())
-    input_path = input_path.resolve()
-
-    # 2. Separar voz e instrumental (Demucs)
-    vocals_path = (temp_dir / "vocals.wav").resolve()
-    instrumental_path = (temp_dir / "instrumental.wav").resolve()
-    demucs_cmd = [
-        sys.executable, "separate_vocals.py",
-        "--input", str(input_path),
-        "--vocals", str(vocals_path),
-        "--instrumental", str(instrumental_path)
-    ]
-    subprocess.run(demucs_cmd, check=True, cwd=os.path.dirname(__file__))
-
-    # 3. Convertir voz a formato compatible (mono, 44.1kHz)
-    converted_vocals = temp_dir / "vocals_mono.wav"
-    convert_cmd = [
-        sys.executable, "convert_audio.py",
-        "--input", str(vocals_path),
-        "--output", str(converted_vocals)
-    ]
-    subprocess.run(convert_cmd, check=True, cwd=os.path.dirname(__file__))
-
-    # 4. Inferencia con So-VITS-SVC (clonación de voz)
-    cloned_vocals = temp_dir / "cloned_vocals.wav"
-    svc_script = PROJECT_ROOT / "so-vits-svc" / "inference_main.py"
-    svc_config = PROJECT_ROOT / "so-vits-svc" / "configs" / "base.yaml"
-    svc_model = PROJECT_ROOT / "models" / "model.pth"
-    svc_raw_dir = PROJECT_ROOT / "so-vits-svc" / "raw"
-    svc_results_dir = PROJECT_ROOT / "so-vits-svc" / "results"
-    svc_raw_dir.mkdir(parents=True, exist_ok=True)
-    svc_results_dir.mkdir(parents=True, exist_ok=True)
-    # Copiar el archivo convertido a so-vits-svc/raw/
-    raw_filename = converted_vocals.name
-    raw_path = svc_raw_dir / raw_filename
-    shutil.copy(str(converted_vocals), str(raw_path))
-    # Ejecutar inferencia pasando solo el nombre del archivo
-    svc_cmd = [
-        sys.executable, str(svc_script),
-        "-c", str(svc_config),
-        "-m", str(svc_model),
-        "-n", raw_filename
-    ]
-    subprocess.run(svc_cmd, check=True, cwd=str(PROJECT_ROOT / "so-vits-svc"))
-    # Buscar el archivo generado en results/
-    import glob
-    result_pattern = f"{raw_filename.split('.')[0]}*.*"
-    result_files = list(svc_results_dir.glob(result_pattern))
-    if not result_files:
-        raise FileNotFoundError(f"No se encontró el resultado de inferencia para {raw_filename}")
-    # Tomar el archivo más reciente generado
-    result_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-    svc_result = result_files[0]
-    shutil.copy(str(svc_result), str(cloned_vocals))
-
-    # 5. Mezclar voz clonada con instrumental
-    result_name = f"result_{job_id}.wav"
-    result_path = RESULTS_DIR / result_name
-    mezclar_voces_instrumental(cloned_vocals, instrumental_path, result_path)
-
-    # Limpieza opcional de temporales
-    shutil.rmtree(temp_dir)
-
-    return {"status": "processed", "result": result_name}
+    return temp_dir, input_path.resolve(), audio_hash.hexdigest()
+
+@app.post("/process/", status_code=202)
+async def process_song(file: UploadFile = File(...),
+                       speaker: str = Form(None),
+                       tran: int = Form(0),
+                       f0_predictor: str = Form("pm"),
+                       cluster_infer_ratio: float = Form(0),
+                       k_step: int = Form(None),
+                       stream_segments: bool = Form(False),
+                       allow_downgrade: bool = Form(True)):
+    """
+    Pipeline completo: recibe canción y encola la separación, conversión y clonación de voz.
+    Devuelve el id del trabajo; el estado se consulta en /jobs/{job_id} o se
+    sigue en vivo en /jobs/{job_id}/events. Con `stream_segments` la voz
+    convertida se puede escuchar tramo a tramo mientras se procesa el resto.
+    Si la misma canción ya se procesó con el mismo modelo y parámetros, el
+    resultado se sirve desde la caché sin encolar nada. Si la cola va
+    cargada el trabajo se abarata (si `allow_downgrade`) o se rechaza con 429.
+    `k_step` son los pasos de difusión superficial, si el modelo la usa.
+    """
+    if k_step is not None and k_step < 1:
+        return JSONResponse(status_code=400, content={"error": "k_step debe ser al menos 1"})
+    # 1. Guardar archivo temporal
+    try:
+        temp_dir, input_path, audio_hash = await receive_upload(file)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+
+    infer_args = resolve_infer_args(MODEL["speakers"][0], speaker=speaker, tran=tran,
+                                    f0_predictor=f0_predictor, cluster_infer_ratio=cluster_infer_ratio,
+                                    k_step=diffusion_steps(k_step))
+    cache_key = result_cache_key(audio_hash, infer_args)
+    result_name = publish_cached(cache_key)
+    if result_name is not None:
+        discard_upload(temp_dir)
+        job = jobs.complete(result_name)
+        return {"status": job.status, "job_id": job.id, "result": job.result, "cached": True}
+
+    decision, rejection = admit(input_path, infer_args, allow_downgrade=allow_downgrade)
+    if rejection is not None:
+        discard_upload(temp_dir)
+        return rejection
+    if decision.downgraded:
+        infer_args = decision.infer_args
+        cache_key = result_cache_key(audio_hash, infer_args)
+
+    try:
+        job = jobs.submit(run_pipeline, str(input_path), str(temp_dir), infer_args, cache_key, audio_hash,
+                          stream_segments=stream_segments, workdir=temp_dir, cost=decision.cost)
+    except QueueFullError as e:
+        discard_upload(temp_dir)
+        return JSONResponse(status_code=429, content={"error": str(e)})
+    # desde aquí la carpeta queda protegida por estar el trabajo sin terminar
+    janitor.release(temp_dir)
+    return {"status": job.status, "job_id": job.id, "admission": decision.to_dict()}
+
+@app.post("/process-multi/", status_code=202)
+async def process_song_multi(file: UploadFile = File(...),
+                             targets: str = Form(...),
+                             f0_predictor: str = Form("pm"),
+                             cluster_infer_ratio: float = Form(0),
+                             k_step: int = Form(None),
+                             stream_segments: bool = Form(False),
+                             allow_downgrade: bool = Form(True)):
+    """
+    Una canción, varias voces y tonos. `targets` es una lista JSON de objetos
+    {"speaker": ..., "tran": ...}. El resultado del trabajo incluye un
+    resultado por objetivo y un zip con todos ellos.
+    """
+    if k_step is not None and k_step < 1:
+        return JSONResponse(status_code=400, content={"error": "k_step debe ser al menos 1"})
+    try:
+        parsed = json.loads(targets)
+        if not isinstance(parsed, list) or not 0 < len(parsed) <= MAX_TARGETS:
+            raise ValueError(f"Se esperan entre 1 y {MAX_TARGETS} objetivos")
+        parsed = [(t.get("speaker"), int(t.get("tran", 0))) for t in parsed]
+    except (ValueError, TypeError, AttributeError) as e:
+        return JSONResponse(status_code=400, content={"error": f"targets no válido: {e}"})
+    try:
+        temp_dir, input_path, audio_hash = await receive_upload(file)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+
+    infer_args = resolve_infer_args(MODEL["speakers"][0], f0_predictor=f0_predictor,
+                                    cluster_infer_ratio=cluster_infer_ratio, k_step=diffusion_steps(k_step))
+    del infer_args["speaker"], infer_args["tran"]
+    parsed = [(speaker if speaker is not None else MODEL["speakers"][0], tran) for speaker, tran in parsed]
+    decision, rejection = admit(input_path, infer_args, n_targets=len(parsed), allow_downgrade=allow_downgrade)
+    if rejection is not None:
+        discard_upload(temp_dir)
+        return rejection
+    infer_args = decision.infer_args
+    cache_keys = [result_cache_key(audio_hash, dict(infer_args, speaker=speaker, tran=tran))
+                  for speaker, tran in parsed]
+    try:
+        job = jobs.submit(run_multi_pipeline, str(input_path), str(temp_dir), infer_args, parsed, cache_keys,
+                          audio_hash, stream_segments=stream_segments, workdir=temp_dir, cost=decision.cost)
+    except QueueFullError as e:
+        discard_upload(temp_dir)
+        return JSONResponse(status_code=429, content={"error": str(e)})
+    janitor.release(temp_dir)
+    return {"status": job.status, "job_id": job.id, "admission": decision.to_dict()}
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Métricas en formato de texto de Prometheus.
+    """
+    return Response(metrics.REGISTRY.exposition(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+def cache_stats():
+    stats = {}
+    for name, cache in CACHES.items():
+        # contados en todos los procesos, no solo en este
+        stats[name] = dict(cache.stats(),
+                           hits=metrics.CACHE_EVENTS.value(cache=name, event="hit"),
+                           misses=metrics.CACHE_EVENTS.value(cache=name, event="miss"),
+                           evictions=metrics.CACHE_EVENTS.value(cache=name, event="eviction"))
+    return stats
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Trabajo no encontrado"})
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events con el avance del trabajo: "status", "progress" por
+    etapa y por tramo, "segment" con cada tramo ya convertido y "end" con el
+    estado final. Al conectarse se reenvían los eventos anteriores.
+    """
+    if jobs.get(job_id) is None:
+        return JSONResponse(status_code=404, content={"error": "Trabajo no encontrado"})
+
+    async def stream():
+        # las consultas a SQLite bloquean: van al threadpool, no al bucle de eventos
+        sent_seq = 0
+        while not await request.is_disconnected():
+            events = await run_in_threadpool(jobs.events, job_id, sent_seq)
+            for sent_seq, event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            # tras "end" aún puede llegar algún evento (p. ej. de un worker que perdió el trabajo)
+            if any(event == "end" for _, event, _ in events):
+                return
+            # el trabajo se borró (forget_old) mientras el cliente seguía conectado
+            if not events and await run_in_threadpool(jobs.get, job_id) is None:
+                return
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/jobs/{job_id}/segments/{index}")
+def job_segment(job_id: str, index: int, request: Request, target: int = 0):
+    """
+    Voz convertida de un tramo anunciado en /jobs/{job_id}/events. Solo
+    existe mientras el trabajo está en curso; después, usar el resultado.
+    """
+    path = SEGMENTS_DIR / Path(job_id).name / f"{index}_{target}.wav"
+    if not path.exists():
+        return JSONResponse(status_code=404, content={"error": "Tramo no encontrado"})
+    return ranged_file_response(path, request.headers.get("range"), "audio/wav", path.name)
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Trabajo no encontrado"})
+    # cancelado antes de empezar: ningún worker va a limpiar su carpeta
+    if job.status == CANCELLED and job.workdir:
+        discard_upload(job.workdir)
+    return job.to_dict()
 
 # Endpoints adicionales y lógica de procesamiento se agregarán en los siguientes pasos.
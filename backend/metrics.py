@@ -0,0 +1,234 @@
+"""
+Métricas del backend en formato de texto de Prometheus: histogramas de
+duración por etapa, contadores y valores que se leen en el momento del
+scrape (profundidad de la cola, memoria del proceso...).
+"""
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Cubos pensados para etapas que van de milisegundos (un tramo) a minutos (una canción)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # etiquetas -> [cuentas por cubo (no acumuladas), suma, total]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, n + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+class GaugeCallback:
+    """
+    Gauge cuyo valor se calcula al exportar: `fn()` devuelve un número o un
+    dict {tupla de etiquetas: número}.
+    """
+    def __init__(self, name, documentation, fn, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        value = self.fn()
+        values = value if isinstance(value, dict) else {(): value}
+        for key, v in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, fn, labelnames=()):
+        return self.register(GaugeCallback(name, documentation, fn, labelnames))
+
+    def exposition(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+def process_rss_bytes(pid="self"):
+    """
+    Memoria residente actual de un proceso (por defecto, este). Fuera de
+    Linux se usa el pico de este proceso (ru_maxrss), que es lo único que
+    ofrece `resource`.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid != "self":
+            return 0
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS lo da en bytes, Linux en KiB
+        return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("vc_stage_duration_seconds",
+                                   "Duración de cada etapa del pipeline", ["stage"])
+MODEL_LOADS = REGISTRY.counter("vc_model_loads_total", "Modelos cargados en memoria", ["model"])
+MODEL_LOAD_SECONDS = REGISTRY.counter("vc_model_load_seconds_total",
+                                      "Tiempo total dedicado a cargar modelos", ["model"])
+# Aciertos, fallos y expulsiones de las cachés, ocurran en el proceso que ocurran
+CACHE_EVENTS = REGISTRY.counter("vc_cache_events_total", "Aciertos (hit), fallos (miss) y expulsiones (eviction) "
+                                "de cada caché", ["cache", "event"])
+REGISTRY.gauge("process_resident_memory_bytes", "Memoria residente del proceso en bytes", process_rss_bytes)
+
+
+# En los procesos worker las observaciones se envían por esta cola al
+# proceso de la API, que es el que expone /metrics
+_sink = None
+
+
+def forward_to(queue):
+    global _sink
+    _sink = queue
+
+
+def apply(message):
+    """
+    Registra en este proceso una observación recibida de un worker.
+    """
+    kind, name, seconds = message
+    if kind == "stage":
+        STAGE_SECONDS.observe(seconds, stage=name)
+    elif kind == "model_load":
+        MODEL_LOADS.inc(model=name)
+        MODEL_LOAD_SECONDS.inc(seconds, model=name)
+    elif kind == "cache":
+        # aquí el tercer campo es el evento, no una duración
+        CACHE_EVENTS.inc(cache=name, event=seconds)
+
+
+def _record(message):
+    if _sink is not None:
+        _sink.put(message)
+    else:
+        apply(message)
+
+
+def observe_stage(stage, seconds):
+    _record(("stage", stage, seconds))
+
+
+def cache_event(cache, event):
+    """
+    Cuenta un evento ("hit", "miss" o "eviction") de una caché. Se pasa a las
+    cachés como `on_event`, con `functools.partial(cache_event, nombre)`.
+    """
+    _record(("cache", cache, event))
+
+
+@contextmanager
+def time_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def time_model_load(model):
+    start = time.perf_counter()
+    yield
+    _record(("model_load", model, time.perf_counter() - start))
@@ -0,0 +1,150 @@
+"""
+Mezclador por bloques: lee voz e instrumental poco a poco, los suma y pasa
+la mezcla por un limitador de picos con look-ahead antes de escribirla, de
+modo que la memoria usada no depende de la duración de la canción.
+"""
+import numpy as np
+import soundfile as sf
+import soxr
+
+BLOCK_SIZE = 65536
+
+
+def iter_blocks(source, block_size=BLOCK_SIZE):
+    """
+    Bloques mono float32 de un archivo (ruta) o de un array ya en memoria.
+    """
+    if isinstance(source, np.ndarray):
+        for i in range(0, len(source), block_size):
+            yield np.asarray(source[i:i + block_size], dtype=np.float32)
+        return
+    for block in sf.blocks(str(source), blocksize=block_size, dtype="float32", always_2d=True):
+        yield block.mean(axis=1)
+
+
+def source_samplerate(source, sr=None):
+    if isinstance(source, np.ndarray):
+        if sr is None:
+            raise ValueError("Hace falta la frecuencia de muestreo para un array")
+        return sr
+    return sf.info(str(source)).samplerate
+
+
+def resample_blocks(blocks, orig_sr, target_sr):
+    """
+    Remuestrea un flujo de bloques sin discontinuidades entre ellos.
+    """
+    if orig_sr == target_sr:
+        yield from blocks
+        return
+    stream = soxr.ResampleStream(orig_sr, target_sr, 1, dtype="float32")
+    for block in blocks:
+        out = stream.resample_chunk(block)
+        if len(out):
+            yield out
+    out = stream.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+    if len(out):
+        yield out
+
+
+def zip_blocks(a, b):
+    """
+    Empareja dos flujos de bloques de tamaños distintos; termina con el más corto.
+    """
+    buf_a = buf_b = np.zeros(0, dtype=np.float32)
+    a, b = iter(a), iter(b)
+    while True:
+        if len(buf_a) == 0:
+            buf_a = next(a, None)
+            if buf_a is None:
+                return
+            continue
+        if len(buf_b) == 0:
+            buf_b = next(b, None)
+            if buf_b is None:
+                return
+            continue
+        n = min(len(buf_a), len(buf_b))
+        yield buf_a[:n], buf_b[:n]
+        buf_a, buf_b = buf_a[n:], buf_b[n:]
+
+
+class LookaheadLimiter:
+    """
+    Limitador de picos con look-ahead. La ganancia se calcula por tramos de
+    `hop` muestras: baja con antelación para que ningún pico supere `ceiling`
+    y se recupera con un release exponencial. La salida va retrasada
+    `lookahead` tramos respecto a la entrada.
+    """
+    def __init__(self, sr, ceiling=0.99, lookahead_ms=5.0, release_ms=80.0, hop=64):
+        self.ceiling = ceiling
+        self.hop = hop
+        self.lookahead = max(1, int(np.ceil(lookahead_ms / 1000 * sr / hop)))
+        self.release = np.exp(-hop / (release_ms / 1000 * sr))
+        self.gain = 1.0
+        self._buf = np.zeros(0, dtype=np.float32)
+
+    def _targets(self, x, n_frames):
+        frames = np.abs(x[:n_frames * self.hop]).reshape(n_frames, self.hop)
+        peaks = frames.max(axis=1)
+        return np.minimum(1.0, self.ceiling / np.maximum(peaks, 1e-9))
+
+    def _apply(self, n_out, targets):
+        # ganancia necesaria en cada tramo: el mínimo de los `lookahead` siguientes
+        padded = np.concatenate([targets, np.ones(self.lookahead)])
+        window = np.lib.stride_tricks.sliding_window_view(padded, self.lookahead + 1)[:n_out]
+        required = window.min(axis=1)
+        gains = np.empty(n_out + 1)
+        # al empezar el audio no hay tramo anterior en el que ir bajando: el
+        # primero ya sale con su ganancia (después, self.gain ya la cumple)
+        gains[0] = min(self.gain, targets[0])
+        for k in range(n_out):
+            released = 1.0 - (1.0 - gains[k]) * self.release
+            gains[k + 1] = min(required[k], released)
+        self.gain = gains[-1]
+        # interpolación lineal dentro de cada tramo, del valor anterior al nuevo
+        ramp = np.arange(1, self.hop + 1) / self.hop
+        curve = gains[:-1, None] + (gains[1:] - gains[:-1])[:, None] * ramp
+        out = self._buf[:n_out * self.hop] * curve.reshape(-1)
+        self._buf = self._buf[n_out * self.hop:]
+        return out.astype(np.float32)
+
+    def process(self, block):
+        self._buf = np.concatenate([self._buf, block.astype(np.float32, copy=False)])
+        n_frames = len(self._buf) // self.hop
+        n_out = n_frames - self.lookahead
+        if n_out <= 0:
+            return np.zeros(0, dtype=np.float32)
+        return self._apply(n_out, self._targets(self._buf, n_frames))
+
+    def flush(self):
+        tail = len(self._buf)
+        if tail == 0:
+            return np.zeros(0, dtype=np.float32)
+        n_frames = -(-tail // self.hop)
+        self._buf = np.concatenate([self._buf, np.zeros(n_frames * self.hop - tail, dtype=np.float32)])
+        return self._apply(n_frames, self._targets(self._buf, n_frames))[:tail]
+
+
+def mezclar_stream(voz, instrumental, output_path, voz_gain=1.0, instrumental_gain=1.0,
+                   voz_sr=None, instrumental_sr=None, block_size=BLOCK_SIZE):
+    """
+    Mezcla voz e instrumental (rutas o arrays mono) bloque a bloque y escribe
+    el resultado a la frecuencia de la voz mientras se va calculando.
+    """
+    sr = source_samplerate(voz, voz_sr)
+    inst_sr = source_samplerate(instrumental, instrumental_sr)
+    voz_blocks = iter_blocks(voz, block_size)
+    inst_blocks = resample_blocks(iter_blocks(instrumental, block_size), inst_sr, sr)
+    limiter = LookaheadLimiter(sr)
+    with sf.SoundFile(str(output_path), "w", samplerate=sr, channels=1, format="WAV") as out:
+        for v, i in zip_blocks(voz_blocks, inst_blocks):
+            out.write(limiter.process(v * voz_gain + i * instrumental_gain))
+        out.write(limiter.flush())
+
+
+def mezclar_voces_instrumental(voz_path, instrumental_path, output_path, voz_gain=1.0, instrumental_gain=1.0):
+    """
+    Mezcla la voz clonada y el instrumental, ajustando volúmenes si es necesario.
+    """
+    mezclar_stream(voz_path, instrumental_path, output_path, voz_gain, instrumental_gain)
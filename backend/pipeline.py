@@ -0,0 +1,204 @@
+"""
+Etapas del pipeline de una canción y la configuración que comparten el
+proceso de la API y los procesos worker: rutas de datos, cachés y modelos.
+Los trabajos (`run_pipeline`, `run_multi_pipeline`) se ejecutan en los
+workers, que cargan los modelos con `setup_worker`.
+"""
+import os
+import shutil
+import uuid
+import zipfile
+from functools import partial
+from pathlib import Path
+
+import soundfile as sf
+import torch
+
+import metrics
+from disk_cache import DiskCache, link_or_copy
+from mixer import mezclar_stream
+from worker import PipelineWorker, open_feature_cache
+
+# Definir la raíz absoluta del proyecto
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+# Subidas, resultados, cachés y cola de trabajos; VC_DATA_DIR la cambia de sitio
+DATA_DIR = Path(os.environ.get("VC_DATA_DIR", PROJECT_ROOT / "data"))
+UPLOAD_DIR = DATA_DIR / "uploads"
+RESULTS_DIR = DATA_DIR / "results"
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+# Tramos ya convertidos de los trabajos en curso, para escuchar antes de que acaben
+SEGMENTS_DIR = DATA_DIR / "segments"
+
+# Modelos de So-VITS-SVC y Demucs, cargados una sola vez por proceso worker
+SVC_CONFIG = PROJECT_ROOT / "so-vits-svc" / "configs" / "base.yaml"
+SVC_MODEL = PROJECT_ROOT / "models" / "model.pth"
+DEMUCS_MODEL = "htdemucs"
+
+# Caché de resultados completos: audio + modelos + parámetros -> result.wav
+CACHE_DIR = DATA_DIR / "cache"
+RESULT_CACHE_BYTES = int(os.environ.get("VC_RESULT_CACHE_MB", "2048")) * 1024 * 1024
+# Sus aciertos y fallos se cuentan en metrics.CACHE_EVENTS, que recibe los de los workers
+result_cache = DiskCache(CACHE_DIR / "results", RESULT_CACHE_BYTES, on_event=partial(metrics.cache_event, "results"))
+# Caché de pistas de Demucs (voz/instrumental mono 44.1kHz) por hash de la entrada
+STEM_CACHE_BYTES = int(os.environ.get("VC_STEM_CACHE_MB", "4096")) * 1024 * 1024
+stem_cache = DiskCache(CACHE_DIR / "stems", STEM_CACHE_BYTES, on_event=partial(metrics.cache_event, "stems"))
+# Caché de F0 y unidades de contenido por tramo, para volver a convertir con otro locutor o tran; 0 la desactiva
+FEATURE_CACHE_BYTES = int(os.environ.get("VC_FEATURE_CACHE_MB", "1024")) * 1024 * 1024
+feature_cache = (open_feature_cache(CACHE_DIR / "features", FEATURE_CACHE_BYTES,
+                                    on_event=partial(metrics.cache_event, "features"))
+                 if FEATURE_CACHE_BYTES else None)
+
+# Tramos de voz que se sintetizan en un mismo lote; con 1, uno a uno como siempre
+SLICE_BATCH_SIZE = int(os.environ.get("VC_SLICE_BATCH_SIZE", "1"))
+# Tramos que se preparan por adelantado (F0 y contenido) mientras se sintetiza el actual; con 0, el valor
+# por defecto, no se prepara ninguno
+SLICE_PREFETCH = int(os.environ.get("VC_SLICE_PREFETCH", "0"))
+# F0, contenido y volumen de toda la pista de una vez en lugar de tramo a tramo (con 1)
+WHOLE_TRACK_FEATURES = os.environ.get("VC_WHOLE_TRACK_FEATURES", "0") == "1"
+# So-VITS-SVC compilado con torch.compile (con 1): más rápido en CPU, pero el primer arranque tarda minutos
+COMPILE_SVC = os.environ.get("VC_COMPILE_SVC", "0") == "1"
+
+worker = PipelineWorker(SVC_MODEL, SVC_CONFIG, demucs_model=DEMUCS_MODEL, stem_cache=stem_cache,
+                        feature_cache=feature_cache, batch_size=SLICE_BATCH_SIZE, prefetch=SLICE_PREFETCH,
+                        whole_track_features=WHOLE_TRACK_FEATURES,
+                        compiled=COMPILE_SVC, compile_cache_dir=CACHE_DIR / "compiled")
+
+
+def setup_worker(store, torch_threads):
+    """
+    Arranque de cada proceso worker: fija su parte de los hilos de torch,
+    carga los modelos y publica su descripción para la API.
+    """
+    torch.set_num_threads(torch_threads)
+    worker.load()
+    store.set_meta("model", worker.describe())
+
+
+def publish_cached(cache_key):
+    """
+    Si el resultado ya está en la caché lo publica en RESULTS_DIR con un
+    nombre nuevo y lo devuelve; si no, devuelve None.
+    """
+    entry = result_cache.get(cache_key)
+    if entry is None:
+        return None
+    result_name = f"result_{uuid.uuid4()}.wav"
+    try:
+        link_or_copy(entry / "result.wav", RESULTS_DIR / result_name)
+    except FileNotFoundError:
+        # expulsada entre get() y la copia
+        return None
+    return result_name
+
+
+def discard_job_files(job, temp_dir):
+    """
+    Borra la carpeta temporal de la subida y los tramos de un trabajo, salvo
+    si el trabajo ya ha pasado a otro worker, que los está usando.
+    """
+    if not job.owned():
+        return
+    for path in (Path(temp_dir), SEGMENTS_DIR / job.id):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def segment_writer(job, target_ids):
+    """
+    Callback para `worker.run(on_segment=...)`: guarda cada tramo de voz ya
+    convertida en SEGMENTS_DIR/<job>/ y lo anuncia como evento "segment" del
+    trabajo. `target_ids` da el índice de objetivo de cada audio del tramo.
+    """
+    job_dir = SEGMENTS_DIR / job.id
+    job_dir.mkdir(parents=True, exist_ok=True)
+    position = 0
+
+    def on_segment(index, total, audios):
+        nonlocal position
+        sr = worker.svc.target_sample
+        for target, audio in zip(target_ids, audios):
+            sf.write(str(job_dir / f"{index}_{target}.wav"), audio, sr)
+        job.publish("segment", {
+            "index": index,
+            "total": total,
+            "start": position / sr,
+            "duration": len(audios[0]) / sr,
+            "urls": {target: f"/jobs/{job.id}/segments/{index}?target={target}" for target in target_ids},
+        })
+        position += len(audios[0])
+
+    return on_segment
+
+
+def run_pipeline(job, input_path, temp_dir, infer_args, cache_key, audio_hash, stream_segments=False):
+    """
+    Separa voz, convierte, clona voz y mezcla. Se ejecuta en un proceso worker.
+    Las pistas pasan de una etapa a otra en memoria; solo se escribe el resultado.
+    Con `stream_segments` la voz convertida se publica también tramo a tramo.
+    """
+    # 2-4. Separar (Demucs), convertir a mono 44.1kHz y clonar la voz (So-VITS-SVC)
+    # con los modelos ya cargados en el worker
+    try:
+        on_segment = segment_writer(job, [0]) if stream_segments else None
+        cloned, sr, instrumental, instrumental_sr = worker.run(input_path, temp_dir, progress=job.update,
+                                                               audio_hash=audio_hash, on_segment=on_segment,
+                                                               **infer_args)
+
+        # 5. Mezclar voz clonada con instrumental
+        job.update("mixing", 0.0)
+        result_name = f"result_{job.id}.wav"
+        result_path = RESULTS_DIR / result_name
+        with metrics.time_stage("mixing"):
+            mezclar_stream(cloned, instrumental, result_path, voz_sr=sr, instrumental_sr=instrumental_sr)
+        job.update("mixing", 1.0)
+        result_cache.put(cache_key, {"result.wav": result_path})
+    finally:
+        # Limpieza de temporales también si falla o se cancela
+        discard_job_files(job, temp_dir)
+
+    return result_name
+
+
+def run_multi_pipeline(job, input_path, temp_dir, infer_args, targets, cache_keys, audio_hash,
+                       stream_segments=False):
+    """
+    Como run_pipeline pero para varios (locutor, tran) sobre la misma canción:
+    la separación, el troceado, la F0 y el codificador de contenido se hacen
+    una vez y solo la síntesis y la mezcla se repiten por objetivo. Los
+    objetivos que ya están en la caché no se recalculan. Devuelve la lista de
+    resultados y un zip con todos ellos.
+    """
+    try:
+        results = [publish_cached(key) for key in cache_keys]
+        pending = [i for i, name in enumerate(results) if name is None]
+        if pending:
+            on_segment = segment_writer(job, pending) if stream_segments else None
+            cloned, sr, instrumental, instrumental_sr = worker.run_multi(input_path, temp_dir,
+                                                                         [targets[i] for i in pending],
+                                                                         progress=job.update,
+                                                                         audio_hash=audio_hash,
+                                                                         on_segment=on_segment, **infer_args)
+            job.update("mixing", 0.0)
+            for n, (i, voz) in enumerate(zip(pending, cloned)):
+                result_name = f"result_{job.id}_{i}.wav"
+                result_path = RESULTS_DIR / result_name
+                with metrics.time_stage("mixing"):
+                    mezclar_stream(voz, instrumental, result_path, voz_sr=sr, instrumental_sr=instrumental_sr)
+                result_cache.put(cache_keys[i], {"result.wav": result_path})
+                results[i] = result_name
+                job.update("mixing", (n + 1) / len(pending))
+
+        job.update("bundle", 0.0)
+        bundle_name = f"bundle_{job.id}.zip"
+        with zipfile.ZipFile(RESULTS_DIR / bundle_name, "w") as bundle:
+            for (speaker, tran), result_name in zip(targets, results):
+                bundle.write(RESULTS_DIR / result_name, arcname=f"{speaker}_{tran:+d}.wav")
+        job.update("bundle", 1.0)
+    finally:
+        discard_job_files(job, temp_dir)
+
+    return {
+        "results": [{"speaker": speaker, "tran": tran, "result": result_name}
+                    for (speaker, tran), result_name in zip(targets, results)],
+        "bundle": bundle_name,
+    }
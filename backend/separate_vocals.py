@@ -3,6 +3,7 @@ import subprocess
 from pathlib import Path
 import argparse
 import librosa
+import numpy as np
 import soundfile as sf
 import os
 import shutil
@@ -65,6 +66,71 @@ def separate_and_convert(input_audio, vocals_path, instrumental_path, sr=44100,
         except Exception as e:
             print(f"[WARN] No se pudo eliminar {instrumental_path}: {e}")
 
+def load_demucs_model(name="htdemucs", device=None):
+    """
+    Carga el modelo de Demucs una sola vez para reutilizarlo en el mismo proceso.
+    """
+    import torch
+    from demucs.pretrained import get_model
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = get_model(name)
+    model.to(device)
+    model.eval()
+    print(f"[INFO] Modelo Demucs '{name}' cargado en {device}.")
+    return model
+
+def demucs_signature(model, name):
+    """
+    Identifica el modelo de separación (nombre, versión de Demucs y pesos) para
+    invalidar las pistas cacheadas cuando cambie.
+    """
+    import hashlib
+    import demucs
+    h = hashlib.sha256()
+    h.update(f"{name}|{getattr(demucs, '__version__', '')}".encode("utf-8"))
+    for k, v in sorted(model.state_dict().items()):
+        h.update(k.encode("utf-8"))
+        h.update(v.detach().cpu().contiguous().numpy().tobytes())
+    return h.hexdigest()
+
+def separate_to_arrays(model, input_audio, sr=44100, device="cpu"):
+    """
+    Separa con un modelo ya cargado, sin lanzar un proceso nuevo de Demucs.
+    Devuelve (voz, instrumental) como arrays mono float32 a `sr`.
+    """
+    import torch
+    from demucs.apply import apply_model
+    wav, _ = librosa.load(input_audio, sr=model.samplerate, mono=False)
+    if wav.ndim == 1:
+        wav = np.stack([wav] * model.audio_channels)
+    wav = torch.from_numpy(wav[:model.audio_channels]).float()
+    # Misma normalización que usa `python -m demucs`
+    ref = wav.mean(0)
+    wav = (wav - ref.mean()) / ref.std()
+    with torch.no_grad():
+        sources = apply_model(model, wav[None], device=device, split=True, overlap=0.25, progress=False)[0]
+    sources = sources * ref.std() + ref.mean()
+    vocals_idx = model.sources.index("vocals")
+    vocals = sources[vocals_idx]
+    instrumental = sources.sum(0) - vocals
+    stems = []
+    for stem in (vocals, instrumental):
+        y = librosa.to_mono(stem.cpu().numpy())
+        if model.samplerate != sr:
+            y = librosa.resample(y, orig_sr=model.samplerate, target_sr=sr)
+        stems.append(y.astype(np.float32, copy=False))
+    return stems[0], stems[1]
+
+def separate_in_process(model, input_audio, vocals_path, instrumental_path, sr=44100, device="cpu"):
+    """
+    Igual que separate_and_convert pero con un modelo ya cargado: escribe
+    directamente voz e instrumental en wav mono.
+    """
+    vocals, instrumental = separate_to_arrays(model, input_audio, sr=sr, device=device)
+    sf.write(vocals_path, vocals, sr)
+    sf.write(instrumental_path, instrumental, sr)
+
 def process_folder(input_folder, output_folder, sr=44100, keep_instrumental=False):
     input_folder = Path(input_folder)
     output_folder = Path(output_folder)
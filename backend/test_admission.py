@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from admission import CHEAP_K_STEP, AdmissionController, estimate_cost
+
+
+def test_admits_as_is_when_it_fits():
+    admission = AdmissionController(workers=1, slo_seconds=100, shallow_diffusion=True)
+    decision = admission.decide(60, {"f0_predictor": "rmvpe", "k_step": 100}, backlog=10)
+    assert decision.admitted and not decision.downgraded
+    assert decision.cost == pytest.approx(estimate_cost(60, "rmvpe", shallow_diffusion=True, k_step=100))
+
+
+def test_downgrades_f0_first_then_diffusion_steps():
+    admission = AdmissionController(workers=2, slo_seconds=40, shallow_diffusion=True)
+    args = {"f0_predictor": "crepe", "k_step": 100}
+    # 60 s de audio: con crepe y 100 pasos son 58.8 s, con pm 29.1 s y con 20 pasos 9.9 s
+    decision = admission.decide(60, args, backlog=20)
+    assert decision.admitted
+    assert decision.infer_args == {"f0_predictor": "pm", "k_step": 100}
+    decision = admission.decide(60, args, backlog=40)
+    assert decision.admitted
+    assert decision.infer_args == {"f0_predictor": "pm", "k_step": CHEAP_K_STEP}
+    assert decision.downgraded == {"f0_predictor": ("crepe", "pm"), "k_step": (100, CHEAP_K_STEP)}
+    assert args == {"f0_predictor": "crepe", "k_step": 100}
+
+
+def test_diffusion_steps_are_left_alone_without_shallow_diffusion():
+    admission = AdmissionController(workers=1, slo_seconds=10)
+    decision = admission.decide(60, {"f0_predictor": "pm", "k_step": 100}, backlog=5)
+    assert not decision.admitted
+    assert decision.infer_args["k_step"] == 100
+
+
+def test_rejects_only_with_a_backlog():
+    admission = AdmissionController(workers=1, slo_seconds=10)
+    assert not admission.decide(600, {"f0_predictor": "crepe"}, backlog=1).admitted
+    # con la cola vacía esperar no lo abarataría: se admite con lo más barato
+    decision = admission.decide(600, {"f0_predictor": "crepe"}, backlog=0, allow_downgrade=True)
+    assert decision.admitted and decision.infer_args["f0_predictor"] == "pm"
+    assert not admission.decide(600, {"f0_predictor": "crepe"}, backlog=1, allow_downgrade=False).admitted
+
+
+def test_observe_calibrates_towards_the_real_duration():
+    admission = AdmissionController(workers=1, slo_seconds=100)
+    base = admission.cost(60, {"f0_predictor": "pm"})
+    for _ in range(50):
+        admission.observe(admission.cost(60, {"f0_predictor": "pm"}), 2 * base)
+    assert admission.calibration == pytest.approx(2, rel=1e-3)
+    assert admission.cost(60, {"f0_predictor": "pm"}) == pytest.approx(2 * base, rel=1e-3)
+    # trabajos sin estimación o sin duración no cuentan
+    admission.observe(0, 10)
+    admission.observe(10, 0)
+    assert admission.calibration == pytest.approx(2, rel=1e-3)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    # la API sin arrancar el worker: el modelo ya cargado y los trabajos encolados se guardan en `submitted`
+    main = pytest.importorskip("main")
+    from fastapi.testclient import TestClient
+
+    for key, value in {"speakers": ["a"], "fingerprint": "modelo", "shallow_diffusion": True,
+                       "enhancer": False}.items():
+        monkeypatch.setitem(main.MODEL, key, value)
+    monkeypatch.setattr(main.admission, "workers", 1)
+    monkeypatch.setattr(main.admission, "shallow_diffusion", True)
+    monkeypatch.setattr(main.admission, "slo_seconds", 6)
+    monkeypatch.setattr(main.admission, "calibration", 1.0)
+    monkeypatch.setattr(main.jobs, "collect_finished", lambda: [])
+    state = SimpleNamespace(main=main, client=TestClient(main.app), submitted=[], backlog=0)
+    monkeypatch.setattr(main.jobs, "backlog", lambda: state.backlog)
+
+    def submit(fn, *args, **kwargs):
+        state.submitted.append(args)
+        return SimpleNamespace(status="queued", id=f"job{len(state.submitted)}")
+
+    monkeypatch.setattr(main.jobs, "submit", submit)
+    return state
+
+
+def post_song(api, tmp_path, backlog, **form):
+    # 10 s de audio: con 100 pasos de difusión cuesta 4.85 s, con 20 pasos 1.65 s
+    path = tmp_path / "song.wav"
+    sf.write(str(path), np.zeros(44100 * 10, dtype=np.float32), 44100)
+    api.backlog = backlog
+    with open(path, "rb") as f:
+        return api.client.post("/process/", files={"file": ("song.wav", f, "audio/wav")},
+                               data={key: str(value) for key, value in form.items()})
+
+
+def test_process_downgrades_the_diffusion_steps(api, tmp_path):
+    response = post_song(api, tmp_path, backlog=3, k_step=100)
+    assert response.status_code == 202
+    assert response.json()["admission"]["downgraded"] == {"k_step": {"requested": 100, "used": CHEAP_K_STEP}}
+    infer_args = api.submitted[0][2]
+    assert infer_args["k_step"] == CHEAP_K_STEP
+
+
+def test_process_rejects_with_429_without_downgrade(api, tmp_path):
+    response = post_song(api, tmp_path, backlog=3, k_step=100, allow_downgrade="false")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert not api.submitted
+
+
+def test_process_rejects_invalid_k_step(api, tmp_path):
+    assert post_song(api, tmp_path, backlog=0, k_step=0).status_code == 400
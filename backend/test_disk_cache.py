@@ -0,0 +1,74 @@
+import os
+import time
+
+from disk_cache import DiskCache, fingerprint_file, make_key
+
+
+def source(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"\0" * size)
+    return path
+
+
+def age(cache, key, seconds):
+    stamp = time.time() - seconds
+    os.utime(cache.root / key, (stamp, stamp))
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    cache = DiskCache(tmp_path / "cache", 25)
+    cache.put("a", {"x.wav": source(tmp_path, "a.wav", 10)})
+    cache.put("b", {"x.wav": source(tmp_path, "b.wav", 10)})
+    age(cache, "a", 30)
+    age(cache, "b", 20)
+    # leer "a" la hace la más reciente: al llenarse sale "b"
+    assert cache.get("a") is not None
+    cache.put("c", {"x.wav": source(tmp_path, "c.wav", 10)})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 20 and stats["evictions"] == 1
+
+
+def test_put_links_or_copies_and_keeps_the_originals(tmp_path):
+    cache = DiskCache(tmp_path / "cache", 1000)
+    vocals = source(tmp_path, "vocals.wav", 10)
+    entry = cache.put("stems", {"vocals.wav": vocals, "instrumental.wav": source(tmp_path, "inst.wav", 5)})
+    assert vocals.exists()
+    assert sorted(p.name for p in entry.iterdir()) == ["instrumental.wav", "vocals.wav"]
+    # volver a guardar la misma clave la sustituye
+    cache.put("stems", {"vocals.wav": source(tmp_path, "otra.wav", 3)})
+    assert [p.name for p in cache.get("stems").iterdir()] == ["vocals.wav"]
+    assert cache.stats()["bytes"] == 3
+
+
+def test_entries_are_shared_between_processes(tmp_path):
+    # dos objetos sobre la misma carpeta, como la API y un worker
+    first = DiskCache(tmp_path / "cache", 25)
+    second = DiskCache(tmp_path / "cache", 25)
+    first.put("a", {"x.wav": source(tmp_path, "a.wav", 10)})
+    assert second.get("a") is not None
+    age(first, "a", 10)
+    second.put("b", {"x.wav": source(tmp_path, "b.wav", 10)})
+    second.put("c", {"x.wav": source(tmp_path, "c.wav", 10)})
+    assert first.get("a") is None
+    assert first.stats()["entries"] == 2
+
+
+def test_stale_partial_writes_are_removed_on_open(tmp_path):
+    root = tmp_path / "cache"
+    stale, fresh = root / ".viejo", root / ".reciente"
+    stale.mkdir(parents=True)
+    fresh.mkdir()
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+    DiskCache(root, 1000)
+    assert not stale.exists() and fresh.exists()
+
+
+def test_keys_and_fingerprints(tmp_path):
+    assert make_key("a", "bc") != make_key("ab", "c")
+    checkpoint = source(tmp_path, "G.pth", 10)
+    before = fingerprint_file(checkpoint)
+    assert fingerprint_file(checkpoint) == before
+    checkpoint.write_bytes(b"\1" * 11)
+    assert fingerprint_file(checkpoint) != before
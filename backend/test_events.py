@@ -0,0 +1,76 @@
+import json
+import threading
+import time
+
+import pytest
+
+main = pytest.importorskip("main")
+from fastapi.testclient import TestClient  # noqa: E402
+
+from job_store import DONE  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "EVENTS_POLL_SECONDS", 0.05)
+    return TestClient(main.app)
+
+
+def read_events(client, job_id, timeout=10):
+    # (evento, datos) hasta que el servidor cierra el stream
+    events, event = [], None
+    deadline = time.time() + timeout
+    with client.stream("GET", f"/jobs/{job_id}/events") as response:
+        assert response.status_code == 200
+        for line in response.iter_lines():
+            assert time.time() < deadline, "el stream no termina"
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+def later(seconds, fn):
+    thread = threading.Timer(seconds, fn)
+    thread.start()
+    return thread
+
+
+def test_finished_job_replays_its_events_and_ends(client):
+    job = main.jobs.complete("result_x.wav")
+    events = read_events(client, job.id)
+    assert [event for event, _ in events] == ["end"]
+    assert events[0][1]["result"] == "result_x.wav"
+
+
+def test_stream_follows_a_running_job_to_its_end(client):
+    store = main.jobs.store
+    store.insert("en-curso", "modulo.funcion", [], {})
+    job = main.jobs.get("en-curso")
+    store.claim("w1", 60)
+
+    def work():
+        worker_job = main.jobs.get("en-curso")
+        worker_job.update("conversion", 0.5)
+        store.finish("en-curso", "w1", DONE, result="r.wav")
+
+    timer = later(0.3, work)
+    events = read_events(client, job.id)
+    timer.join()
+    assert [event for event, _ in events] == ["progress", "end"]
+    assert events[-1][1]["status"] == DONE
+
+
+def test_stream_ends_when_the_job_is_forgotten(client):
+    store = main.jobs.store
+    store.insert("olvidado", "modulo.funcion", [], {})
+    store.publish("olvidado", "status", {"status": "queued"})
+    timer = later(0.3, lambda: store._execute("DELETE FROM jobs WHERE id = ?", ("olvidado",)))
+    events = read_events(client, "olvidado")
+    timer.join()
+    assert [event for event, _ in events] == ["status"]
+
+
+def test_unknown_job_is_404(client):
+    assert client.get("/jobs/no-existe/events").status_code == 404
@@ -0,0 +1,60 @@
+import os
+import time
+
+from janitor import DiskJanitor
+
+
+def write(path, size, age=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    os.utime(path.parent, (stamp, stamp))
+    return path
+
+
+def test_reclaim_orphans_keeps_recent_and_unfinished_job_folders(tmp_path):
+    janitor = DiskJanitor()
+    janitor.add_area("uploads", tmp_path / "uploads", 10 ** 9)
+    janitor.add_area("results", tmp_path / "results", 10 ** 9)
+    old = write(tmp_path / "uploads" / "abandonada" / "song.wav", 100, age=7200).parent
+    # una subida de otro proceso de la API que aún no es trabajo
+    recent = write(tmp_path / "uploads" / "en_curso" / "song.wav", 100).parent
+    queued = write(tmp_path / "uploads" / "en_cola" / "song.wav", 100, age=7200).parent
+    janitor.in_use = lambda: [queued]
+    partial = write(tmp_path / "results" / "result_x.wav.part", 50, age=7200)
+    result = write(tmp_path / "results" / "result_y.wav", 50, age=7200)
+
+    assert janitor.reclaim_orphans({"uploads"}, grace_seconds=3600) == 150
+    assert not old.exists() and not partial.exists()
+    assert recent.exists() and queued.exists() and result.exists()
+
+
+def test_reclaim_orphans_looks_at_the_newest_file_inside(tmp_path):
+    janitor = DiskJanitor()
+    janitor.add_area("segments", tmp_path / "segments", 10 ** 9)
+    job_dir = write(tmp_path / "segments" / "job" / "0.wav", 10, age=7200).parent
+    # escribir en un archivo que ya existía no cambia el mtime de la carpeta
+    (job_dir / "1.wav").write_bytes(b"\0" * 10)
+    os.utime(job_dir, (time.time() - 7200, time.time() - 7200))
+    assert janitor.reclaim_orphans({"segments"}, grace_seconds=3600) == 0
+    assert job_dir.exists()
+
+
+def test_sweep_removes_least_recently_used_over_quota(tmp_path):
+    janitor = DiskJanitor()
+    janitor.add_area("results", tmp_path, 250)
+    oldest = write(tmp_path / "a.wav", 100, age=300)
+    protected = write(tmp_path / "b.wav", 100, age=200)
+    newest = write(tmp_path / "c.wav", 100, age=100)
+    janitor.protect(protected)
+
+    assert janitor.sweep() == 100
+    assert not oldest.exists()
+    assert protected.exists() and newest.exists()
+    assert janitor.usage["results"] == 200
+
+    janitor.release(protected)
+    janitor.areas["results"] = (tmp_path, 150)
+    assert janitor.sweep() == 100
+    assert not protected.exists() and newest.exists()
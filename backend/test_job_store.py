@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+from job_store import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobStore
+from jobs import Job, JobCancelled, JobLost, JobManager, _heartbeat
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(tmp_path / "jobs.sqlite3")
+
+
+def queue_job(store, job_id, cost=1.0):
+    assert store.insert(job_id, "modulo.funcion", [], {}, cost=cost)
+
+
+def test_claims_oldest_queued_job_first(store):
+    queue_job(store, "a")
+    queue_job(store, "b")
+    assert store.claim("w1", 60)["id"] == "a"
+    assert store.claim("w2", 60)["id"] == "b"
+    assert store.claim("w3", 60) is None
+    row = store.get("a")
+    assert row["status"] == RUNNING and row["worker"] == "w1" and row["attempts"] == 1
+
+
+def test_queue_limit(store):
+    assert store.insert("a", "modulo.funcion", [], {}, max_queued=1)
+    assert not store.insert("b", "modulo.funcion", [], {}, max_queued=1)
+    assert store.get("b") is None
+
+
+def test_expired_lease_goes_back_to_the_queue_until_attempts_run_out(store):
+    queue_job(store, "a")
+    store.claim("w1", -1)
+    assert store.requeue_expired(max_attempts=2, reason="caducó") == ["a"]
+    assert store.get("a")["status"] == QUEUED
+    store.claim("w2", -1)
+    store.requeue_expired(max_attempts=2, reason="caducó")
+    row = store.get("a")
+    assert row["status"] == FAILED and row["error"] == "caducó"
+    assert [event for _, event, _ in store.events("a")] == ["status", "end"]
+
+
+def test_live_leases_are_not_requeued(store):
+    queue_job(store, "a")
+    store.claim("w1", 60)
+    assert store.requeue_expired(max_attempts=3, reason="caducó") == []
+    assert store.get("a")["status"] == RUNNING
+
+
+def test_requeue_of_a_cancelled_job_cancels_it(store):
+    queue_job(store, "a")
+    store.claim("w1", 60)
+    assert store.request_cancel("a") is False
+    assert store.requeue_worker("w1", max_attempts=3, reason="murió") == ["a"]
+    assert store.get("a")["status"] == CANCELLED
+
+
+def test_writes_from_a_worker_that_lost_the_lease_are_ignored(store):
+    queue_job(store, "a")
+    job = Job(store, store.claim("w1", -1))
+    store.requeue_expired(max_attempts=3, reason="caducó")
+    store.claim("w2", 60)
+
+    assert not store.renew("a", "w1", 60)
+    assert not job.owned()
+    with pytest.raises(JobLost):
+        job.update("conversion", 0.5)
+    assert not store.finish("a", "w1", DONE, result="viejo.wav")
+    row = store.get("a")
+    assert row["status"] == RUNNING and row["worker"] == "w2" and row["stage"] is None
+
+    assert store.finish("a", "w2", DONE, result="nuevo.wav")
+    assert JobStore.to_dict(store.get("a"))["result"] == "nuevo.wav"
+
+
+def test_update_reports_cancellation(store):
+    queue_job(store, "a")
+    job = Job(store, store.claim("w1", 60))
+    job.update("separation", 0.5)
+    store.request_cancel("a")
+    with pytest.raises(JobCancelled):
+        job.update("separation", 1.0)
+
+
+def test_heartbeat_keeps_the_lease_alive(store):
+    queue_job(store, "a")
+    store.claim("w1", 0.3)
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(store, "a", "w1", 0.3, stop))
+    beat.start()
+    time.sleep(1)
+    assert store.requeue_expired(max_attempts=3, reason="caducó") == []
+    stop.set()
+    beat.join()
+    time.sleep(0.4)
+    assert store.requeue_expired(max_attempts=3, reason="caducó") == ["a"]
+
+
+def test_heartbeat_stops_when_the_lease_is_lost(store):
+    queue_job(store, "a")
+    store.claim("w1", -1)
+    store.requeue_expired(max_attempts=3, reason="caducó")
+    beat = threading.Thread(target=_heartbeat, args=(store, "a", "w1", 0.3, threading.Event()), daemon=True)
+    beat.start()
+    beat.join(2)
+    assert not beat.is_alive()
+
+
+def test_start_leaves_jobs_of_other_api_processes_alone(tmp_path):
+    # otro proceso de la API con un worker vivo y un trabajo en curso
+    other = JobStore(tmp_path / "jobs.sqlite3")
+    queue_job(other, "suyo")
+    other.claim("worker-de-otro", 60)
+    other.set_meta("model", {"speakers": ["viejo"]})
+
+    manager = JobManager(tmp_path / "jobs.sqlite3", max_workers=0, poll_seconds=0.05)
+    manager.start()
+    assert manager.store.get("suyo")["status"] == RUNNING
+    # lo publicado antes de arrancar es de otro pool
+    with pytest.raises(TimeoutError):
+        manager.wait_meta("model", timeout=0.2)
+    other.set_meta("model", {"speakers": ["nuevo"]})
+    assert manager.wait_meta("model", timeout=1) == {"speakers": ["nuevo"]}
+
+
+def test_backlog_and_calibration_samples(tmp_path):
+    manager = JobManager(tmp_path / "jobs.sqlite3")
+    queue_job(manager.store, "a", cost=10)
+    queue_job(manager.store, "b", cost=4)
+    assert manager.backlog() == pytest.approx(14)
+    manager.store.claim("w1", 60)
+    manager.store.finish("a", "w1", DONE, result="a.wav")
+    assert manager.backlog() == pytest.approx(4)
+    [(cost, seconds)] = manager.collect_finished()
+    assert cost == 10 and seconds >= 0
+    assert manager.collect_finished() == []
@@ -0,0 +1,95 @@
+import multiprocessing
+from functools import partial
+
+import pytest
+
+import metrics
+from disk_cache import DiskCache
+
+
+def _worker_lookups(root, queue):
+    # como un proceso worker: las observaciones van por la cola de métricas
+    metrics.forward_to(queue)
+    cache = DiskCache(root, 1024, on_event=partial(metrics.cache_event, "results"))
+    cache.get("falta")
+    cache.get("guardada")
+    cache.get("guardada")
+
+
+def test_cache_events_from_a_worker_reach_the_api_process(tmp_path):
+    api_cache = DiskCache(tmp_path, 1024)
+    entry = tmp_path / "entrada.wav"
+    entry.write_bytes(b"\0" * 10)
+    api_cache.put("guardada", {"result.wav": entry})
+    before = {event: metrics.CACHE_EVENTS.value(cache="results", event=event) for event in ("hit", "miss")}
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_worker_lookups, args=(str(tmp_path), queue))
+    proc.start()
+    proc.join(60)
+    assert proc.exitcode == 0
+    for _ in range(3):
+        metrics.apply(queue.get(timeout=10))
+
+    assert metrics.CACHE_EVENTS.value(cache="results", event="hit") == before["hit"] + 2
+    assert metrics.CACHE_EVENTS.value(cache="results", event="miss") == before["miss"] + 1
+    # los contadores del objeto de este proceso no ven las búsquedas del worker
+    assert api_cache.stats()["hits"] == 0
+    assert 'vc_cache_events_total{cache="results",event="hit"}' in metrics.REGISTRY.exposition()
+
+
+def test_evictions_are_reported(tmp_path):
+    events = []
+    cache = DiskCache(tmp_path / "cache", 25, on_event=events.append)
+    for i in range(3):
+        path = tmp_path / f"{i}.wav"
+        path.write_bytes(b"\0" * 10)
+        cache.put(f"clave{i}", {"a.wav": path})
+    assert events == ["eviction"]
+    assert cache.get("clave0") is None
+    assert events == ["eviction", "miss"]
+
+
+def test_histogram_exposition_is_cumulative():
+    histogram = metrics.Histogram("vc_prueba_seconds", "Prueba", ["stage"], buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(seconds, stage="conversion")
+    assert histogram.collect() == [
+        "# HELP vc_prueba_seconds Prueba",
+        "# TYPE vc_prueba_seconds histogram",
+        'vc_prueba_seconds_bucket{stage="conversion",le="0.1"} 1',
+        'vc_prueba_seconds_bucket{stage="conversion",le="1.0"} 3',
+        'vc_prueba_seconds_bucket{stage="conversion",le="+Inf"} 4',
+        'vc_prueba_seconds_sum{stage="conversion"} 4.25',
+        'vc_prueba_seconds_count{stage="conversion"} 4',
+    ]
+
+
+def test_labels_are_escaped_and_gauges_read_at_scrape():
+    counter = metrics.Counter("vc_prueba_total", "Prueba", ["model"])
+    counter.inc(model='voz "a"\\b')
+    assert counter.collect()[-1] == 'vc_prueba_total{model="voz \\"a\\"\\\\b"} 1'
+    depth = [3]
+    gauge = metrics.GaugeCallback("vc_cola", "Prueba", lambda: {("w1",): depth[0]}, ["worker"])
+    depth[0] = 5
+    assert gauge.collect()[-1] == 'vc_cola{worker="w1"} 5'
+
+
+def test_time_stage_observes_in_this_process_without_a_sink():
+    before = metrics.STAGE_SECONDS.collect()
+    with pytest.raises(RuntimeError):
+        with metrics.time_stage("prueba"):
+            raise RuntimeError("la etapa falla")
+    after = metrics.STAGE_SECONDS.collect()
+    assert 'vc_stage_duration_seconds_count{stage="prueba"} 1' in after
+    assert len(after) > len(before)
+
+
+def test_metrics_endpoint():
+    main = pytest.importorskip("main")
+    from fastapi.testclient import TestClient
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert "# TYPE process_resident_memory_bytes gauge" in response.text
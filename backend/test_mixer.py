@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from mixer import LookaheadLimiter, mezclar_stream, resample_blocks, zip_blocks
+
+
+def limit(signal, sr, block_size):
+    limiter = LookaheadLimiter(sr)
+    out = [limiter.process(signal[i:i + block_size]) for i in range(0, len(signal), block_size)]
+    return np.concatenate(out + [limiter.flush()])
+
+
+def loud_song(sr=44100, seconds=3):
+    rng = np.random.default_rng(0)
+    t = np.arange(sr * seconds) / sr
+    signal = 0.6 * np.sin(2 * np.pi * 220 * t) + 0.1 * rng.standard_normal(len(t))
+    # golpes de 2.5x el techo cada 0.5 s, el primero en la primera muestra
+    signal[::sr // 2] = 2.5
+    return signal.astype(np.float32)
+
+
+def test_limiter_keeps_peaks_under_the_ceiling():
+    signal = loud_song()
+    out = limit(signal, 44100, 4096)
+    assert len(out) == len(signal)
+    assert np.abs(out).max() <= 0.99 + 1e-6
+    # fuera de los golpes el nivel apenas cambia
+    quiet = slice(44100 // 4, 44100 // 2 - 2000)
+    assert np.abs(out[quiet] - signal[quiet]).max() < 0.05
+
+
+def test_limiter_leaves_quiet_audio_untouched():
+    signal = (0.5 * np.sin(np.arange(20000) / 10)).astype(np.float32)
+    np.testing.assert_array_equal(limit(signal, 44100, 3000), signal)
+
+
+@pytest.mark.parametrize("block_size", [1, 100, 4097, 65536])
+def test_limiter_output_does_not_depend_on_block_size(block_size):
+    signal = loud_song(seconds=1)
+    np.testing.assert_allclose(limit(signal, 44100, block_size), limit(signal, 44100, len(signal)), atol=1e-6)
+
+
+def test_zip_blocks_pairs_streams_of_different_block_sizes():
+    a = [np.arange(0, 5), np.arange(5, 12)]
+    b = [np.arange(0, 3), np.arange(3, 6), np.arange(6, 10)]
+    pairs = list(zip_blocks(a, b))
+    np.testing.assert_array_equal(np.concatenate([x for x, _ in pairs]), np.arange(10))
+    assert all(np.array_equal(x, y) for x, y in pairs)
+
+
+def test_resample_blocks_matches_the_whole_signal():
+    t = np.arange(22050) / 22050
+    signal = np.sin(2 * np.pi * 100 * t).astype(np.float32)
+    blocks = [signal[i:i + 1000] for i in range(0, len(signal), 1000)]
+    out = np.concatenate(list(resample_blocks(blocks, 22050, 44100)))
+    assert len(out) == 44100
+    expected = np.sin(2 * np.pi * 100 * np.arange(44100) / 44100)
+    assert np.abs(out[1000:-1000] - expected[1000:-1000]).max() < 1e-3
+
+
+def test_mezclar_stream_mixes_arrays_and_files(tmp_path):
+    voz = (0.4 * np.sin(np.arange(44100 * 2) / 20)).astype(np.float32)
+    instrumental = (0.4 * np.sin(np.arange(22050 * 3) / 7)).astype(np.float32)
+    sf.write(str(tmp_path / "inst.wav"), np.stack([instrumental, instrumental], axis=1), 22050)
+
+    mezclar_stream(voz, tmp_path / "inst.wav", tmp_path / "desde_archivo.wav", voz_sr=44100, block_size=5000)
+    mezclar_stream(voz, instrumental, tmp_path / "desde_array.wav", voz_sr=44100, instrumental_sr=22050)
+    from_file, sr = sf.read(str(tmp_path / "desde_archivo.wav"), dtype="float32")
+    from_array, _ = sf.read(str(tmp_path / "desde_array.wav"), dtype="float32")
+    # termina con la más corta, a la frecuencia de la voz
+    assert sr == 44100 and len(from_file) == len(voz) == len(from_array)
+    np.testing.assert_allclose(from_file, from_array, atol=1e-4)
+    assert np.abs(from_file).max() <= 0.99 + 1e-4
+
+
+def test_arrays_need_their_sample_rate(tmp_path):
+    with pytest.raises(ValueError):
+        mezclar_stream(np.zeros(10, dtype=np.float32), np.zeros(10, dtype=np.float32), tmp_path / "x.wav")
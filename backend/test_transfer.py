@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from transfer import UploadTooLarge, _parse_range, save_upload, transcode
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=990-2000", (990, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=1000-", None),
+    ("bytes=50-10", None),
+    ("bytes=-0", None),
+    ("bytes=-", None),
+    ("bytes=0-1,5-9", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+class FakeUpload:
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    async def read(self, n):
+        return self._data.read(n)
+
+
+def test_save_upload_hashes_while_copying(tmp_path):
+    data = bytes(range(256)) * 100
+    hasher = hashlib.sha256()
+    written = asyncio.run(save_upload(FakeUpload(data), tmp_path / "in.wav", 10 ** 6, chunk_size=1000,
+                                      hasher=hasher))
+    assert written == len(data)
+    assert (tmp_path / "in.wav").read_bytes() == data
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_save_upload_over_the_limit_leaves_nothing(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(save_upload(FakeUpload(b"\0" * 5000), tmp_path / "in.wav", 4096, chunk_size=1000))
+    assert not (tmp_path / "in.wav").exists()
+
+
+def write_tone(path, sr=44100, seconds=2):
+    t = np.arange(sr * seconds) / sr
+    audio = 0.5 * np.sin(2 * np.pi * 440 * t)
+    sf.write(str(path), np.stack([audio, audio], axis=1), sr)
+    return audio
+
+
+def test_transcode_to_flac_once(tmp_path):
+    audio = write_tone(tmp_path / "result.wav")
+    out = transcode(tmp_path / "result.wav", "flac", block_size=1000)
+    decoded, sr = sf.read(str(out))
+    assert out.suffix == ".flac" and sr == 44100
+    np.testing.assert_allclose(decoded[:, 0], audio, atol=1 / 2 ** 15)
+    stamp = out.stat().st_mtime_ns
+    assert transcode(tmp_path / "result.wav", "flac") == out
+    assert out.stat().st_mtime_ns == stamp
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_transcode_to_opus_resamples_to_48k(tmp_path):
+    write_tone(tmp_path / "result.wav")
+    out = transcode(tmp_path / "result.wav", "opus", block_size=1000)
+    info = sf.info(str(out))
+    assert info.samplerate == 48000 and info.channels == 2
+    # el remuestreo por bloques no pierde ni duplica muestras
+    assert abs(info.frames - 2 * 48000) < 48000 * 0.01
+
+
+@pytest.fixture
+def api(monkeypatch):
+    main = pytest.importorskip("main")
+    from fastapi.testclient import TestClient
+    write_tone(main.RESULTS_DIR / "result_rango.wav")
+    yield main, TestClient(main.app)
+    for path in main.RESULTS_DIR.glob("result_rango.*"):
+        path.unlink()
+
+
+def test_download_serves_ranges(api):
+    main, client = api
+    data = (main.RESULTS_DIR / "result_rango.wav").read_bytes()
+    whole = client.get("/download/result_rango.wav")
+    assert whole.status_code == 200 and whole.content == data
+    assert whole.headers["accept-ranges"] == "bytes"
+
+    part = client.get("/download/result_rango.wav", headers={"Range": "bytes=100-199"})
+    assert part.status_code == 206 and part.content == data[100:200]
+    assert part.headers["content-range"] == f"bytes 100-199/{len(data)}"
+    assert part.headers["content-length"] == "100"
+
+    tail = client.get("/download/result_rango.wav", headers={"Range": "bytes=-10"})
+    assert tail.content == data[-10:]
+
+    bad = client.get("/download/result_rango.wav", headers={"Range": f"bytes={len(data)}-"})
+    assert bad.status_code == 416 and bad.headers["content-range"] == f"bytes */{len(data)}"
+
+
+def test_download_ranges_of_a_transcoded_file(api):
+    main, client = api
+    first = client.get("/download/result_rango.wav?format=flac")
+    assert first.status_code == 200 and first.headers["content-type"] == "audio/flac"
+    part = client.get("/download/result_rango.wav?format=flac", headers={"Range": "bytes=0-3"})
+    assert part.status_code == 206 and part.content == b"fLaC" == first.content[:4]
+    assert client.get("/download/result_rango.wav?format=mp3").status_code == 400
+    assert client.get("/download/no_existe.wav").status_code == 404
@@ -0,0 +1,146 @@
+"""
+Subida y descarga de audio sin cargar archivos completos en memoria:
+las subidas se copian a disco por bloques y las descargas admiten
+peticiones HTTP Range y recodificación a FLAC u Opus. La recodificación
+no se emite en vivo: se escribe entera en disco y luego se sirve.
+"""
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import soundfile as sf
+import soxr
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHUNK_SIZE = 1024 * 1024
+
+# formato de descarga -> (extensión, formato y subtipo de soundfile, media type)
+DOWNLOAD_FORMATS = {
+    "wav": ("wav", "WAV", None, "audio/wav"),
+    "flac": ("flac", "FLAC", "PCM_16", "audio/flac"),
+    "opus": ("opus", "OGG", "OPUS", "audio/ogg"),
+}
+# Opus solo admite estas frecuencias de muestreo
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def save_upload(file, dest, max_bytes, chunk_size=CHUNK_SIZE, hasher=None):
+    """
+    Copia el UploadFile a `dest` por bloques. Si supera `max_bytes` borra lo
+    escrito y lanza UploadTooLarge. Devuelve los bytes escritos. Si se pasa un
+    `hasher` de hashlib se actualiza con el contenido sobre la marcha.
+    """
+    written = 0
+    try:
+        with open(dest, "wb") as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"El archivo supera el límite de {max_bytes} bytes")
+                f.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+    except UploadTooLarge:
+        Path(dest).unlink(missing_ok=True)
+        raise
+    return written
+
+
+def _parse_range(range_header, size):
+    """
+    Devuelve (inicio, fin) inclusivos para una cabecera `bytes=a-b`, o None si
+    no es satisfacible. Solo se admite un rango por petición.
+    """
+    m = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    if not m or (m.group(1) == "" and m.group(2) == ""):
+        return None
+    if m.group(1) == "":
+        # bytes=-N: los últimos N bytes
+        length = int(m.group(2))
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _iter_file(path, start, length, chunk_size=CHUNK_SIZE):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(path, range_header, media_type, filename):
+    """
+    Responde con el archivo completo (200) o con el rango pedido (206).
+    """
+    size = os.path.getsize(path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    if not range_header:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
+    byte_range = _parse_range(range_header, size)
+    if byte_range is None:
+        return JSONResponse(status_code=416, content={"error": "Rango no válido"},
+                            headers={"Content-Range": f"bytes */{size}"})
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_iter_file(path, start, length), status_code=206,
+                             media_type=media_type, headers=headers)
+
+
+def transcode(src_path, fmt, block_size=65536):
+    """
+    Recodifica `src_path` al formato pedido bloque a bloque (la memoria no
+    crece con la duración) y lo guarda junto al original. La primera descarga
+    espera a que el archivo esté completo, porque FLAC reescribe su cabecera
+    al cerrar; las siguientes (y los rangos) salen directamente del disco.
+    """
+    ext, sf_format, subtype, _ = DOWNLOAD_FORMATS[fmt]
+    src_path = Path(src_path)
+    out_path = src_path.with_suffix(f".{ext}")
+    if out_path == src_path or (out_path.exists() and out_path.stat().st_mtime >= src_path.stat().st_mtime):
+        return out_path
+    with sf.SoundFile(str(src_path)) as src:
+        out_sr = src.samplerate
+        resampler = None
+        if sf_format == "OGG" and out_sr not in OPUS_SAMPLE_RATES:
+            out_sr = 48000
+            resampler = soxr.ResampleStream(src.samplerate, out_sr, src.channels, dtype="float32")
+        fd, tmp_path = tempfile.mkstemp(dir=str(out_path.parent), suffix=f".{ext}.part")
+        os.close(fd)
+        try:
+            with sf.SoundFile(tmp_path, "w", samplerate=out_sr, channels=src.channels,
+                              format=sf_format, subtype=subtype) as dst:
+                for block in src.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+                    if resampler is not None:
+                        block = resampler.resample_chunk(block)
+                    dst.write(block)
+                if resampler is not None:
+                    dst.write(resampler.resample_chunk(src.read(0, dtype="float32", always_2d=True), last=True))
+            os.replace(tmp_path, out_path)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+    return out_path
@@ -0,0 +1,262 @@
+"""
+Worker persistente del pipeline: carga Demucs y So-VITS-SVC una sola vez y
+atiende cada canción con llamadas directas de Python, sin lanzar subprocesos.
+"""
+import os
+import sys
+import threading
+from pathlib import Path
+
+import soundfile as sf
+import torch
+
+from disk_cache import fingerprint_file, make_key
+from metrics import observe_stage, time_model_load, time_stage
+from separate_vocals import demucs_signature, load_demucs_model, separate_to_arrays
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SOVITS_DIR = PROJECT_ROOT / "so-vits-svc"
+
+
+def use_sovits_path():
+    if str(SOVITS_DIR) not in sys.path:
+        sys.path.insert(0, str(SOVITS_DIR))
+
+
+def open_feature_cache(root, max_bytes, on_event=None):
+    """
+    Caché en disco de la F0 y las unidades de contenido de So-VITS-SVC: volver
+    a convertir una voz con otro locutor o tran se salta esa parte. Su índice
+    SQLite permite compartirla entre todos los procesos.
+    """
+    use_sovits_path()
+    from inference.feature_cache import FeatureCache
+    return FeatureCache(root, max_bytes, on_event=on_event)
+
+# Parámetros de inferencia por defecto (los mismos que inference_main.py)
+INFER_DEFAULTS = {
+    "speaker": None,
+    "tran": 0,
+    "slice_db": -40,
+    "cluster_infer_ratio": 0,
+    "auto_predict_f0": False,
+    "noice_scale": 0.4,
+    "pad_seconds": 0.5,
+    "f0_predictor": "pm",
+    "k_step": 100,
+}
+
+
+def resolve_infer_args(default_speaker, **overrides):
+    """
+    Parámetros completos de inferencia: los valores por defecto más los que
+    no sean None en `overrides`, con el locutor ya resuelto.
+    """
+    args = dict(INFER_DEFAULTS)
+    args.update({k: v for k, v in overrides.items() if v is not None})
+    if args["speaker"] is None:
+        args["speaker"] = default_speaker
+    return args
+
+
+class PipelineWorker:
+    def __init__(self, svc_model_path, svc_config_path,
+                 demucs_model="htdemucs",
+                 device=None,
+                 cluster_model_path="",
+                 sr=44100,
+                 stem_cache=None,
+                 feature_cache=None,
+                 batch_size=1,
+                 prefetch=0,
+                 whole_track_features=False,
+                 compiled=False,
+                 compile_cache_dir=None):
+        self.svc_model_path = str(svc_model_path)
+        self.svc_config_path = str(svc_config_path)
+        self.demucs_model_name = demucs_model
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.cluster_model_path = cluster_model_path
+        self.sr = sr
+        # DiskCache opcional con las pistas ya separadas, por hash del audio de entrada
+        self.stem_cache = stem_cache
+        # FeatureCache opcional (ver `open_feature_cache`) que usa So-VITS-SVC
+        self.feature_cache = feature_cache
+        # Tramos (por objetivo) que So-VITS-SVC sintetiza juntos en una sola pasada
+        self.batch_size = batch_size
+        # Tramos cuya F0 y codificación de contenido se adelantan en otros hilos mientras se sintetiza
+        self.prefetch = prefetch
+        # F0, contenido y volumen se calculan una vez para toda la voz y cada tramo toma su parte,
+        # con el audio real a su alrededor como contexto en vez del relleno de silencio
+        self.whole_track_features = whole_track_features
+        # SynthesizerTrn compilado con torch.compile; los kernels se guardan en `compile_cache_dir`
+        # para que los demás workers y los siguientes arranques no vuelvan a generarlos
+        self.compiled = compiled
+        self.compile_cache_dir = compile_cache_dir
+        self.demucs = None
+        self.demucs_signature = None
+        self.svc = None
+        self._load_lock = threading.Lock()
+        # Svc y Demucs no son seguros entre hilos: una canción a la vez por worker
+        self._run_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.demucs is not None and self.svc is not None
+
+    def load(self):
+        """
+        Carga los modelos si aún no están en memoria. Es idempotente.
+        """
+        with self._load_lock:
+            if self.loaded:
+                return
+            # So-VITS-SVC resuelve `pretrain/...` y `logs/...` relativo al cwd
+            use_sovits_path()
+            os.chdir(SOVITS_DIR)
+            from inference.infer_tool import Svc
+            with time_model_load("demucs"):
+                self.demucs = load_demucs_model(self.demucs_model_name, self.device)
+            self.demucs_signature = demucs_signature(self.demucs, self.demucs_model_name)
+            with time_model_load("so-vits-svc"):
+                self.svc = Svc(self.svc_model_path,
+                               self.svc_config_path,
+                               device=self.device,
+                               cluster_model_path=self.cluster_model_path,
+                               compiled=self.compiled,
+                               compile_cache_dir=str(self.compile_cache_dir) if self.compile_cache_dir else None)
+            # troceado, F0, codificador de contenido, síntesis y mejora
+            self.svc.stage_listener = observe_stage
+            self.svc.feature_cache = self.feature_cache
+            print(f"[INFO] Modelo So-VITS-SVC cargado: {self.svc_model_path}")
+
+    def default_speaker(self):
+        return next(iter(self.svc.spk2id.keys()))
+
+    def infer_args(self, **overrides):
+        return resolve_infer_args(self.default_speaker(), **overrides)
+
+    def fingerprint(self):
+        """
+        Identifica los modelos en uso; cambia si cambia cualquier checkpoint.
+        """
+        parts = [
+            fingerprint_file(self.svc_model_path),
+            fingerprint_file(self.svc_config_path),
+            self.demucs_signature or self.demucs_model_name,
+            str(self.sr),
+        ]
+        if self.whole_track_features:
+            # cambia el resultado, así que no puede compartir la caché con el modo por tramos
+            parts.append("whole_track_features")
+        return "|".join(parts)
+
+    def describe(self):
+        """
+        Lo que el proceso de la API necesita saber de los modelos cargados.
+        """
+        return {
+            "fingerprint": self.fingerprint(),
+            "speakers": list(self.svc.spk2id.keys()),
+            "shallow_diffusion": bool(self.svc.shallow_diffusion),
+            "enhancer": bool(self.svc.nsf_hifigan_enhance),
+        }
+
+    def separate(self, input_path, work_dir=None, audio_hash=None):
+        """
+        Separa voz e instrumental como arrays mono a `self.sr`. Con `audio_hash`
+        y caché de pistas, reutiliza una separación anterior; solo entonces se
+        escriben las pistas en `work_dir` para guardarlas en la caché.
+        """
+        use_cache = self.stem_cache is not None and audio_hash is not None
+        if use_cache:
+            key = make_key(audio_hash, self.demucs_signature, self.sr)
+            entry = self.stem_cache.get(key)
+            if entry is not None:
+                try:
+                    vocals, _ = sf.read(str(entry / "vocals.wav"), dtype="float32")
+                    instrumental, _ = sf.read(str(entry / "instrumental.wav"), dtype="float32")
+                    print(f"[INFO] Pistas separadas servidas desde la caché ({audio_hash[:12]})")
+                    return vocals, instrumental
+                except (OSError, RuntimeError):
+                    pass
+        vocals, instrumental = separate_to_arrays(self.demucs, input_path, sr=self.sr, device=self.device)
+        if use_cache and work_dir is not None:
+            vocals_path = Path(work_dir) / "vocals.wav"
+            instrumental_path = Path(work_dir) / "instrumental.wav"
+            sf.write(str(vocals_path), vocals, self.sr)
+            sf.write(str(instrumental_path), instrumental, self.sr)
+            self.stem_cache.put(key, {"vocals.wav": vocals_path, "instrumental.wav": instrumental_path})
+        return vocals, instrumental
+
+    def convert(self, vocals, targets,
+                slice_db=-40,
+                cluster_infer_ratio=0,
+                auto_predict_f0=False,
+                noice_scale=0.4,
+                pad_seconds=0.5,
+                f0_predictor="pm",
+                k_step=100,
+                on_segment=None):
+        """
+        Clona la voz de un array mono a `self.sr` para cada (locutor, tran) de
+        `targets` con `Svc.slice_inference_multi`: el troceado, la F0 y el
+        codificador de contenido se calculan una sola vez. Devuelve un audio
+        a `self.svc.target_sample` por objetivo. `on_segment(indice, total,
+        audios)` recibe cada tramo ya terminado, uno por objetivo.
+        """
+        targets = [(speaker if speaker is not None else self.default_speaker(), tran)
+                   for speaker, tran in targets]
+        audios = self.svc.slice_inference_multi(vocals, targets, slice_db,
+                                                cluster_infer_ratio, auto_predict_f0, noice_scale,
+                                                pad_seconds=pad_seconds,
+                                                f0_predictor=f0_predictor,
+                                                k_step=k_step,
+                                                audio_sr=self.sr,
+                                                on_segment=on_segment,
+                                                batch_size=self.batch_size,
+                                                prefetch=self.prefetch,
+                                                whole_track_features=self.whole_track_features)
+        self.svc.clear_empty()
+        return audios
+
+    def run(self, input_path, work_dir, progress=None, audio_hash=None, on_segment=None,
+            speaker=None, tran=0, **infer_kwargs):
+        """
+        Separa y clona la voz de `input_path` sin pasar por disco entre etapas.
+        Devuelve (voz_clonada, sr_voz, instrumental, sr_instrumental).
+        `progress(etapa, fraccion)` se llama al empezar y terminar cada etapa y
+        tras cada tramo de la conversión.
+        `audio_hash` (sha256 de la entrada) activa la caché de pistas separadas.
+        `on_segment` recibe la voz convertida tramo a tramo (ver `convert`).
+        """
+        cloned, sr, instrumental, instrumental_sr = self.run_multi(input_path, work_dir, [(speaker, tran)],
+                                                                   progress=progress, audio_hash=audio_hash,
+                                                                   on_segment=on_segment, **infer_kwargs)
+        return cloned[0], sr, instrumental, instrumental_sr
+
+    def run_multi(self, input_path, work_dir, targets, progress=None, audio_hash=None, on_segment=None,
+                  **infer_kwargs):
+        """
+        Como `run`, pero para varios (locutor, tran) a la vez: devuelve una
+        lista de voces clonadas en el mismo orden que `targets`.
+        """
+        if progress is None:
+            progress = lambda stage, fraction: None  # noqa: E731
+
+        def segment_done(index, total, audios):
+            progress("conversion", (index + 1) / total)
+            if on_segment is not None:
+                on_segment(index, total, audios)
+
+        self.load()
+        with self._run_lock:
+            progress("separation", 0.0)
+            with time_stage("separation"):
+                vocals, instrumental = self.separate(input_path, work_dir, audio_hash=audio_hash)
+            progress("separation", 1.0)
+            progress("conversion", 0.0)
+            with time_stage("conversion"):
+                cloned = self.convert(vocals, targets, on_segment=segment_done, **infer_kwargs)
+            progress("conversion", 1.0)
+        return cloned, self.svc.target_sample, instrumental, self.sr
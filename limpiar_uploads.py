@@ -1,10 +1,12 @@
 # Script para limpiar la carpeta uploads y dejar solo la última subcarpeta
+# (el backend ya lo hace solo con cuotas y LRU; ver backend/janitor.py)
 import os
 import shutil
+import sys
 from pathlib import Path
 
-uploads_dir = Path("c:/Users/nikoa/Documents/PROJECTS/VoiceClonation/data/uploads")
-subdirs = sorted([d for d in uploads_dir.iterdir() if d.is_dir()], key=os.path.getmtime)
+uploads_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).resolve().parent / "data" / "uploads"
+subdirs = sorted([d for d in uploads_dir.iterdir() if d.is_dir()], key=os.path.getmtime) if uploads_dir.is_dir() else []
 if len(subdirs) > 1:
     for d in subdirs[:-1]:
         shutil.rmtree(d)
@@ -0,0 +1,61 @@
+import argparse
+import time
+
+import torch
+
+import utils
+from inference.compile_cache import compile_synthesizer, warmup_inputs
+from models import SynthesizerTrn
+
+
+def load_synthesizer(config, model, device):
+    hps = utils.get_hparams_from_file(config, True)
+    net_g = SynthesizerTrn(hps.data.filter_length // 2 + 1,
+                           hps.train.segment_size // hps.data.hop_length,
+                           **hps.model)
+    _ = utils.load_checkpoint(model, net_g, None)
+    _ = net_g.eval().to(device)
+    return hps, net_g
+
+
+def realtime_factor(net_g, inputs, seconds, repeats):
+    # synthesis seconds per second of audio, best of `repeats` runs
+    best = None
+    with torch.no_grad():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            audio, _ = net_g.infer(**inputs)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best / seconds, audio
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='SynthesizerTrn.infer realtime factor, eager and compiled')
+    parser.add_argument('-m', '--model_path', type=str, default="logs/44k/G_37600.pth", help='模型路径')
+    parser.add_argument('-c', '--config_path', type=str, default="logs/44k/config.json", help='配置文件路径')
+    parser.add_argument('-d', '--device', type=str, default="cpu", help='推理设备')
+    parser.add_argument('-s', '--seconds', type=float, nargs='+', default=[2, 5, 10], help='测试音频长度，单位为秒')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='每个长度的重复次数，取最快一次')
+    parser.add_argument('-cc', '--compile_cache_dir', type=str, default="inference/compile_cache", help='编译结果缓存目录')
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    hps, net_g = load_synthesizer(args.config_path, args.model_path, device)
+    frames_per_second = hps.data.sampling_rate / hps.data.hop_length
+    dtype = next(net_g.parameters()).dtype
+    cases = {seconds: warmup_inputs(hps, device, dtype, frames=int(seconds * frames_per_second))
+             for seconds in args.seconds}
+
+    eager = {seconds: realtime_factor(net_g, inputs, seconds, args.repeats) for seconds, inputs in cases.items()}
+
+    start = time.perf_counter()
+    compile_synthesizer(net_g, args.compile_cache_dir, lambda: net_g.infer(**cases[args.seconds[0]]))
+    print(f"compile: {time.perf_counter() - start:.1f}s")
+
+    print(f"{'seconds':>8} {'eager RTF':>10} {'compiled RTF':>13} {'speedup':>8} {'max diff':>10}")
+    for seconds, inputs in cases.items():
+        rtf, audio = realtime_factor(net_g, inputs, seconds, args.repeats)
+        eager_rtf, eager_audio = eager[seconds]
+        diff = (audio - eager_audio).abs().max().item()
+        print(f"{seconds:>8g} {eager_rtf:>10.4f} {rtf:>13.4f} {eager_rtf / rtf:>7.2f}x {diff:>10.2e}")
@@ -4,6 +4,7 @@ import torch
 
 import utils
 from models import SynthesizerTrn
+from modules.quantize import quantize_int8
 
 
 def copyStateDict(state_dict):
@@ -48,6 +49,26 @@ def removeOptimizer(config: str, input_model: str, ishalf: bool, output_model: s
         }, output_model)
 
 
+def quantizeModel(config: str, input_model: str, output_model: str):
+    # int8 model for CPU inference; its "quantized" entry tells Svc to load it as such
+    hps = utils.get_hparams_from_file(config)
+
+    net_g = SynthesizerTrn(hps.data.filter_length // 2 + 1,
+                           hps.train.segment_size // hps.data.hop_length,
+                           **hps.model)
+    _ = utils.load_checkpoint(input_model, net_g, None)
+    quantize_int8(net_g.float().eval())
+
+    torch.save(
+        {
+            'model': {k: v for k, v in net_g.state_dict().items() if not k.startswith("enc_q.")},
+            'quantized': 'int8',
+            'iteration': 0,
+            'optimizer': None,
+            'learning_rate': 0.0001
+        }, output_model)
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
@@ -58,6 +79,7 @@ if __name__ == "__main__":
     parser.add_argument("-i", "--input", type=str)
     parser.add_argument("-o", "--output", type=str, default=None)
     parser.add_argument('-hf', '--half', action='store_true', default=False, help='Save as FP16')
+    parser.add_argument('-q', '--int8', action='store_true', default=False, help='Save as dynamic int8 for CPU inference')
     
     args = parser.parse_args()
 
@@ -67,6 +89,10 @@ if __name__ == "__main__":
         import os.path
         filename, ext = os.path.splitext(args.input)
         half = "_half" if args.half else ""
-        output = filename + "_release" + half + ext
+        int8 = "_int8" if args.int8 else ""
+        output = filename + "_release" + half + int8 + ext
 
-    removeOptimizer(args.config, args.input, args.half, output)
\ No newline at end of file
+    if args.int8:
+        quantizeModel(args.config, args.input, output)
+    else:
+        removeOptimizer(args.config, args.input, args.half, output)
\ No newline at end of file
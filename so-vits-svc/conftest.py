@@ -0,0 +1,83 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import torch
+
+import utils
+from models import SynthesizerTrn
+
+# a two speaker SynthesizerTrn small enough to run on the CPU in tests, with random weights
+TINY_CONFIG = {
+    "train": {"segment_size": 10240, "seed": 1234, "fp16_run": False},
+    "data": {"sampling_rate": 44100, "filter_length": 2048, "hop_length": 512, "win_length": 2048,
+             "n_mel_channels": 80, "mel_fmin": 0.0, "mel_fmax": 22050, "max_wav_value": 32768.0,
+             "unit_interpolate_mode": "nearest"},
+    "model": {"inter_channels": 16, "hidden_channels": 16, "filter_channels": 32, "n_heads": 2, "n_layers": 2,
+              "kernel_size": 3, "p_dropout": 0.1, "resblock": "1", "resblock_kernel_sizes": [3, 7, 11],
+              "resblock_dilation_sizes": [[1, 3, 5], [1, 3, 5], [1, 3, 5]], "upsample_rates": [8, 8, 2, 2, 2],
+              "upsample_initial_channel": 16, "upsample_kernel_sizes": [16, 16, 4, 4, 4], "n_layers_q": 3,
+              "n_layers_trans_flow": 3, "n_flow_layer": 4, "use_spectral_norm": False, "gin_channels": 16,
+              "ssl_dim": 768, "n_speakers": 4, "vocoder_name": "nsf-hifigan", "speech_encoder": "vec768l12",
+              "speaker_embedding": False, "vol_embedding": False, "use_depthwise_conv": False,
+              "flow_share_parameter": False, "use_automatic_f0_prediction": True, "use_transformer_flow": False},
+    "spk": {"a": 0, "b": 1},
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def repo_cwd():
+    # the inference code loads pretrain/ and writes its caches relative to the repository
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    yield
+    os.chdir(cwd)
+
+
+def build_synthesizer(hps):
+    return SynthesizerTrn(hps.data.filter_length // 2 + 1, hps.train.segment_size // hps.data.hop_length, **hps.model)
+
+
+@pytest.fixture(scope="session")
+def tiny_config(tmp_path_factory):
+    path = tmp_path_factory.mktemp("model") / "config.json"
+    path.write_text(json.dumps(TINY_CONFIG))
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def tiny_hps(tiny_config):
+    return utils.get_hparams_from_file(tiny_config)
+
+
+@pytest.fixture(scope="session")
+def tiny_model_path(tiny_config, tiny_hps):
+    torch.manual_seed(0)
+    path = os.path.join(os.path.dirname(tiny_config), "G_0.pth")
+    torch.save({"model": build_synthesizer(tiny_hps).state_dict(), "iteration": 0, "learning_rate": 1e-4,
+                "optimizer": None}, path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def song():
+    # 12 s of a 220 Hz tone with silent gaps every 4 s, so that the slicer cuts it into several voiced slices
+    sr = 44100
+    t = np.arange(sr * 12) / sr
+    audio = 0.3 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.25 * t) > -0.3)
+    return audio.astype(np.float32), sr
+
+
+def load_svc(model_path, config_path, **kwargs):
+    # Svc on the CPU, or a skip where its speech encoder cannot be loaded (vencoder/ or pretrain/ missing)
+    try:
+        from inference.infer_tool import Svc
+        return Svc(model_path, config_path, device="cpu", cluster_model_path="", **kwargs)
+    except (ImportError, FileNotFoundError) as e:
+        pytest.skip(f"speech encoder not available: {e}")
+
+
+@pytest.fixture(scope="session")
+def svc(tiny_model_path, tiny_config):
+    return load_svc(tiny_model_path, tiny_config)
@@ -1,6 +1,6 @@
 import torch
-from torchaudio.transforms import Resample
 
+from modules.resample import get_resampler
 from vdecoder.nsf_hifigan.models import load_config, load_model
 from vdecoder.nsf_hifigan.nvSTFT import STFT
 
@@ -18,7 +18,6 @@ class Vocoder:
         else:
             raise ValueError(f" [x] Unknown vocoder: {vocoder_type}")
             
-        self.resample_kernel = {}
         self.vocoder_sample_rate = self.vocoder.sample_rate()
         self.vocoder_hop_size = self.vocoder.hop_size()
         self.dimension = self.vocoder.dimension()
@@ -29,10 +28,7 @@ class Vocoder:
         if sample_rate == self.vocoder_sample_rate:
             audio_res = audio
         else:
-            key_str = str(sample_rate)
-            if key_str not in self.resample_kernel:
-                self.resample_kernel[key_str] = Resample(sample_rate, self.vocoder_sample_rate, lowpass_filter_width = 128).to(self.device)
-            audio_res = self.resample_kernel[key_str](audio)    
+            audio_res = get_resampler(sample_rate, self.vocoder_sample_rate, lowpass_filter_width = 128, device = self.device)(audio)
         
         # extract
         mel = self.vocoder.extract(audio_res, keyshift=keyshift) # B, n_frames, bins
@@ -0,0 +1,70 @@
+import argparse
+import glob
+import time
+
+import librosa
+import numpy as np
+import torch
+
+from inference.model_registry import ModelRegistry
+
+
+def log_spectral_distance(reference, audio, n_fft=2048, hop_length=512):
+    # dB, root mean square over frequency of the log power difference, averaged over frames
+    window = torch.hann_window(n_fft)
+
+    def log_power(x):
+        spec = torch.stft(torch.as_tensor(x, dtype=torch.float32), n_fft, hop_length, window=window, return_complex=True)
+        return 10 * torch.log10(spec.abs().pow(2).clamp_min(1e-10))
+
+    diff = log_power(reference) - log_power(audio)
+    return diff.pow(2).mean(0).sqrt().mean().item()
+
+
+def run(svc, audio, sr, args):
+    # (converted audio, total seconds, seconds spent in SynthesizerTrn)
+    synthesis = []
+    svc.stage_listener = lambda stage, seconds: synthesis.append(seconds) if stage == "synthesis" else None
+    start = time.perf_counter()
+    out = svc.slice_inference(audio, args.spk, args.trans, args.slice_db, 0, False, 0.4,
+                              f0_predictor=args.f0_predictor, audio_sr=sr, prefetch=0)
+    return out, time.perf_counter() - start, sum(synthesis)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='int8 model against its float32 original: speed and spectral distance')
+    parser.add_argument('-m', '--model_path', type=str, default="logs/44k/G_37600.pth", help='float32模型路径')
+    parser.add_argument('-q', '--int8_model_path', type=str, default="logs/44k/G_37600_release_int8.pth", help='compress_model.py --int8 生成的int8模型路径')
+    parser.add_argument('-c', '--config_path', type=str, default="logs/44k/config.json", help='配置文件路径')
+    parser.add_argument('-n', '--clips', type=str, nargs='+', default=glob.glob("raw/*.wav"), help='参考音频列表，默认raw文件夹下所有wav')
+    parser.add_argument('-s', '--spk', type=str, default=None, help='合成目标说话人名称，默认第一个')
+    parser.add_argument('-t', '--trans', type=int, default=0, help='音高调整，支持正负（半音）')
+    parser.add_argument('-sd', '--slice_db', type=int, default=-40, help='默认-40，嘈杂的音频可以-30，干声保留呼吸可以-50')
+    parser.add_argument('-f0p', '--f0_predictor', type=str, default="pm", help='选择F0预测器')
+    parser.add_argument('-r', '--repeats', type=int, default=2, help='每段音频的重复次数，取最快一次')
+    args = parser.parse_args()
+
+    # both models on the CPU, sharing one speech encoder and F0 predictor
+    registry = ModelRegistry()
+    fp32 = registry.get(args.model_path, args.config_path, device="cpu", cluster_model_path="")
+    int8 = registry.get(args.int8_model_path, args.config_path, device="cpu", cluster_model_path="")
+    if args.spk is None:
+        args.spk = next(iter(fp32.spk2id.keys()))
+
+    print(f"{'clip':<32} {'seconds':>8} {'fp32 RTF':>9} {'int8 RTF':>9} {'speedup':>8} {'synth speedup':>14} {'LSD dB':>7}")
+    rows = []
+    for clip in args.clips:
+        audio, sr = librosa.load(clip, sr=None, mono=True)
+        seconds = len(audio) / sr
+        results = {}
+        for name, svc in (("fp32", fp32), ("int8", int8)):
+            runs = [run(svc, audio, sr, args) for _ in range(args.repeats)]
+            results[name] = (runs[0][0], min(r[1] for r in runs), min(r[2] for r in runs))
+        (reference, fp32_total, fp32_synth), (out, int8_total, int8_synth) = results["fp32"], results["int8"]
+        row = (fp32_total / seconds, int8_total / seconds, fp32_total / int8_total, fp32_synth / int8_synth,
+               log_spectral_distance(reference, out))
+        rows.append(row)
+        print(f"{clip[-32:]:<32} {seconds:>8.1f} {row[0]:>9.4f} {row[1]:>9.4f} {row[2]:>7.2f}x {row[3]:>13.2f}x {row[4]:>7.2f}")
+    if rows:
+        mean = np.mean(rows, axis=0)
+        print(f"{'mean':<32} {'':>8} {mean[0]:>9.4f} {mean[1]:>9.4f} {mean[2]:>7.2f}x {mean[3]:>13.2f}x {mean[4]:>7.2f}")
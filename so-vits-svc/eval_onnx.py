@@ -0,0 +1,58 @@
+import argparse
+import glob
+
+import librosa
+import numpy as np
+import torch
+
+from eval_int8 import log_spectral_distance, run
+from inference.model_registry import ModelRegistry
+
+
+def snr(reference, audio):
+    # dB, of audio against reference
+    noise = np.sum((reference - audio) ** 2)
+    return 10 * np.log10(np.sum(reference ** 2) / max(noise, 1e-20))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ONNX Runtime model against its torch original: parity and latency')
+    parser.add_argument('-m', '--model_path', type=str, default="logs/44k/G_37600.pth", help='torch模型路径')
+    parser.add_argument('-o', '--onnx_model_path', type=str, default="checkpoints/TransformerFlow/TransformerFlow_SoVits.onnx", help='onnx_export.py导出的onnx模型路径')
+    parser.add_argument('-c', '--config_path', type=str, default="logs/44k/config.json", help='配置文件路径')
+    parser.add_argument('-n', '--clips', type=str, nargs='+', default=glob.glob("raw/*.wav"), help='参考音频列表，默认raw文件夹下所有wav')
+    parser.add_argument('-s', '--spk', type=str, default=None, help='合成目标说话人名称，默认第一个')
+    parser.add_argument('-t', '--trans', type=int, default=0, help='音高调整，支持正负（半音）')
+    parser.add_argument('-sd', '--slice_db', type=int, default=-40, help='默认-40，嘈杂的音频可以-30，干声保留呼吸可以-50')
+    parser.add_argument('-f0p', '--f0_predictor', type=str, default="pm", help='选择F0预测器')
+    parser.add_argument('-r', '--repeats', type=int, default=2, help='每段音频的重复次数，取最快一次')
+    parser.add_argument('-th', '--threads', type=int, default=None, help='torch与onnxruntime的线程数，默认不限制')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    # both models on the CPU, sharing one speech encoder and F0 predictor
+    registry = ModelRegistry()
+    reference_model = registry.get(args.model_path, args.config_path, device="cpu", cluster_model_path="")
+    onnx_model = registry.get(args.onnx_model_path, args.config_path, device="cpu", cluster_model_path="",
+                              onnx_threads=args.threads)
+    if args.spk is None:
+        args.spk = next(iter(reference_model.spk2id.keys()))
+
+    print(f"{'clip':<32} {'seconds':>8} {'torch RTF':>10} {'onnx RTF':>9} {'speedup':>8} {'synth speedup':>14} {'SNR dB':>7} {'LSD dB':>7}")
+    rows = []
+    for clip in args.clips:
+        audio, sr = librosa.load(clip, sr=None, mono=True)
+        seconds = len(audio) / sr
+        results = {}
+        for name, svc in (("torch", reference_model), ("onnx", onnx_model)):
+            runs = [run(svc, audio, sr, args) for _ in range(args.repeats)]
+            results[name] = (runs[0][0], min(r[1] for r in runs), min(r[2] for r in runs))
+        (reference, torch_total, torch_synth), (out, onnx_total, onnx_synth) = results["torch"], results["onnx"]
+        row = (torch_total / seconds, onnx_total / seconds, torch_total / onnx_total, torch_synth / onnx_synth,
+               snr(reference, out), log_spectral_distance(reference, out))
+        rows.append(row)
+        print(f"{clip[-32:]:<32} {seconds:>8.1f} {row[0]:>10.4f} {row[1]:>9.4f} {row[2]:>7.2f}x {row[3]:>13.2f}x {row[4]:>7.1f} {row[5]:>7.2f}")
+    if rows:
+        mean = np.mean(rows, axis=0)
+        print(f"{'mean':<32} {'':>8} {mean[0]:>10.4f} {mean[1]:>9.4f} {mean[2]:>7.2f}x {mean[3]:>13.2f}x {mean[4]:>7.1f} {mean[5]:>7.2f}")
@@ -7,7 +7,8 @@ import torchaudio
 from flask import Flask, request, send_file
 from flask_cors import CORS
 
-from inference.infer_tool import RealTimeVC, Svc
+from inference.infer_tool import RealTimeVC
+from inference.model_registry import ModelRegistry
 
 app = Flask(__name__)
 
@@ -25,14 +26,19 @@ def voice_change_model():
     # DAW所需的采样率
     daw_sample = int(float(request_form.get("sampleRate", 0)))
     speaker_id = int(float(request_form.get("sSpeakId", 0)))
+    # 模型名(models中的键)，不填则使用default_model
+    model_key = request_form.get("model", default_model)
+    if model_key not in models:
+        return f"unknown model {model_key}", 400
+    svc_model = registry.get(**models[model_key])
     # http获得wav文件并转换
     input_wav_path = io.BytesIO(wave_file.read())
 
     # 模型推理
     if raw_infer:
         # out_audio, out_sr = svc_model.infer(speaker_id, f_pitch_change, input_wav_path)
-        out_audio, out_sr = svc_model.infer(speaker_id, f_pitch_change, input_wav_path, cluster_infer_ratio=0,
-                                            auto_predict_f0=False, noice_scale=0.4, f0_filter=False)
+        out_audio, out_sr, _ = svc_model.infer(speaker_id, f_pitch_change, input_wav_path, cluster_infer_ratio=0,
+                                               auto_predict_f0=False, noice_scale=0.4, f0_filter=False)
         tar_audio = torchaudio.functional.resample(out_audio, svc_model.target_sample, daw_sample)
     else:
         out_audio = svc.process(svc_model, speaker_id, f_pitch_change, input_wav_path, cluster_infer_ratio=0,
@@ -50,11 +56,15 @@ if __name__ == '__main__':
     # vst插件调整0.3-0.5s切片时间可以降低延迟，直接切片方法会有连接处爆音、交叉淡化会有轻微重叠声音
     # 自行选择能接受的方法，或将vst最大切片时间调整为1s，此处设为Ture，延迟大音质稳定一些
     raw_infer = True
-    # 每个模型和config是唯一对应的
-    model_name = "logs/32k/G_174000-Copy1.pth"
-    config_name = "configs/config.json"
-    cluster_model_path = "logs/44k/kmeans_10000.pt"
-    svc_model = Svc(model_name, config_name, cluster_model_path=cluster_model_path)
+    # 每个模型和config是唯一对应的，请求只能按名字选择这里列出的模型
+    models = {
+        "default": dict(net_g_path="logs/32k/G_174000-Copy1.pth", config_path="configs/config.json",
+                        cluster_model_path="logs/44k/kmeans_10000.pt"),
+    }
+    default_model = "default"
+    # 常驻内存的模型总大小上限，超出时卸载最久未用的模型
+    registry = ModelRegistry(max_bytes=4 * 1024 ** 3)
+    registry.get(**models[default_model])
     svc = RealTimeVC()
     # 此处与vst插件对应，不建议更改
     app.run(port=6842, host="0.0.0.0", debug=False, threaded=False)
@@ -5,6 +5,7 @@ import soundfile
 from flask import Flask, request, send_file
 
 from inference import infer_tool, slicer
+from inference.model_registry import ModelRegistry
 
 app = Flask(__name__)
 
@@ -16,6 +17,10 @@ def wav2wav():
     tran = int(float(request_form.get("tran", 0)))  # 音调
     spk = request_form.get("spk", 0)  # 说话人(id或者name都可以,具体看你的config)
     wav_format = request_form.get("wav_format", 'wav')  # 范围文件格式
+    model_key = request_form.get("model", default_model)  # 模型名(models中的键)
+    if model_key not in models:
+        return f"unknown model {model_key}", 400
+    svc_model = registry.get(**models[model_key])
     infer_tool.format_wav(audio_path)
     chunks = slicer.cut(audio_path, db_thresh=-40)
     audio_data, audio_sr = slicer.chunks2audio(audio_path, chunks)
@@ -35,7 +40,7 @@ def wav2wav():
             raw_path = io.BytesIO()
             soundfile.write(raw_path, data, audio_sr, format="wav")
             raw_path.seek(0)
-            out_audio, out_sr = svc_model.infer(spk, tran, raw_path)
+            out_audio, out_sr, _ = svc_model.infer(spk, tran, raw_path)
             svc_model.clear_empty()
             _audio = out_audio.cpu().numpy()
             pad_len = int(svc_model.target_sample * 0.5)
@@ -49,7 +54,12 @@ def wav2wav():
 
 
 if __name__ == '__main__':
-    model_name = "logs/44k/G_60000.pth"  # 模型地址
-    config_name = "configs/config.json"  # config地址
-    svc_model = infer_tool.Svc(model_name, config_name)
+    # 模型名 -> 模型地址与config地址，请求只能按名字选择这里列出的模型
+    models = {
+        "default": dict(net_g_path="logs/44k/G_60000.pth", config_path="configs/config.json"),
+    }
+    default_model = "default"
+    # 常驻内存的模型总大小上限，超出时卸载最久未用的模型
+    registry = ModelRegistry(max_bytes=4 * 1024 ** 3)
+    registry.get(**models[default_model])
     app.run(port=1145, host="0.0.0.0", debug=False, threaded=False)
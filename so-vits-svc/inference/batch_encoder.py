@@ -0,0 +1,38 @@
+import torch
+
+# speech encoders whose wrapper (vencoder/) runs a fairseq HuBERT model as
+# model.extract_features(source, padding_mask, output_layer=...)[0], optionally followed by model.final_proj:
+# name -> (output_layer, final_proj)
+FAIRSEQ_ENCODERS = {
+    "vec768l12": (12, False),
+    "vec256l9": (9, True),
+}
+
+
+def encode_batch(speech_encoder, name, wavs):
+    # speech_encoder.encoder(wav) for each 16 kHz waveform of wavs, [1, units, frames] each. For the
+    # FAIRSEQ_ENCODERS the transformer runs once over all of them: the convolutional feature extractor
+    # normalises over time (its first GroupNorm), so it still runs per waveform, and its outputs are zero
+    # padded to the longest and masked as keys, the way fairseq masks padding. Each item then matches its
+    # single forward to float rounding (attention sums run over the padded length), not bit for bit.
+    # Other encoders run once per waveform
+    spec = FAIRSEQ_ENCODERS.get(name)
+    model = getattr(speech_encoder, "model", None)
+    if spec is None or model is None or not hasattr(model, "forward_features") or len(wavs) == 1:
+        return [speech_encoder.encoder(wav) for wav in wavs]
+    output_layer, final_proj = spec
+    with torch.no_grad():
+        features = [model.forward_features(wav.reshape(1, -1)) for wav in wavs]
+        lengths = [f.size(-1) for f in features]
+        n = max(lengths)
+        features = torch.cat([torch.nn.functional.pad(f, [0, n - f.size(-1)]) for f in features])
+        padding_mask = torch.arange(n, device=features.device)[None, :] >= torch.tensor(lengths, device=features.device)[:, None]
+        # as HubertModel.forward(mask=False, features_only=True) from here on
+        x = model.layer_norm(features.transpose(1, 2))
+        if model.post_extract_proj is not None:
+            x = model.post_extract_proj(x)
+        x = model.dropout_input(x)
+        x, _ = model.encoder(x, padding_mask=padding_mask, layer=output_layer - 1)
+        if final_proj:
+            x = model.final_proj(x)
+    return [x[i:i+1, :length].transpose(1, 2) for i, length in enumerate(lengths)]
@@ -0,0 +1,40 @@
+import os
+
+import torch
+
+# the parts of SynthesizerTrn that infer() and infer_batch() spend their time in
+COMPILED_MODULES = ("enc_p", "flow", "dec")
+
+
+def warmup_inputs(hps, device, dtype, frames=200):
+    # infer() keyword arguments for a voiced clip of `frames` frames at 220Hz
+    return dict(c=torch.zeros(1, hps.model.ssl_dim, frames, dtype=dtype, device=device),
+                f0=torch.full((1, frames), 220., dtype=dtype, device=device),
+                uv=torch.ones(1, frames, dtype=dtype, device=device),
+                g=torch.LongTensor([0]).to(device),
+                vol=torch.full((1, frames), 0.1, dtype=dtype, device=device) if hps.model.vol_embedding else None)
+
+
+def compile_synthesizer(net_g, cache_dir=None, warmup=None):
+    # Compiles the text encoder, flow and decoder of net_g in place with torch.compile, so its state dict
+    # keys stay the same. The frame count is a dynamic dimension: one compiled graph serves every slice
+    # length, where padding slices to a few bucket lengths would change the audio (the NSF decoder has
+    # no mask). cache_dir (None: torch's default) becomes the inductor cache of the process, which keeps
+    # the generated code and the built C++ kernels keyed by graph, torch version and device; any process
+    # compiling the same architecture with the same cache_dir loads them instead of building them again.
+    # warmup: callable running net_g on example inputs, so that it is compiled now rather than on its
+    # first real input
+    import torch._inductor.config as inductor_config
+
+    # random ops (the sine excitation of the decoder) draw from the same generator as in eager mode,
+    # so a seeded infer() gives the same audio compiled or not
+    inductor_config.fallback_random = True
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.abspath(cache_dir)
+    for name in COMPILED_MODULES:
+        getattr(net_g, name).compile(dynamic=True)
+    if warmup is not None:
+        with torch.no_grad():
+            warmup()
+    return net_g
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# temporary files older than this are left over from an interrupted write
+STALE_TMP_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS features (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS features_last_used ON features (last_used);
+"""
+
+
+class FeatureCache:
+    # On-disk cache of the speaker and transpose independent features of some audio: speech encoder units,
+    # F0 and uv. Every entry is one float32 .npy blob [units + 2, frames] holding c with f0 and uv as its
+    # last two rows, read back memory mapped; a sqlite index keeps the size and last use of each entry, so
+    # one cache directory can be shared by several threads and processes. Once the blobs add up to more
+    # than max_bytes the least recently used ones are evicted. on_event("hit" | "miss" | "eviction") is called
+    # for each of them, so that they can be counted across processes too (hits, misses and evictions count
+    # this object's only)
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024, on_event=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.on_event = on_event
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.root / "index.sqlite"), timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        for path in self.root.glob(".*.npy"):
+            try:
+                if time.time() - path.stat().st_mtime > STALE_TMP_SECONDS:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def make_key(wav, *params):
+        # wav: the waveform the features are computed from; params: everything else they depend on
+        h = hashlib.sha256(np.ascontiguousarray(wav, dtype=np.float32).tobytes())
+        for param in params:
+            h.update(b"\0" + str(param).encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return self.root / f"{key}.npy"
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get(self, key):
+        # (c [units, frames], f0 [frames], uv [frames]) as read-only memory mapped arrays, or None
+        try:
+            blob = np.load(self._path(key), mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            self._emit("miss")
+            return None
+        # also indexes a blob whose writer died before indexing it, so that it can be evicted
+        with self._lock:
+            self._conn.execute("INSERT INTO features (key, size, last_used) VALUES (?, ?, ?)"
+                               " ON CONFLICT (key) DO UPDATE SET last_used = excluded.last_used",
+                               (key, blob.offset + blob.nbytes, time.time()))
+            self.hits += 1
+        self._emit("hit")
+        return blob[:-2], blob[-2], blob[-1]
+
+    def _emit(self, event, n=1):
+        if self.on_event is not None:
+            for _ in range(n):
+                self.on_event(event)
+
+    def put(self, key, c, f0, uv):
+        blob = np.concatenate([np.asarray(c, dtype=np.float32).reshape(-1, np.shape(f0)[-1]),
+                               np.asarray(f0, dtype=np.float32).reshape(1, -1),
+                               np.asarray(uv, dtype=np.float32).reshape(1, -1)])
+        fd, tmp = tempfile.mkstemp(prefix=".", suffix=".npy", dir=str(self.root))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, blob)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._execute("INSERT OR REPLACE INTO features (key, size, last_used) VALUES (?, ?, ?)",
+                      (key, size, time.time()))
+        self._emit("eviction", self._evict())
+
+    def _evict(self):
+        # least recently used entries out until the rest fit in max_bytes; returns how many
+        evicted = 0
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM features").fetchone()[0]
+            if total <= self.max_bytes:
+                return evicted
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key, size in self._conn.execute("SELECT key, size FROM features ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM features WHERE key = ?", (key,))
+                    try:
+                        # a process still reading it keeps its mapping
+                        os.remove(self._path(key))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    evicted += 1
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.evictions += evicted
+        return evicted
+
+    def stats(self):
+        entries, size = self._execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM features")[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+        }
@@ -1,11 +1,12 @@
 import gc
 import hashlib
-import io
-import json
 import logging
 import os
 import pickle
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
 import librosa
@@ -20,39 +21,16 @@ import cluster
 import utils
 from diffusion.unit2mel import load_model_vocoder
 from inference import slicer
+from inference.batch_encoder import encode_batch
+from inference.compile_cache import compile_synthesizer, warmup_inputs
+from inference.slice_pool import SlicePool, can_fork
 from models import SynthesizerTrn
+from modules.quantize import checkpoint_quantization, load_int8_checkpoint
+from modules.resample import get_resampler
 
 logging.getLogger('matplotlib').setLevel(logging.WARNING)
 
 
-def read_temp(file_name):
-    if not os.path.exists(file_name):
-        with open(file_name, "w") as f:
-            f.write(json.dumps({"info": "temp_dict"}))
-        return {}
-    else:
-        try:
-            with open(file_name, "r") as f:
-                data = f.read()
-            data_dict = json.loads(data)
-            if os.path.getsize(file_name) > 50 * 1024 * 1024:
-                f_name = file_name.replace("\\", "/").split("/")[-1]
-                print(f"clean {f_name}")
-                for wav_hash in list(data_dict.keys()):
-                    if int(time.time()) - int(data_dict[wav_hash]["time"]) > 14 * 24 * 3600:
-                        del data_dict[wav_hash]
-        except Exception as e:
-            print(e)
-            print(f"{file_name} error,auto rebuild file")
-            data_dict = {"info": "temp_dict"}
-        return data_dict
-
-
-def write_temp(file_name, data):
-    with open(file_name, "w") as f:
-        f.write(json.dumps(data))
-
-
 def timeit(func):
     def run(*args, **kwargs):
         t = time.time()
@@ -109,6 +87,21 @@ def split_list_by_n(list_collection, n, pre=0):
     for i in range(0, len(list_collection), n):
         yield list_collection[i-pre if i-pre>=0 else i: i + n]
 
+def align_audio(audio, trim):
+    # trim: (shift, length) from Svc.slice_features, or None to leave audio as it is. Moves the 1-D audio
+    # tensor `shift` samples earlier (later if negative), then cuts or zero pads it to `length`
+    if trim is None:
+        return audio
+    shift, length = trim
+    audio = audio[shift:] if shift >= 0 else torch.nn.functional.pad(audio, [-shift, 0])
+    audio = audio[:length]
+    return torch.nn.functional.pad(audio, [0, length - audio.size(-1)])
+
+
+# F0 predictors are not safe to use from several threads at once (prefetching slices, or Svc instances
+# sharing one through the ModelRegistry), so their use and loading go through this lock
+f0_lock = threading.Lock()
+
 
 class F0FilterException(Exception):
     pass
@@ -123,9 +116,29 @@ class Svc(object):
                  shallow_diffusion = False,
                  only_diffusion = False,
                  spk_mix_enable = False,
-                 feature_retrieval = False
+                 feature_retrieval = False,
+                 shared = None,
+                 compiled = False,
+                 compile_cache_dir = "inference/compile_cache",
+                 onnx_threads = None
                  ):
+        # shared: optional provider of components that do not depend on the voice model, with
+        # speech_encoder(name, device) and f0_predictor(name, hop_length, sampling_rate, device, threshold)
+        # (e.g. inference.model_registry.ModelRegistry), so that several models can use the same ones
+        self.shared = shared
+        # compiled: run SynthesizerTrn through torch.compile (see load_model), keeping the compiled kernels in
+        # compile_cache_dir (None: torch's default) so that the next process loading this architecture reuses them
+        self.compiled = compiled
+        self.compile_cache_dir = compile_cache_dir
+        # net_g_path and diffusion_model_path may also be .onnx exports (onnx_export.py and
+        # diffusion/onnx_export.py), run by onnxruntime on the CPU with onnx_threads threads each
+        self.onnx_threads = onnx_threads
         self.net_g_path = net_g_path
+        # optional callable(stage, seconds) told how long each inference stage took
+        self.stage_listener = None
+        # optional inference.feature_cache.FeatureCache, so that F0 and content units of audio seen before are
+        # read back instead of computed again (e.g. when rendering it for another speaker or transpose)
+        self.feature_cache = None
         self.only_diffusion = only_diffusion
         self.shallow_diffusion = shallow_diffusion
         self.feature_retrieval = feature_retrieval
@@ -133,6 +146,13 @@ class Svc(object):
             self.dev = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         else:
             self.dev = torch.device(device)
+        # "int8" for a checkpoint written by compress_model.py --int8, None otherwise
+        self.quantized = None
+        if not self.only_diffusion and not net_g_path.endswith(".onnx"):
+            self.quantized = checkpoint_quantization(net_g_path)
+        if self.quantized == "int8" and self.dev.type != "cpu":
+            print("int8 quantized models run on the CPU only, loading everything on the CPU")
+            self.dev = torch.device("cpu")
         self.net_g_ms = None
         if not self.only_diffusion:
             self.hps_ms = utils.get_hparams_from_file(config_path,True)
@@ -146,7 +166,11 @@ class Svc(object):
         self.nsf_hifigan_enhance = nsf_hifigan_enhance
         if self.shallow_diffusion or self.only_diffusion:
             if os.path.exists(diffusion_model_path) and os.path.exists(diffusion_model_path):
-                self.diffusion_model,self.vocoder,self.diffusion_args = load_model_vocoder(diffusion_model_path,self.dev,config_path=diffusion_config_path)
+                if diffusion_model_path.endswith(".onnx"):
+                    from inference.onnx_backend import load_onnx_diffusion
+                    self.diffusion_model,self.vocoder,self.diffusion_args = load_onnx_diffusion(diffusion_model_path,self.dev,config_path=diffusion_config_path,threads=self.onnx_threads)
+                else:
+                    self.diffusion_model,self.vocoder,self.diffusion_args = load_model_vocoder(diffusion_model_path,self.dev,config_path=diffusion_config_path)
                 if self.only_diffusion:
                     self.target_sample = self.diffusion_args.data.sampling_rate
                     self.hop_size = self.diffusion_args.data.block_size
@@ -163,10 +187,10 @@ class Svc(object):
         # load hubert and model
         if not self.only_diffusion:
             self.load_model(spk_mix_enable)
-            self.hubert_model = utils.get_speech_encoder(self.speech_encoder,device=self.dev)
+            self.hubert_model = self.load_speech_encoder(self.speech_encoder)
             self.volume_extractor = utils.Volume_Extractor(self.hop_size)
         else:
-            self.hubert_model = utils.get_speech_encoder(self.diffusion_args.data.encoder,device=self.dev)
+            self.hubert_model = self.load_speech_encoder(self.diffusion_args.data.encoder)
             self.volume_extractor = utils.Volume_Extractor(self.diffusion_args.data.block_size)
             
         if os.path.exists(cluster_model_path):
@@ -187,12 +211,20 @@ class Svc(object):
             self.enhancer = Enhancer('nsf-hifigan', 'pretrain/nsf_hifigan/model',device=self.dev)
             
     def load_model(self, spk_mix_enable=False):
+        if self.net_g_path.endswith(".onnx"):
+            from inference.onnx_backend import OnnxSynthesizer
+            self.net_g_ms = OnnxSynthesizer(self.net_g_path, self.hps_ms, threads=self.onnx_threads)
+            self.dtype = torch.float32
+            return
         # get model configuration
         self.net_g_ms = SynthesizerTrn(
             self.hps_ms.data.filter_length // 2 + 1,
             self.hps_ms.train.segment_size // self.hps_ms.data.hop_length,
             **self.hps_ms.model)
-        _ = utils.load_checkpoint(self.net_g_path, self.net_g_ms, None)
+        if self.quantized == "int8":
+            load_int8_checkpoint(self.net_g_path, self.net_g_ms)
+        else:
+            _ = utils.load_checkpoint(self.net_g_path, self.net_g_ms, None)
         self.dtype = list(self.net_g_ms.parameters())[0].dtype
         if "half" in self.net_g_path and torch.cuda.is_available():
             _ = self.net_g_ms.half().eval().to(self.dev)
@@ -200,38 +232,178 @@ class Svc(object):
             _ = self.net_g_ms.eval().to(self.dev)
         if spk_mix_enable:
             self.net_g_ms.EnableCharacterMix(len(self.spk2id), self.dev)
+        if self.compiled:
+            # compiled now on a short clip rather than on the first request
+            warmup = warmup_inputs(self.hps_ms, self.dev, self.dtype)
+            compile_synthesizer(self.net_g_ms, self.compile_cache_dir, lambda: self.net_g_ms.infer(**warmup))
+
+    @contextmanager
+    def timed_stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.stage_listener is not None:
+                self.stage_listener(stage, time.perf_counter() - start)
+
+    def get_speaker_id(self, speaker):
+        speaker_id = self.spk2id.get(speaker)
+        if not speaker_id and type(speaker) is int:
+            if len(self.spk2id.__dict__) >= speaker:
+                speaker_id = speaker
+        if speaker_id is None:
+            raise RuntimeError("The name you entered is not in the speaker list!")
+        return speaker_id
 
     def get_unit_f0(self, wav, tran, cluster_infer_ratio, speaker, f0_filter ,f0_predictor,cr_threshold=0.05):
+        c, f0, uv = self.extract_features(wav, f0_filter, f0_predictor, cr_threshold=cr_threshold)
+        return self.apply_target(c, f0, uv, tran, cluster_infer_ratio, speaker)
 
+    def load_speech_encoder(self, speech_encoder):
+        if self.shared is not None:
+            return self.shared.speech_encoder(speech_encoder, self.dev)
+        return utils.get_speech_encoder(speech_encoder,device=self.dev)
+
+    def load_f0_predictor(self, f0_predictor, cr_threshold=0.05):
         if not hasattr(self,"f0_predictor_object") or self.f0_predictor_object is None or f0_predictor != self.f0_predictor_object.name:
-            self.f0_predictor_object = utils.get_f0_predictor(f0_predictor,hop_length=self.hop_size,sampling_rate=self.target_sample,device=self.dev,threshold=cr_threshold)
-        f0, uv = self.f0_predictor_object.compute_f0_uv(wav)
+            if self.shared is not None:
+                self.f0_predictor_object = self.shared.f0_predictor(f0_predictor, self.hop_size, self.target_sample, self.dev, cr_threshold)
+            else:
+                self.f0_predictor_object = utils.get_f0_predictor(f0_predictor,hop_length=self.hop_size,sampling_rate=self.target_sample,device=self.dev,threshold=cr_threshold)
+        return self.f0_predictor_object
 
-        if f0_filter and sum(f0) == 0:
-            raise F0FilterException("No voice detected")
-        f0 = torch.FloatTensor(f0).to(self.dev)
-        uv = torch.FloatTensor(uv).to(self.dev)
+    def feature_key(self, wav, f0_predictor, cr_threshold, *params):
+        # feature_cache key of what extract_features (or, with more params, extract_track_features) gets from wav
+        if self.feature_cache is None:
+            return None
+        return self.feature_cache.make_key(wav, f0_predictor, cr_threshold, self.speech_encoder, self.hop_size,
+                                           self.target_sample, self.unit_interpolate_mode, *params)
 
-        f0 = f0 * 2 ** (tran / 12)
-        f0 = f0.unsqueeze(0)
-        uv = uv.unsqueeze(0)
+    def extract_features(self, wav, f0_filter, f0_predictor, cr_threshold=0.05):
+        # speaker and transpose independent part of get_unit_f0, shared by every target of a slice
+        return self.extract_features_batch([wav], f0_filter, f0_predictor, cr_threshold=cr_threshold)[0]
+
+    def extract_features_batch(self, wavs, f0_filter, f0_predictor, cr_threshold=0.05):
+        # extract_features for several slices: F0 is computed per slice, and the speech encoder runs once
+        # over the slices not found in the feature cache (see inference.batch_encoder.encode_batch)
+        features = [None] * len(wavs)
+        encode = []
+        for i, wav in enumerate(wavs):
+            key = self.feature_key(wav, f0_predictor, cr_threshold)
+            cached = self.feature_cache.get(key) if key is not None else None
+            if cached is None:
+                with f0_lock:
+                    predictor = self.load_f0_predictor(f0_predictor, cr_threshold)
+                    with self.timed_stage("f0"):
+                        f0, uv = predictor.compute_f0_uv(wav)
+            else:
+                cached_c, f0, uv = cached
+
+            if f0_filter and sum(f0) == 0:
+                raise F0FilterException("No voice detected")
+            f0 = torch.FloatTensor(np.array(f0)).to(self.dev).unsqueeze(0)
+            uv = torch.FloatTensor(np.array(uv)).to(self.dev).unsqueeze(0)
+
+            if cached is not None:
+                features[i] = (torch.from_numpy(np.array(cached_c)).to(self.dev), f0, uv)
+            else:
+                features[i] = (None, f0, uv)
+                encode.append((i, key))
+        if not encode:
+            return features
+        with self.timed_stage("content_encoding"):
+            resampler = get_resampler(self.target_sample, 16000, device=self.dev)
+            wav16ks = [resampler(torch.from_numpy(wavs[i]).to(self.dev)[None,:])[0] for i, _ in encode]
+            units = encode_batch(self.hubert_model, self.speech_encoder, wav16ks)
+            for (i, key), c in zip(encode, units):
+                _, f0, uv = features[i]
+                c = utils.repeat_expand_2d(c.squeeze(0), f0.shape[1],self.unit_interpolate_mode)
+                features[i] = (c, f0, uv)
+                if key is not None:
+                    self.feature_cache.put(key, c.cpu().numpy(), f0.cpu().numpy(), uv.cpu().numpy())
+        return features
+
+    def extract_track_features(self, audio, audio_sr, f0_predictor, cr_threshold=0.05, pad_seconds=0.5,
+                               chunk_seconds=30, overlap_seconds=1):
+        # F0/uv, content units and (with vol_embedding) volume of a whole track, computed once so that
+        # slice_features() can hand every slice frame aligned views of them instead of encoding the slice
+        # and its padding again. The track gets pad_seconds of silence at each end, like the slices, and the
+        # F0 predictor and speech encoder run over windows of chunk_seconds, overlapping by overlap_seconds
+        # on each side, so that memory does not grow with the length of the track
+        wav = self.load_wav(audio, audio_sr)
+        pad = int(self.target_sample * pad_seconds)
+        wav = np.concatenate([np.zeros(pad, dtype=np.float32), wav, np.zeros(pad + 2 * self.hop_size, dtype=np.float32)])
+        step = max(1, int(chunk_seconds * self.target_sample) // self.hop_size)
+        overlap = int(overlap_seconds * self.target_sample) // self.hop_size
+        key = self.feature_key(wav, f0_predictor, cr_threshold, "track", step, overlap)
+        cached = self.feature_cache.get(key) if key is not None else None
+        if cached is None:
+            c, f0, uv = self.encode_track(wav, f0_predictor, cr_threshold, step, overlap)
+            if key is not None:
+                self.feature_cache.put(key, c.cpu().numpy(), f0, uv)
+        else:
+            c, f0, uv = torch.from_numpy(np.array(cached[0])).to(self.dev), np.array(cached[1]), np.array(cached[2])
+        vol = None
+        if self.vol_embedding:
+            vol = self.volume_extractor.extract(torch.from_numpy(wav).to(self.dev)[None,:])[None,:].to(self.dev)
+        return {
+            "wav": wav,
+            "c": c,
+            "f0": torch.from_numpy(f0).to(self.dev).unsqueeze(0),
+            "uv": torch.from_numpy(uv).to(self.dev).unsqueeze(0),
+            "vol": vol,
+            "audio_sr": audio_sr,
+            "pad": pad,
+        }
+
+    def encode_track(self, wav, f0_predictor, cr_threshold, step, overlap):
+        # (c, f0, uv) of the padded track wav, in windows of `step` frames plus `overlap` frames on each side
+        n_frames = wav.shape[0] // self.hop_size
+        with f0_lock:
+            predictor = self.load_f0_predictor(f0_predictor, cr_threshold)
+        f0 = np.zeros(n_frames, dtype=np.float32)
+        uv = np.zeros(n_frames, dtype=np.float32)
+        c = None
+        for begin in range(0, n_frames, step):
+            end = min(begin + step, n_frames)
+            lo, hi = max(begin - overlap, 0), min(end + overlap, n_frames)
+            window = wav[lo * self.hop_size:hi * self.hop_size]
+            with f0_lock, self.timed_stage("f0"):
+                w_f0, w_uv = predictor.compute_f0_uv(window, p_len=hi - lo)
+            f0[begin:end] = w_f0[begin - lo:end - lo]
+            uv[begin:end] = w_uv[begin - lo:end - lo]
+            with self.timed_stage("content_encoding"):
+                wav16k = get_resampler(self.target_sample, 16000, device=self.dev)(torch.from_numpy(window).to(self.dev)[None,:])[0]
+                w_c = self.hubert_model.encoder(wav16k)
+                w_c = utils.repeat_expand_2d(w_c.squeeze(0), hi - lo, self.unit_interpolate_mode)
+            if c is None:
+                c = torch.zeros(w_c.size(0), n_frames, dtype=w_c.dtype, device=w_c.device)
+            c[:, begin:end] = w_c[:, begin - lo:end - lo]
+        return c, f0, uv
 
-        wav = torch.from_numpy(wav).to(self.dev)
-        if not hasattr(self,"audio16k_resample_transform"):
-            self.audio16k_resample_transform = torchaudio.transforms.Resample(self.target_sample, 16000).to(self.dev)
-        wav16k = self.audio16k_resample_transform(wav[None,:])[0]
-        
-        c = self.hubert_model.encoder(wav16k)
-        c = utils.repeat_expand_2d(c.squeeze(0), f0.shape[1],self.unit_interpolate_mode)
+    def slice_features(self, track, start, length):
+        # frame aligned views of extract_track_features() output for the slice of `length` samples at `start`
+        # (both at the track's input rate), padded by the same pad_seconds: (wav, c, f0, uv, vol, trim).
+        # The views begin on the frame boundary nearest to the padded slice, so the synthesized audio is off
+        # by up to half a hop; align_audio(audio, trim) moves it back and cuts it to the padded slice length
+        pad = track["pad"]
+        size = int(np.ceil(length / track["audio_sr"] * self.target_sample)) + 2 * pad
+        # in the padded track the slice is `pad` samples further on, so its padded version starts here
+        origin = start / track["audio_sr"] * self.target_sample
+        first = int(round(origin / self.hop_size))
+        shift = int(round(origin - first * self.hop_size))
+        n = min(int(np.ceil((shift + size) / self.hop_size)), track["f0"].size(1) - first)
+        frames = slice(first, first + n)
+        wav = track["wav"][first * self.hop_size:(first + n) * self.hop_size]
+        vol = track["vol"][:, frames] if track["vol"] is not None else None
+        return wav, track["c"][:, frames], track["f0"][:, frames], track["uv"][:, frames], vol, (shift, size)
+
+    def apply_target(self, c, f0, uv, tran, cluster_infer_ratio, speaker):
+        f0 = f0 * 2 ** (tran / 12)
 
         if cluster_infer_ratio !=0:
             if self.feature_retrieval:
-                speaker_id = self.spk2id.get(speaker)
-                if not speaker_id and type(speaker) is int:
-                    if len(self.spk2id.__dict__) >= speaker:
-                        speaker_id = speaker
-                if speaker_id is None:
-                    raise RuntimeError("The name you entered is not in the speaker list!")
+                speaker_id = self.get_speaker_id(speaker)
                 feature_index = self.cluster_model[speaker_id]
                 feat_np = np.ascontiguousarray(c.transpose(0,1).cpu().numpy())
                 if self.big_npy is None or self.now_spk_id != speaker_id:
@@ -252,6 +424,17 @@ class Svc(object):
 
         c = c.unsqueeze(0)
         return c, f0, uv
+
+    def load_wav(self, raw_path, audio_sr=None):
+        # raw_path may also be a mono float waveform already in memory (numpy array or tensor), sampled at audio_sr
+        if isinstance(raw_path, (np.ndarray, torch.Tensor)):
+            if audio_sr is None:
+                raise ValueError("audio_sr is required when the audio is given as an array")
+            wav, sr = torch.as_tensor(raw_path, dtype=torch.float32).cpu().reshape(1, -1), audio_sr
+        else:
+            torchaudio.set_audio_backend("soundfile")
+            wav, sr = torchaudio.load(raw_path)
+        return get_resampler(sr, self.target_sample)(wav).numpy()[0]
     
     def infer(self, speaker, tran, raw_path,
               cluster_infer_ratio=0,
@@ -265,79 +448,167 @@ class Svc(object):
               frame = 0,
               spk_mix = False,
               second_encoding = False,
-              loudness_envelope_adjustment = 1
+              loudness_envelope_adjustment = 1,
+              audio_sr = None,
+              features = None,
+              vol = None
               ):
-        torchaudio.set_audio_backend("soundfile")
-        wav, sr = torchaudio.load(raw_path)
-        if not hasattr(self,"audio_resample_transform") or self.audio16k_resample_transform.orig_freq != sr:
-            self.audio_resample_transform = torchaudio.transforms.Resample(sr,self.target_sample)
-        wav = self.audio_resample_transform(wav).numpy()[0]
+        # raw_path: a file path or file object, or a mono float waveform (numpy array or tensor) sampled at audio_sr
+        # features: what infer_features() returned for this audio, if already computed (raw_path is then unused)
+        # vol: its volume ([1, frames]) if already computed, used with vol_embedding
+        if not spk_mix:
+            speaker_id = self.get_speaker_id(speaker)
+            sid = torch.LongTensor([int(speaker_id)]).to(self.dev).unsqueeze(0)
+        if features is None:
+            features = self.infer_features(speaker, tran, raw_path,
+                                           cluster_infer_ratio=cluster_infer_ratio,
+                                           f0_filter=f0_filter,
+                                           f0_predictor=f0_predictor,
+                                           cr_threshold=cr_threshold,
+                                           spk_mix=spk_mix,
+                                           audio_sr=audio_sr)
+        wav, c, f0, uv = features
+        n_frames = f0.size(1)
         if spk_mix:
-            c, f0, uv = self.get_unit_f0(wav, tran, 0, None, f0_filter,f0_predictor,cr_threshold=cr_threshold)
-            n_frames = f0.size(1)
             sid = speaker[:, frame:frame+n_frames].transpose(0,1)
+        audio = self.synthesize(wav, c, f0, uv, sid,
+                                auto_predict_f0=auto_predict_f0,
+                                noice_scale=noice_scale,
+                                enhancer_adaptive_key=enhancer_adaptive_key,
+                                k_step=k_step,
+                                second_encoding=second_encoding,
+                                loudness_envelope_adjustment=loudness_envelope_adjustment,
+                                vol=vol)
+        return audio, audio.shape[-1], n_frames
+
+    def infer_features(self, speaker, tran, raw_path,
+                       cluster_infer_ratio=0,
+                       f0_filter=False,
+                       f0_predictor='pm',
+                       cr_threshold = 0.05,
+                       spk_mix = False,
+                       audio_sr = None
+                       ):
+        # the part of infer() before the synthesizer (loading, F0, content encoding): (wav, c, f0, uv)
+        wav = self.load_wav(raw_path, audio_sr)
+        if spk_mix:
+            c, f0, uv = self.get_unit_f0(wav, tran, 0, None, f0_filter,f0_predictor,cr_threshold=cr_threshold)
         else:
-            speaker_id = self.spk2id.get(speaker)
-            if not speaker_id and type(speaker) is int:
-                if len(self.spk2id.__dict__) >= speaker:
-                    speaker_id = speaker
-            if speaker_id is None:
-                raise RuntimeError("The name you entered is not in the speaker list!")
-            sid = torch.LongTensor([int(speaker_id)]).to(self.dev).unsqueeze(0)
             c, f0, uv = self.get_unit_f0(wav, tran, cluster_infer_ratio, speaker, f0_filter,f0_predictor,cr_threshold=cr_threshold)
-            n_frames = f0.size(1)
-        c = c.to(self.dtype)
-        f0 = f0.to(self.dtype)
-        uv = uv.to(self.dtype)
+        return wav, c, f0, uv
+
+    def synthesize(self, wav, c, f0, uv, sid,
+                   auto_predict_f0=False,
+                   noice_scale=0.4,
+                   enhancer_adaptive_key = 0,
+                   k_step = 100,
+                   second_encoding = False,
+                   loudness_envelope_adjustment = 1,
+                   vol = None
+                   ):
+        return self.synthesize_batch([(wav, c, f0, uv, sid)],
+                                     auto_predict_f0=auto_predict_f0,
+                                     noice_scale=noice_scale,
+                                     enhancer_adaptive_key=enhancer_adaptive_key,
+                                     k_step=k_step,
+                                     second_encoding=second_encoding,
+                                     loudness_envelope_adjustment=loudness_envelope_adjustment,
+                                     vols=[vol])[0]
+
+    def pad_batch(self, items, vols):
+        # zero pads the (c, f0, uv, sid) of each item, and its volume, to the longest one
+        lengths = torch.LongTensor([f0.size(-1) for _, _, f0, _, _ in items])
+        n = int(lengths.max())
+        def stack(tensors):
+            return torch.cat([torch.nn.functional.pad(t, [0, n - t.size(-1)]) for t in tensors])
+        c = stack([c for _, c, _, _, _ in items])
+        f0 = stack([f0 for _, _, f0, _, _ in items])
+        uv = stack([uv for _, _, _, uv, _ in items])
+        sid = torch.cat([sid.reshape(1) for _, _, _, _, sid in items])
+        vol = stack(vols) if vols[0] is not None else None
+        return c, f0, uv, lengths, sid, vol
+
+    def synthesize_batch(self, items,
+                         auto_predict_f0=False,
+                         noice_scale=0.4,
+                         enhancer_adaptive_key = 0,
+                         k_step = 100,
+                         second_encoding = False,
+                         loudness_envelope_adjustment = 1,
+                         vols = None
+                         ):
+        # items: list of (wav, c, f0, uv, sid) as taken by synthesize(). With more than one item the
+        # SynthesizerTrn forward runs once over the zero padded batch, and every output is cut back to
+        # its own length before the per item steps (shallow diffusion, enhancer, loudness). Each output then
+        # matches synthesize() on that item to float rounding (see SynthesizerTrn.infer_batch)
+        # vols: volume ([1, frames]) of each item if already computed, or None to extract it from its wav
+        given_vols = vols if vols is not None else [None] * len(items)
+        items = [(wav, c.to(self.dtype), f0.to(self.dtype), uv.to(self.dtype), sid) for wav, c, f0, uv, sid in items]
+        audios = []
         with torch.no_grad():
             start = time.time()
-            vol = None
-            if not self.only_diffusion:
-                vol = self.volume_extractor.extract(torch.FloatTensor(wav).to(self.dev)[None,:])[None,:].to(self.dev) if self.vol_embedding else None
-                audio,f0 = self.net_g_ms.infer(c, f0=f0, g=sid, uv=uv, predict_f0=auto_predict_f0, noice_scale=noice_scale,vol=vol)
-                audio = audio[0,0].data.float()
-                audio_mel = self.vocoder.extract(audio[None,:],self.target_sample) if self.shallow_diffusion else None
-            else:
-                audio = torch.FloatTensor(wav).to(self.dev)
-                audio_mel = None
-            if self.dtype != torch.float32:
-                c = c.to(torch.float32)
-                f0 = f0.to(torch.float32)
-                uv = uv.to(torch.float32)
-            if self.only_diffusion or self.shallow_diffusion:
-                vol = self.volume_extractor.extract(audio[None,:])[None,:,None].to(self.dev) if vol is None else vol[:,:,None]
-                if self.shallow_diffusion and second_encoding:
-                    if not hasattr(self,"audio16k_resample_transform"):
-                        self.audio16k_resample_transform = torchaudio.transforms.Resample(self.target_sample, 16000).to(self.dev)
-                    audio16k = self.audio16k_resample_transform(audio[None,:])[0]
-                    c = self.hubert_model.encoder(audio16k)
-                    c = utils.repeat_expand_2d(c.squeeze(0), f0.shape[1],self.unit_interpolate_mode)
-                f0 = f0[:,:,None]
-                c = c.transpose(-1,-2)
-                audio_mel = self.diffusion_model(
-                c, 
-                f0, 
-                vol, 
-                spk_id = sid, 
-                spk_mix_dict = None,
-                gt_spec=audio_mel,
-                infer=True, 
-                infer_speedup=self.diffusion_args.infer.speedup, 
-                method=self.diffusion_args.infer.method,
-                k_step=k_step)
-                audio = self.vocoder.infer(audio_mel, f0).squeeze()
-            if self.nsf_hifigan_enhance:
-                audio, _ = self.enhancer.enhance(
-                                    audio[None,:], 
-                                    self.target_sample, 
-                                    f0[:,:,None], 
-                                    self.hps_ms.data.hop_length, 
-                                    adaptive_key = enhancer_adaptive_key)
-            if loudness_envelope_adjustment != 1:
-                audio = utils.change_rms(wav,self.target_sample,audio,self.target_sample,loudness_envelope_adjustment)
+            with self.timed_stage("synthesis"):
+                vols = [None] * len(items)
+                if self.only_diffusion:
+                    outs = [(None, f0) for _, _, f0, _, _ in items]
+                else:
+                    if self.vol_embedding:
+                        vols = [self.volume_extractor.extract(torch.FloatTensor(wav).to(self.dev)[None,:])[None,:].to(self.dev) if vol is None else vol
+                                for (wav, *_), vol in zip(items, given_vols)]
+                    if len(items) == 1:
+                        _, c, f0, uv, sid = items[0]
+                        outs = [self.net_g_ms.infer(c, f0=f0, g=sid, uv=uv, predict_f0=auto_predict_f0, noice_scale=noice_scale,vol=vols[0])]
+                    else:
+                        c, f0, uv, lengths, sid, vol = self.pad_batch(items, vols)
+                        outs = self.net_g_ms.infer_batch(c, f0, uv, lengths, sid, predict_f0=auto_predict_f0, noice_scale=noice_scale, vol=vol)
+                for (wav, c, _, uv, sid), vol, (audio, f0) in zip(items, vols, outs):
+                    if not self.only_diffusion:
+                        audio = audio[0,0].data.float()
+                        audio_mel = self.vocoder.extract(audio[None,:],self.target_sample) if self.shallow_diffusion else None
+                    else:
+                        audio = torch.FloatTensor(wav).to(self.dev)
+                        audio_mel = None
+                    if self.dtype != torch.float32:
+                        c = c.to(torch.float32)
+                        f0 = f0.to(torch.float32)
+                        uv = uv.to(torch.float32)
+                    if self.only_diffusion or self.shallow_diffusion:
+                        vol = self.volume_extractor.extract(audio[None,:])[None,:,None].to(self.dev) if vol is None else vol[:,:,None]
+                        if self.shallow_diffusion and second_encoding:
+                            audio16k = get_resampler(self.target_sample, 16000, device=self.dev)(audio[None,:])[0]
+                            c = self.hubert_model.encoder(audio16k)
+                            c = utils.repeat_expand_2d(c.squeeze(0), f0.shape[1],self.unit_interpolate_mode)
+                        f0 = f0[:,:,None]
+                        c = c.transpose(-1,-2)
+                        audio_mel = self.diffusion_model(
+                        c, 
+                        f0, 
+                        vol, 
+                        spk_id = sid, 
+                        spk_mix_dict = None,
+                        gt_spec=audio_mel,
+                        infer=True, 
+                        infer_speedup=self.diffusion_args.infer.speedup, 
+                        method=self.diffusion_args.infer.method,
+                        k_step=k_step)
+                        audio = self.vocoder.infer(audio_mel, f0).squeeze()
+                    audios.append((wav, audio, f0))
+            results = []
+            for wav, audio, f0 in audios:
+                if self.nsf_hifigan_enhance:
+                    with self.timed_stage("enhancement"):
+                        audio, _ = self.enhancer.enhance(
+                                            audio[None,:], 
+                                            self.target_sample, 
+                                            f0[:,:,None], 
+                                            self.hps_ms.data.hop_length, 
+                                            adaptive_key = enhancer_adaptive_key)
+                if loudness_envelope_adjustment != 1:
+                    audio = utils.change_rms(wav,self.target_sample,audio,self.target_sample,loudness_envelope_adjustment)
+                results.append(audio)
             use_time = time.time() - start
             print("vits use time:{}".format(use_time))
-        return audio, audio.shape[-1], n_frames
+        return results
 
     def clear_empty(self):
         # clean up vram
@@ -353,6 +624,19 @@ class Svc(object):
             del self.enhancer
         gc.collect()
 
+    def load_slices(self, raw_audio_path, slice_db, audio_sr=None):
+        # raw_audio_path may also be a mono numpy waveform already in memory, sampled at audio_sr
+        with self.timed_stage("slicing"):
+            if isinstance(raw_audio_path, np.ndarray):
+                if audio_sr is None:
+                    raise ValueError("audio_sr is required when the audio is given as an array")
+                raw_audio = raw_audio_path.astype(np.float32, copy=False)
+                chunks = slicer.cut_audio(raw_audio, audio_sr, db_thresh=slice_db)
+                return slicer.chunks2audio_data(raw_audio, audio_sr, chunks)
+            wav_path = Path(raw_audio_path).with_suffix('.wav')
+            chunks = slicer.cut(wav_path, db_thresh=slice_db)
+            return slicer.chunks2audio(wav_path, chunks)
+
     def slice_inference(self,
                         raw_audio_path,
                         spk,
@@ -371,21 +655,25 @@ class Svc(object):
                         k_step = 100,
                         use_spk_mix = False,
                         second_encoding = False,
-                        loudness_envelope_adjustment = 1
+                        loudness_envelope_adjustment = 1,
+                        audio_sr = None,
+                        on_segment = None,
+                        batch_size = 1,
+                        prefetch = 0,
+                        whole_track_features = False,
+                        workers = 0
                         ):
+        # whole_track_features: compute F0, content units and volume once for the whole track and give each
+        # slice its share of them, with the real audio around it as context, instead of encoding every padded
+        # slice on its own
+        # workers: see assemble_slices; the loaded models are shared with the worker processes
         if use_spk_mix:
             if len(self.spk2id) == 1:
                 spk = self.spk2id.keys()[0]
                 use_spk_mix = False
-        wav_path = Path(raw_audio_path).with_suffix('.wav')
-        chunks = slicer.cut(wav_path, db_thresh=slice_db)
-        audio_data, audio_sr = slicer.chunks2audio(wav_path, chunks)
+        audio_data, audio_sr = self.load_slices(raw_audio_path, slice_db, audio_sr)
         per_size = int(clip_seconds*audio_sr)
         lg_size = int(lg_num*audio_sr)
-        lg_size_r = int(lg_size*lgr_num)
-        lg_size_c_l = (lg_size-lg_size_r)//2
-        lg_size_c_r = lg_size-lg_size_r-lg_size_c_l
-        lg = np.linspace(0,1,lg_size_r) if lg_size!=0 else 0
 
         if use_spk_mix:
             assert len(self.spk2id) == len(spk)
@@ -404,6 +692,9 @@ class Svc(object):
                     per_length = int(np.ceil(len(dat) / audio_sr * self.target_sample))
                     a_length = per_length + 2 * pad_len
                     audio_length += a_length // self.hop_size
+                    if whole_track_features:
+                        # a window cut from the track may be up to two frames longer
+                        audio_length += 2
             audio_length += len(audio_data)
             spk_mix_tensor = torch.zeros(size=(len(spk), audio_length)).to(self.dev)
             for i in range(len(spk)):
@@ -441,59 +732,362 @@ class Svc(object):
                 raise RuntimeError("sum(spk_mix_tensor) not equal 1")
             spk = spk_mix_tensor
 
-        global_frame = 0
-        audio = []
-        for (slice_tag, data) in audio_data:
-            print(f'#=====segment start, {round(len(data) / audio_sr, 3)}s======')
-            # padd
-            length = int(np.ceil(len(data) / audio_sr * self.target_sample))
-            if slice_tag:
-                print('jump empty segment')
-                _audio = np.zeros(length)
-                audio.extend(list(pad_array(_audio, length)))
-                global_frame += length // self.hop_size
-                continue
-            if per_size != 0:
-                datas = split_list_by_n(data, per_size,lg_size)
+        track = None
+        if whole_track_features and audio_data:
+            track = self.extract_track_features(np.concatenate([data for _, data in audio_data]), audio_sr,
+                                                f0_predictor, cr_threshold=cr_threshold, pad_seconds=pad_seconds)
+
+        def prepare_slice(dat, start, length):
+            # (features for infer(), volume, trim for align_audio()), the last two only from the whole track
+            if track is None:
+                return self.infer_features(spk, tran, dat,
+                                           cluster_infer_ratio=cluster_infer_ratio,
+                                           f0_predictor=f0_predictor,
+                                           cr_threshold=cr_threshold,
+                                           spk_mix=use_spk_mix,
+                                           audio_sr=audio_sr), None, None
+            wav, c, f0, uv, vol, trim = self.slice_features(track, start, length)
+            if use_spk_mix:
+                c, f0, uv = self.apply_target(c, f0, uv, tran, 0, None)
+            else:
+                c, f0, uv = self.apply_target(c, f0, uv, tran, cluster_infer_ratio, spk)
+            return (wav, c, f0, uv), vol, trim
+
+        def prepare_slices(slices):
+            # prepare_slice for a batch of (padded_slice, start, length), with one speech encoder forward
+            if track is not None:
+                return [prepare_slice(*args) for args in slices]
+            wavs = [self.load_wav(dat, audio_sr) for dat, _, _ in slices]
+            features = self.extract_features_batch(wavs, False, f0_predictor, cr_threshold=cr_threshold)
+            return [((wav, *self.apply_target(c, f0, uv, tran, cluster_infer_ratio, spk)), None, None)
+                    for wav, (c, f0, uv) in zip(wavs, features)]
+
+        def infer_slice(prepared, frame):
+            features, vol, trim = prepared
+            out_audio, out_sr, out_frame = self.infer(spk, tran, None,
+                                                cluster_infer_ratio=cluster_infer_ratio,
+                                                auto_predict_f0=auto_predict_f0,
+                                                noice_scale=noice_scale,
+                                                f0_predictor = f0_predictor,
+                                                enhancer_adaptive_key = enhancer_adaptive_key,
+                                                cr_threshold = cr_threshold,
+                                                k_step = k_step,
+                                                frame = frame,
+                                                spk_mix = use_spk_mix,
+                                                second_encoding = second_encoding,
+                                                loudness_envelope_adjustment = loudness_envelope_adjustment,
+                                                features = features,
+                                                vol = vol
+                                                )
+            return [align_audio(out_audio, trim)], out_frame
+
+        def infer_slices(prepared):
+            sid = torch.LongTensor([int(self.get_speaker_id(spk))]).to(self.dev).unsqueeze(0)
+            items = [(wav, c, f0, uv, sid) for (wav, c, f0, uv), _, _ in prepared]
+            outs = self.synthesize_batch(items,
+                                         auto_predict_f0=auto_predict_f0,
+                                         noice_scale=noice_scale,
+                                         enhancer_adaptive_key=enhancer_adaptive_key,
+                                         k_step=k_step,
+                                         second_encoding=second_encoding,
+                                         loudness_envelope_adjustment=loudness_envelope_adjustment,
+                                         vols=[vol for _, vol, _ in prepared])
+            return [([align_audio(out_audio, trim)], f0.size(1))
+                    for out_audio, (_, _, f0, _, _), (_, _, trim) in zip(outs, items, prepared)]
+
+        # speaker mixing needs the global frame of each slice, so it always goes one slice at a time in this process
+        return self.assemble_slices(audio_data, audio_sr, infer_slice, 1,
+                                    pad_seconds=pad_seconds,
+                                    clip_seconds=clip_seconds,
+                                    lg_num=lg_num,
+                                    lgr_num=lgr_num,
+                                    on_segment=on_segment,
+                                    infer_slices=None if use_spk_mix else infer_slices,
+                                    batch_size=batch_size,
+                                    prepare_slice=prepare_slice,
+                                    prepare_slices=prepare_slices,
+                                    prefetch=prefetch,
+                                    workers=0 if use_spk_mix else workers)[0]
+
+    def slice_inference_multi(self,
+                              raw_audio_path,
+                              targets,
+                              slice_db,
+                              cluster_infer_ratio,
+                              auto_predict_f0,
+                              noice_scale,
+                              pad_seconds=0.5,
+                              clip_seconds=0,
+                              lg_num=0,
+                              lgr_num =0.75,
+                              f0_predictor='pm',
+                              enhancer_adaptive_key = 0,
+                              cr_threshold = 0.05,
+                              k_step = 100,
+                              second_encoding = False,
+                              loudness_envelope_adjustment = 1,
+                              audio_sr = None,
+                              on_segment = None,
+                              batch_size = 1,
+                              prefetch = 0,
+                              whole_track_features = False,
+                              workers = 0
+                              ):
+        # targets: list of (speaker, tran). Slicing, F0 extraction and content encoding run once
+        # per slice and are shared; only the synthesis runs once per target. Returns one waveform per target.
+        # whole_track_features, workers: as in slice_inference
+        audio_data, audio_sr = self.load_slices(raw_audio_path, slice_db, audio_sr)
+        sids = [torch.LongTensor([int(self.get_speaker_id(spk))]).to(self.dev).unsqueeze(0) for spk, _ in targets]
+        track = None
+        if whole_track_features and audio_data:
+            track = self.extract_track_features(np.concatenate([data for _, data in audio_data]), audio_sr,
+                                                f0_predictor, cr_threshold=cr_threshold, pad_seconds=pad_seconds)
+
+        def prepare_slice(dat, start, length):
+            # (wav, [(c, f0, uv) per target], n_frames, volume, trim for align_audio())
+            if track is None:
+                wav = self.load_wav(dat, audio_sr)
+                c, f0, uv = self.extract_features(wav, False, f0_predictor, cr_threshold=cr_threshold)
+                vol = trim = None
             else:
-                datas = [data]
-            for k,dat in enumerate(datas):
-                per_length = int(np.ceil(len(dat) / audio_sr * self.target_sample)) if clip_seconds!=0 else length
-                if clip_seconds!=0: 
-                    print(f'###=====segment clip start, {round(len(dat) / audio_sr, 3)}s======')
+                wav, c, f0, uv, vol, trim = self.slice_features(track, start, length)
+            return (wav, [self.apply_target(c, f0, uv, tran, cluster_infer_ratio, spk) for spk, tran in targets],
+                    f0.size(1), vol, trim)
+
+        def prepare_slices(slices):
+            # prepare_slice for a batch of (padded_slice, start, length), with one speech encoder forward
+            if track is not None:
+                return [prepare_slice(*args) for args in slices]
+            wavs = [self.load_wav(dat, audio_sr) for dat, _, _ in slices]
+            features = self.extract_features_batch(wavs, False, f0_predictor, cr_threshold=cr_threshold)
+            return [(wav, [self.apply_target(c, f0, uv, tran, cluster_infer_ratio, spk) for spk, tran in targets],
+                     f0.size(1), None, None) for wav, (c, f0, uv) in zip(wavs, features)]
+
+        def infer_slices(features):
+            # every (slice, target) pair is one item of the synthesis batch
+            items = []
+            vols = []
+            frames = []
+            trims = []
+            for wav, per_target, n_frames, vol, trim in features:
+                frames.append(n_frames)
+                trims.append(trim)
+                for (t_c, t_f0, t_uv), sid in zip(per_target, sids):
+                    items.append((wav, t_c, t_f0, t_uv, sid))
+                    vols.append(vol)
+            outs = []
+            n = max(batch_size, 1)
+            for batch, batch_vols in zip(split_list_by_n(items, n), split_list_by_n(vols, n)):
+                outs.extend(self.synthesize_batch(batch,
+                                                  auto_predict_f0=auto_predict_f0,
+                                                  noice_scale=noice_scale,
+                                                  enhancer_adaptive_key=enhancer_adaptive_key,
+                                                  k_step=k_step,
+                                                  second_encoding=second_encoding,
+                                                  loudness_envelope_adjustment=loudness_envelope_adjustment,
+                                                  vols=batch_vols))
+            return [([align_audio(out, trim) for out in outs[i * len(targets):(i + 1) * len(targets)]], n_frames)
+                    for i, (n_frames, trim) in enumerate(zip(frames, trims))]
+
+        def infer_slice(features, frame):
+            return infer_slices([features])[0]
+
+        # a batch of slices holds batch_size // len(targets) slices, at least one
+        return self.assemble_slices(audio_data, audio_sr, infer_slice, len(targets),
+                                    pad_seconds=pad_seconds,
+                                    clip_seconds=clip_seconds,
+                                    lg_num=lg_num,
+                                    lgr_num=lgr_num,
+                                    on_segment=on_segment,
+                                    infer_slices=infer_slices,
+                                    batch_size=batch_size // len(targets),
+                                    prepare_slice=prepare_slice,
+                                    prepare_slices=prepare_slices,
+                                    prefetch=prefetch,
+                                    workers=workers)
+
+    def assemble_slices(self, audio_data, audio_sr, infer_slice, n_outputs,
+                        pad_seconds=0.5,
+                        clip_seconds=0,
+                        lg_num=0,
+                        lgr_num =0.75,
+                        on_segment = None,
+                        infer_slices = None,
+                        batch_size = 1,
+                        prepare_slice = None,
+                        prefetch = 0,
+                        prepare_slices = None,
+                        workers = 0
+                        ):
+        # infer_slice(padded_slice, global_frame) -> ([audio tensor per output], n_frames)
+        # on_segment(index, n_segments, [new audio per output]) is called as each segment is finished;
+        # crossfades never cross segment boundaries, so that audio is final
+        # infer_slices([padded_slice, ...]) -> [([audio tensor per output], n_frames), ...], if given with
+        # batch_size > 1, converts slices ahead of their turn in batches of similar length
+        # prepare_slice(padded_slice, start, length) -> features, if given, is the synthesizer-free part of the work
+        # (F0, content encoding); infer_slice/infer_slices then get its result instead of the audio. start and length
+        # place the unpadded slice in the track, in samples at audio_sr. With prefetch > 0 it runs on a pool of that
+        # many threads, at most prefetch slices ahead, while the current slice is synthesized; torch's intra-op
+        # threads are then split between them and this thread
+        # prepare_slices([(padded_slice, start, length), ...]) -> [features, ...], if given, prepares a batch of
+        # infer_slices at once (one speech encoder forward); batches are then not prefetched
+        # workers > 1 converts the slices on a SlicePool of that many forked processes with one torch thread
+        # each, sharing the loaded models; the results are stitched here in order, crossfades included.
+        # It replaces batching and prefetching, and infer_slice gets global frame 0
+        per_size = int(clip_seconds*audio_sr)
+        lg_size = int(lg_num*audio_sr)
+        lg_size_r = int(lg_size*lgr_num)
+        lg_size_c_l = (lg_size-lg_size_r)//2
+        lg_size_c_r = lg_size-lg_size_r-lg_size_c_l
+        lg = np.linspace(0,1,lg_size_r) if lg_size!=0 else 0
+
+        def split_slice(data):
+            return split_list_by_n(data, per_size,lg_size) if per_size != 0 else [data]
+
+        def split_starts(data):
+            # where each piece of split_slice(data) starts in data
+            return [i-lg_size if i-lg_size>=0 else i for i in range(0, len(data), per_size)] if per_size != 0 else [0]
+
+        def pad_slice(dat):
+            pad_len = int(audio_sr * pad_seconds)
+            return np.concatenate([np.zeros([pad_len]), dat, np.zeros([pad_len])])
+
+        batched = infer_slices is not None and batch_size > 1
+        pending = [dat for slice_tag, data in audio_data if not slice_tag for dat in split_slice(data)]
+        # the slicer's segments follow each other, so their offsets add up to the position in the track
+        offsets = np.cumsum([0] + [len(data) for _, data in audio_data])
+        starts = [int(offset) + start for (slice_tag, data), offset in zip(audio_data, offsets) if not slice_tag
+                  for start in split_starts(data)]
+        converted = {}
+        chunk = 0
+        forked = workers > 1 and len(pending) > 1
+        if forked and (self.dev.type != "cpu" or not can_fork()):
+            print("slice workers need the CPU and fork(), converting the slices in this process")
+            forked = False
+        group_prepared = batched and prepare_slices is not None
+        prefetching = not forked and not group_prepared and prepare_slice is not None and prefetch > 0 and len(pending) > 1
+        executor = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="slice-prefetch") if prefetching else None
+        prepared = {}
+
+        def take(i):
+            # input of infer_slice(s) for chunk i; then queues prepare_slice for the next `prefetch` chunks
+            if prepare_slice is None:
+                return pad_slice(pending[i])
+            if i in prepared:
+                features = prepared.pop(i).result()
+            else:
+                # without a pool, or the first chunk: run here, which also sets up the F0 predictor and
+                # resampler that the pool threads then share
+                features = prepare_slice(pad_slice(pending[i]), starts[i], len(pending[i]))
+            if executor is not None:
+                for j in range(i + 1, min(len(pending), i + prefetch + 1)):
+                    if j not in prepared and j not in converted:
+                        prepared[j] = executor.submit(prepare_slice, pad_slice(pending[j]), starts[j], len(pending[j]))
+            return features
+
+        def convert(i):
+            # all of the work for chunk i, in a worker process
+            features = pad_slice(pending[i]) if prepare_slice is None else \
+                prepare_slice(pad_slice(pending[i]), starts[i], len(pending[i]))
+            out_audios, out_frame = infer_slice(features, 0)
+            return [out_audio.cpu().numpy() for out_audio in out_audios], out_frame
+
+        pool = SlicePool(self, convert, workers) if forked else None
+        results = pool.imap(len(pending)) if forked else None
+
+        # output goes into one preallocated float32 buffer per output, grown if the model returns more audio
+        # than the slices take at the target rate; `position` is where the next chunk is written
+        capacity = sum(int(np.ceil(len(data) / audio_sr * self.target_sample)) for _, data in audio_data)
+        buffers = [np.zeros(capacity, dtype=np.float32) for _ in range(n_outputs)]
+        position = 0
+
+        def reserve(n):
+            nonlocal buffers
+            if n > len(buffers[0]):
+                size = max(n, len(buffers[0]) * 3 // 2)
+                buffers = [np.concatenate([buffer, np.zeros(size - len(buffer), dtype=np.float32)]) for buffer in buffers]
+
+        global_frame = 0
+        torch_threads = torch.get_num_threads()
+        if prefetching:
+            # otherwise every thread running torch ops at once starts that many threads of its own
+            torch.set_num_threads(max(1, torch_threads // (prefetch + 1)))
+        try:
+            for index, (slice_tag, data) in enumerate(audio_data):
+                print(f'#=====segment start, {round(len(data) / audio_sr, 3)}s======')
+                segment_start = position
                 # padd
-                pad_len = int(audio_sr * pad_seconds)
-                dat = np.concatenate([np.zeros([pad_len]), dat, np.zeros([pad_len])])
-                raw_path = io.BytesIO()
-                soundfile.write(raw_path, dat, audio_sr, format="wav")
-                raw_path.seek(0)
-                out_audio, out_sr, out_frame = self.infer(spk, tran, raw_path,
-                                                    cluster_infer_ratio=cluster_infer_ratio,
-                                                    auto_predict_f0=auto_predict_f0,
-                                                    noice_scale=noice_scale,
-                                                    f0_predictor = f0_predictor,
-                                                    enhancer_adaptive_key = enhancer_adaptive_key,
-                                                    cr_threshold = cr_threshold,
-                                                    k_step = k_step,
-                                                    frame = global_frame,
-                                                    spk_mix = use_spk_mix,
-                                                    second_encoding = second_encoding,
-                                                    loudness_envelope_adjustment = loudness_envelope_adjustment
-                                                    )
-                global_frame += out_frame
-                _audio = out_audio.cpu().numpy()
-                pad_len = int(self.target_sample * pad_seconds)
-                _audio = _audio[pad_len:-pad_len]
-                _audio = pad_array(_audio, per_length)
-                if lg_size!=0 and k!=0:
-                    lg1 = audio[-(lg_size_r+lg_size_c_r):-lg_size_c_r] if lgr_num != 1 else audio[-lg_size:]
-                    lg2 = _audio[lg_size_c_l:lg_size_c_l+lg_size_r]  if lgr_num != 1 else _audio[0:lg_size]
-                    lg_pre = lg1*(1-lg)+lg2*lg
-                    audio = audio[0:-(lg_size_r+lg_size_c_r)] if lgr_num != 1 else audio[0:-lg_size]
-                    audio.extend(lg_pre)
-                    _audio = _audio[lg_size_c_l+lg_size_r:] if lgr_num != 1 else _audio[lg_size:]
-                audio.extend(list(_audio))
-        return np.array(audio)
+                length = int(np.ceil(len(data) / audio_sr * self.target_sample))
+                if slice_tag:
+                    print('jump empty segment')
+                    reserve(position + length)
+                    position += length
+                    global_frame += length // self.hop_size
+                    if on_segment is not None:
+                        on_segment(index, len(audio_data), [buffer[segment_start:position] for buffer in buffers])
+                    continue
+                for k,dat in enumerate(split_slice(data)):
+                    per_length = int(np.ceil(len(dat) / audio_sr * self.target_sample)) if clip_seconds!=0 else length
+                    if clip_seconds!=0: 
+                        print(f'###=====segment clip start, {round(len(dat) / audio_sr, 3)}s======')
+                    if forked:
+                        out_audios, out_frame = next(results)
+                        out_audios = [torch.from_numpy(out_audio) for out_audio in out_audios]
+                    elif batched:
+                        if chunk not in converted:
+                            group = self.batch_ahead(pending, chunk, batch_size, converted)
+                            if group_prepared:
+                                features = prepare_slices([(pad_slice(pending[i]), starts[i], len(pending[i])) for i in group])
+                            else:
+                                features = [take(i) for i in group]
+                            converted.update(zip(group, infer_slices(features)))
+                        out_audios, out_frame = converted.pop(chunk)
+                    else:
+                        out_audios, out_frame = infer_slice(take(chunk), global_frame)
+                    chunk += 1
+                    global_frame += out_frame
+                    pad_len = int(self.target_sample * pad_seconds)
+                    _audios = [pad_array(out_audio.cpu().numpy()[pad_len:-pad_len], per_length) for out_audio in out_audios]
+                    start = position
+                    if lg_size!=0 and k!=0:
+                        # linear crossfade between the tail already written and the head of this chunk
+                        fade_start = position - (lg_size_r+lg_size_c_r) if lgr_num != 1 else position - lg_size
+                        head = lg_size_c_l if lgr_num != 1 else 0
+                        fade = lg_size_r if lgr_num != 1 else lg_size
+                        for buffer, _audio in zip(buffers, _audios):
+                            lg1 = buffer[fade_start:fade_start+fade]
+                            lg2 = _audio[head:head+fade]
+                            buffer[fade_start:fade_start+fade] = lg1*(1-lg)+lg2*lg
+                        start = fade_start + fade
+                        _audios = [_audio[head+fade:] for _audio in _audios]
+                    position = start + len(_audios[0])
+                    reserve(position)
+                    for buffer, _audio in zip(buffers, _audios):
+                        buffer[start:position] = _audio
+                if on_segment is not None:
+                    on_segment(index, len(audio_data), [buffer[segment_start:position] for buffer in buffers])
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+                torch.set_num_threads(torch_threads)
+            if pool is not None:
+                pool.close()
+        return [buffer[:position] for buffer in buffers]
+
+    def batch_ahead(self, slices, position, batch_size, converted, lookahead=4, max_padding=0.25):
+        # the slice needed now plus those among the next batch_size * lookahead not converted yet
+        # whose length is closest to it, as long as padding them to the longest stays under max_padding
+        n = len(slices[position])
+        window = [i for i in range(position, min(len(slices), position + batch_size * lookahead))
+                  if i not in converted]
+        group = []
+        for i in sorted(window, key=lambda i: (abs(len(slices[i]) - n), i)):
+            lengths = [len(slices[j]) for j in group + [i]]
+            if max(lengths) - min(lengths) <= max_padding * max(lengths):
+                group.append(i)
+            if len(group) == batch_size:
+                break
+        return sorted(group)
 
 class RealTimeVC:
     def __init__(self):
@@ -508,20 +1102,23 @@ class RealTimeVC:
                 cluster_infer_ratio=0,
                 auto_predict_f0=False,
                 noice_scale=0.4,
-                f0_filter=False):
+                f0_filter=False,
+                audio_sr=None):
+        # input_wav_path may also be a mono float waveform (numpy array or tensor) sampled at audio_sr
 
         import maad
-        audio, sr = torchaudio.load(input_wav_path)
-        audio = audio.cpu().numpy()[0]
-        temp_wav = io.BytesIO()
+        if isinstance(input_wav_path, (np.ndarray, torch.Tensor)):
+            audio, sr = torch.as_tensor(input_wav_path, dtype=torch.float32).cpu().numpy().reshape(-1), audio_sr
+        else:
+            audio, sr = torchaudio.load(input_wav_path)
+            audio = audio.cpu().numpy()[0]
         if self.last_chunk is None:
-            input_wav_path.seek(0)
-
-            audio, sr = svc_model.infer(speaker_id, f_pitch_change, input_wav_path,
-                                        cluster_infer_ratio=cluster_infer_ratio,
-                                        auto_predict_f0=auto_predict_f0,
-                                        noice_scale=noice_scale,
-                                        f0_filter=f0_filter)
+            audio, _, _ = svc_model.infer(speaker_id, f_pitch_change, audio,
+                                          cluster_infer_ratio=cluster_infer_ratio,
+                                          auto_predict_f0=auto_predict_f0,
+                                          noice_scale=noice_scale,
+                                          f0_filter=f0_filter,
+                                          audio_sr=sr)
             
             audio = audio.cpu().numpy()
             self.last_chunk = audio[-self.pre_len:]
@@ -529,18 +1126,16 @@ class RealTimeVC:
             return audio[-self.chunk_len:]
         else:
             audio = np.concatenate([self.last_chunk, audio])
-            soundfile.write(temp_wav, audio, sr, format="wav")
-            temp_wav.seek(0)
 
-            audio, sr = svc_model.infer(speaker_id, f_pitch_change, temp_wav,
-                                        cluster_infer_ratio=cluster_infer_ratio,
-                                        auto_predict_f0=auto_predict_f0,
-                                        noice_scale=noice_scale,
-                                        f0_filter=f0_filter)
+            audio, _, _ = svc_model.infer(speaker_id, f_pitch_change, audio,
+                                          cluster_infer_ratio=cluster_infer_ratio,
+                                          auto_predict_f0=auto_predict_f0,
+                                          noice_scale=noice_scale,
+                                          f0_filter=f0_filter,
+                                          audio_sr=sr)
 
             audio = audio.cpu().numpy()
             ret = maad.util.crossfade(self.last_o, audio, self.pre_len)
             self.last_chunk = audio[-self.pre_len:]
             self.last_o = audio
             return ret[self.chunk_len:2 * self.chunk_len]
-            
@@ -0,0 +1,127 @@
+import gc
+import threading
+from collections import OrderedDict
+
+import torch
+
+import utils
+from inference.infer_tool import Svc
+
+
+def resident_bytes(svc):
+    # bytes of the weights that belong to this model alone (its speech encoder and F0 predictor are shared)
+    modules = [getattr(svc, "net_g_ms", None), getattr(svc, "diffusion_model", None)]
+    if hasattr(svc, "vocoder"):
+        modules.append(svc.vocoder.vocoder)
+    if hasattr(svc, "enhancer"):
+        modules.append(svc.enhancer.enhancer)
+    total = 0
+    for module in modules:
+        if isinstance(module, torch.nn.Module):
+            # the state dict also holds the packed weights of int8 layers, which are not parameters
+            total += sum(t.numel() * t.element_size() for t in module.state_dict().values() if isinstance(t, torch.Tensor))
+    return total
+
+
+class ModelRegistry:
+    # Keeps several Svc voice models loaded at once, for UIs and servers that switch between many of them.
+    # Models with the same speech_encoder share one speech encoder, and models with the same hop size and
+    # sample rate share their F0 predictors, so only the voice specific parts (SynthesizerTrn, diffusion
+    # model, cluster model) are loaded per model. The weights of those stay under max_bytes: loading one more
+    # model evicts the least recently used ones first. An evicted model is only dropped from the registry,
+    # so a caller still holding it can finish with it
+    def __init__(self, max_bytes=4 * 1024 ** 3):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (svc, resident bytes), least recently used first
+        self._models = OrderedDict()
+        self._speech_encoders = {}
+        self._f0_predictors = {}
+        # reentrant: Svc() asks for its shared components while get() holds it
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(net_g_path, config_path, **svc_kwargs):
+        return (str(net_g_path), str(config_path), tuple(sorted((k, str(v)) for k, v in svc_kwargs.items())))
+
+    def get(self, net_g_path, config_path, **svc_kwargs):
+        # the Svc(net_g_path, config_path, **svc_kwargs), loaded now unless it is already resident
+        key = self.key(net_g_path, config_path, **svc_kwargs)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key][0]
+            self.misses += 1
+            svc = Svc(net_g_path, config_path, shared=self, **svc_kwargs)
+            self._models[key] = (svc, resident_bytes(svc))
+            self._evict(key)
+            return svc
+
+    def _evict(self, keep):
+        evicted = False
+        while self.resident_bytes() > self.max_bytes and len(self._models) > 1:
+            key = next(iter(self._models))
+            if key == keep:
+                self._models.move_to_end(key)
+                continue
+            svc, _ = self._models.pop(key)
+            print(f"unload {svc.net_g_path} (least recently used)")
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def resident_bytes(self):
+        return sum(size for _, size in self._models.values())
+
+    def unload(self, svc):
+        # drops svc from the registry and frees its weights right away
+        with self._lock:
+            for key in [key for key, (model, _) in self._models.items() if model is svc]:
+                del self._models[key]
+        svc.unload_model()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._speech_encoders.clear()
+            self._f0_predictors.clear()
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def speech_encoder(self, speech_encoder, device):
+        key = (speech_encoder, str(device))
+        with self._lock:
+            if key not in self._speech_encoders:
+                self._speech_encoders[key] = utils.get_speech_encoder(speech_encoder, device=device)
+            return self._speech_encoders[key]
+
+    def f0_predictor(self, f0_predictor, hop_length, sampling_rate, device, threshold):
+        key = (f0_predictor, hop_length, sampling_rate, str(device), threshold)
+        with self._lock:
+            if key not in self._f0_predictors:
+                self._f0_predictors[key] = utils.get_f0_predictor(f0_predictor, hop_length=hop_length,
+                                                                  sampling_rate=sampling_rate, device=device,
+                                                                  threshold=threshold)
+            return self._f0_predictors[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "models": len(self._models),
+                "bytes": self.resident_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "speech_encoders": len(self._speech_encoders),
+                "f0_predictors": len(self._f0_predictors),
+            }
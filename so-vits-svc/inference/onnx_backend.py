@@ -0,0 +1,160 @@
+import numpy as np
+import torch
+import yaml
+
+from diffusion.diffusion import linear_beta_schedule
+from diffusion.unit2mel import DotDict
+from diffusion.vocoder import Vocoder
+
+# numpy dtype of each ONNX input type the exported models use
+ONNX_DTYPES = {"tensor(float)": np.float32, "tensor(float16)": np.float16, "tensor(int64)": np.int64}
+
+
+def mel2ph(frames):
+    # the exported models gather their units through mel2ph, 1-based (0 picks a zero frame); the units
+    # given to them are already one per frame
+    return np.arange(1, frames + 1)[None]
+
+
+class OnnxSession:
+    # onnxruntime session on the CPU execution provider. Inputs and outputs go through an IO binding, so
+    # the arrays are handed to onnxruntime as they are and the outputs are allocated by it once per call.
+    # threads: intra-op threads (None: onnxruntime's default, one per core)
+    def __init__(self, path, threads=None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(f"{path}: running ONNX models needs onnxruntime (pip install onnxruntime)") from e
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.inputs = {i.name: ONNX_DTYPES.get(i.type, np.float32) for i in self.session.get_inputs()}
+        self.outputs = [o.name for o in self.session.get_outputs()]
+
+    def run(self, **inputs):
+        # inputs the model does not take (e.g. vol of a model without volume embedding) are left out
+        binding = self.session.io_binding()
+        for name, value in inputs.items():
+            if name in self.inputs and value is not None:
+                if isinstance(value, torch.Tensor):
+                    value = value.detach().cpu().numpy()
+                binding.bind_cpu_input(name, np.ascontiguousarray(value, dtype=self.inputs[name]))
+        for name in self.outputs:
+            binding.bind_output(name, "cpu")
+        self.session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()
+
+
+class OnnxSynthesizer:
+    # SynthesizerTrn.infer() and infer_batch() for a model exported by onnx_export.py, whose inputs are
+    # c [1, frames, units], f0, mel2ph, uv, noise [1, inter_channels, frames], sid and optionally vol.
+    # Models of several speakers are exported for speaker mixing: their sid is [frames, speakers] weights
+    def __init__(self, path, hps, threads=None):
+        self.session = OnnxSession(path, threads)
+        self.inter_channels = hps.model.inter_channels
+        self.n_speakers = len(hps.spk)
+        self.character_mix = self.session.inputs.get("sid") == np.float32
+
+    def to(self, *args, **kwargs):
+        # the session stays on the CPU; inputs are moved there and outputs back to the device of c
+        return self
+
+    def speaker_input(self, g, frames):
+        if not self.character_mix:
+            return g.reshape(-1)[:1]
+        if g.is_floating_point() and g.dim() == 2 and g.size(0) > 1:
+            # already mix weights per frame
+            return g
+        sid = np.zeros((frames, self.n_speakers), dtype=np.float32)
+        sid[:, int(g.reshape(-1)[0])] = 1
+        return sid
+
+    def infer(self, c, f0, uv, g=None, noice_scale=0.35, seed=52468, predict_f0=False, vol=None):
+        if predict_f0:
+            raise RuntimeError("ONNX models are exported without the f0 predictor, auto_predict_f0 is not supported")
+        frames = c.size(-1)
+        # the noise SynthesizerTrn draws in its text encoder for the same seed, scaled as the export expects
+        torch.manual_seed(seed)
+        noise = torch.randn(1, self.inter_channels, frames) * noice_scale
+        audio = self.session.run(c=c.transpose(1, 2), f0=f0, mel2ph=mel2ph(frames), uv=uv, noise=noise,
+                                 sid=self.speaker_input(g, frames), vol=vol)[0]
+        return torch.from_numpy(audio).reshape(1, 1, -1).to(c.device), f0
+
+    def infer_batch(self, c, f0, uv, lengths, g, noice_scale=0.35, seed=52468, predict_f0=False, vol=None):
+        # one session run per item on its own unpadded frames, as infer() would
+        outputs = []
+        for i, n in enumerate(lengths.tolist()):
+            outputs.append(self.infer(c[i:i+1, :, :n], f0[i:i+1, :n], uv[i:i+1, :n], g=g[i:i+1], noice_scale=noice_scale,
+                                      seed=seed, predict_f0=predict_f0, vol=vol[i:i+1, :n] if vol is not None else None))
+        return outputs
+
+
+class OnnxDiffusion:
+    # Unit2Mel for a diffusion model exported by Unit2Mel.ExportOnnx (diffusion/onnx_export.py): the
+    # encoder "<name>_encoder.onnx" and "<name>_diffusion.onnx", the PLMS sampler with the denoiser. The
+    # noising of the shallow diffusion start, done inside Unit2Mel in torch, is done here on the host
+    def __init__(self, encoder_path, args, out_dims, threads=None):
+        encoder_path = str(encoder_path)
+        if not encoder_path.endswith("_encoder.onnx"):
+            raise ValueError(f"{encoder_path}: expected the <name>_encoder.onnx exported next to <name>_diffusion.onnx")
+        self.encoder = OnnxSession(encoder_path, threads)
+        self.diffusion = OnnxSession(encoder_path[:-len("_encoder.onnx")] + "_diffusion.onnx", threads)
+        self.out_dims = out_dims
+        self.n_spk = args.model.n_spk
+        self.timesteps = args.model.timesteps if args.model.timesteps is not None else 1000
+        k_step_max = args.model.k_step_max
+        self.k_step_max = k_step_max if k_step_max is not None and 0 < k_step_max < self.timesteps else self.timesteps
+        alphas_cumprod = np.cumprod(1. - linear_beta_schedule(self.timesteps))
+        self.sqrt_alphas_cumprod = np.sqrt(alphas_cumprod)
+        self.sqrt_one_minus_alphas_cumprod = np.sqrt(1. - alphas_cumprod)
+        # GaussianDiffusion's defaults
+        self.spec_min, self.spec_max = -12., 2.
+
+    def init_spkmix(self, n_spk):
+        # the mixing is part of the exported encoder
+        pass
+
+    def __call__(self, units, f0, volume, spk_id=None, spk_mix_dict=None, aug_shift=None, gt_spec=None, infer=True,
+                 infer_speedup=10, method=None, k_step=300, use_tqdm=True):
+        # same arguments as Unit2Mel.forward. The exported sampler is PLMS, so method must be pndm (or None)
+        if method is not None and method != "pndm":
+            raise NotImplementedError(f"ONNX diffusion models sample with pndm only, not {method}: set infer.method "
+                                      "to 'pndm' in the diffusion config")
+        if gt_spec is not None and k_step > self.k_step_max:
+            raise Exception("The shallow diffusion k_step is greater than the maximum diffusion k_step(k_step_max)!")
+        if gt_spec is None and self.k_step_max != self.timesteps:
+            raise Exception("This model can only be used for shallow diffusion and can not infer alone!")
+        frames = units.size(1)
+        if spk_id is not None and spk_id.dim() == 2 and spk_id.size(1) > 1:
+            spk_mix = spk_id
+        else:
+            spk_mix = np.zeros((frames, max(self.n_spk or 1, 1)), dtype=np.float32)
+            spk_mix[:, int(spk_id.reshape(-1)[0]) if spk_id is not None else 0] = 1
+        cond = self.encoder.run(hubert=units, mel2ph=mel2ph(frames), f0=f0[:, :, 0], volume=volume[:, :, 0],
+                                spk_mix=spk_mix)[0]
+        noise = torch.randn(1, 1, self.out_dims, frames).numpy()
+        if gt_spec is None:
+            k_step = self.timesteps
+            x = noise
+        else:
+            spec = gt_spec.detach().cpu().numpy().transpose(0, 2, 1)[:, None]
+            spec = (spec - self.spec_min) / (self.spec_max - self.spec_min) * 2 - 1
+            x = self.sqrt_alphas_cumprod[k_step - 1] * spec + self.sqrt_one_minus_alphas_cumprod[k_step - 1] * noise
+        mel = self.diffusion.run(condition=cond, noise=x, pndm_speedup=np.array([infer_speedup]),
+                                 K_steps=np.array([k_step]))[0]
+        return torch.from_numpy(mel).transpose(1, 2).to(units.device)
+
+
+def load_onnx_diffusion(model_path, device="cpu", config_path=None, threads=None):
+    # load_model_vocoder() for an exported diffusion model: the vocoder stays a torch model on `device`
+    with open(config_path, "r") as config:
+        args = DotDict(yaml.safe_load(config))
+    vocoder = Vocoder(args.vocoder.type, args.vocoder.ckpt, device=device)
+    model = OnnxDiffusion(model_path, args, vocoder.dimension, threads)
+    print(f'Loaded ONNX diffusion model, sampler is pndm, speedup: {args.infer.speedup} ')
+    return model, vocoder, args
@@ -0,0 +1,54 @@
+import gc
+import multiprocessing
+
+import torch
+
+from inference.feature_cache import FeatureCache
+
+# set in each worker process by _init_worker: convert(i) -> result for chunk i
+_convert = None
+
+
+def can_fork():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _init_worker(svc, convert):
+    global _convert
+    _convert = convert
+    # this process was forked from one that has likely run torch ops on its OpenMP pool already; OpenMP (libgomp)
+    # does not survive a fork, and starting a pool of threads in the child can deadlock, so it stays on one
+    torch.set_num_threads(1)
+    # the sqlite connection of the parent must not be used from another process
+    if svc.feature_cache is not None:
+        svc.feature_cache = FeatureCache(svc.feature_cache.root, svc.feature_cache.max_bytes,
+                                         on_event=svc.feature_cache.on_event)
+
+
+def _run(i):
+    return _convert(i)
+
+
+class SlicePool:
+    # Pool of `workers` processes forked from this one after svc is loaded, so that they share its models
+    # copy-on-write instead of each loading its own: inference never writes to the weights, so their pages
+    # stay shared and N workers cost little more RAM than one. convert(i) runs in the workers; it reaches
+    # them through the fork rather than by pickling, so it may be a closure over anything, but what it
+    # returns is pickled back. Each worker runs torch on one thread (see _init_worker), so `workers` is also
+    # the number of cores used
+    def __init__(self, svc, convert, workers):
+        self.workers = workers
+        # objects that exist now are kept out of the garbage collector's passes, which would otherwise
+        # write to the pages holding them in every worker and so copy them
+        gc.freeze()
+        try:
+            self.pool = multiprocessing.get_context("fork").Pool(workers, _init_worker, (svc, convert))
+        finally:
+            gc.unfreeze()
+
+    def imap(self, n):
+        # convert(0), ..., convert(n - 1), in order, computed up to `workers` at a time
+        return self.pool.imap(_run, range(n))
+
+    def close(self):
+        self.pool.terminate()
@@ -119,6 +119,10 @@ class Slicer:
 
 def cut(audio_path, db_thresh=-30, min_len=5000):
     audio, sr = librosa.load(audio_path, sr=None)
+    return cut_audio(audio, sr, db_thresh=db_thresh, min_len=min_len)
+
+
+def cut_audio(audio, sr, db_thresh=-30, min_len=5000):
     slicer = Slicer(
         sr=sr,
         threshold=db_thresh,
@@ -129,11 +133,16 @@ def cut(audio_path, db_thresh=-30, min_len=5000):
 
 
 def chunks2audio(audio_path, chunks):
-    chunks = dict(chunks)
     audio, sr = torchaudio.load(audio_path)
     if len(audio.shape) == 2 and audio.shape[1] >= 2:
         audio = torch.mean(audio, dim=0).unsqueeze(0)
     audio = audio.cpu().numpy()[0]
+    return chunks2audio_data(audio, sr, chunks)
+
+
+def chunks2audio_data(audio, sr, chunks):
+    # audio: 1-D float32 numpy waveform already in memory
+    chunks = dict(chunks)
     result = []
     for k, v in chunks.items():
         tag = v["split_time"].split(",")
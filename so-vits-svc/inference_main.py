@@ -3,11 +3,11 @@ import logging
 import soundfile
 
 from inference import infer_tool
+from inference.feature_cache import FeatureCache
 from inference.infer_tool import Svc
 from spkmix import spk_mix_map
 
 logging.getLogger('numba').setLevel(logging.WARNING)
-chunks_dict = infer_tool.read_temp("inference/chunks_temp.json")
 
 
 
@@ -53,6 +53,10 @@ def main():
     parser.add_argument('-lgr', '--linear_gradient_retain', type=float, default=0.75, help='自动音频切片后，需要舍弃每段切片的头尾。该参数设置交叉长度保留的比例，范围0-1,左开右闭')
     parser.add_argument('-eak', '--enhancer_adaptive_key', type=int, default=0, help='使增强器适应更高的音域(单位为半音数)|默认为0')
     parser.add_argument('-ft', '--f0_filter_threshold', type=float, default=0.05,help='F0过滤阈值，只有使用crepe时有效. 数值范围从0-1. 降低该值可减少跑调概率，但会增加哑音')
+    parser.add_argument('-fc', '--feature_cache_mb', type=int, default=1024, help='F0与内容编码缓存(inference/feature_cache)的大小上限，单位MB，同一音频换说话人或音高时无需重新计算，0为关闭')
+    parser.add_argument('-cp', '--compile', action='store_true', default=False, help='使用torch.compile编译sovits模型以加快CPU推理，首次加载需编译数分钟，编译结果缓存于inference/compile_cache，之后加载可复用')
+    parser.add_argument('-ot', '--onnx_threads', type=int, default=None, help='模型路径为.onnx(onnx_export.py导出)时onnxruntime使用的线程数，默认为CPU核心数')
+    parser.add_argument('-wk', '--workers', type=int, default=0, help='长音频切片分给多少个CPU子进程并行推理，子进程通过fork共享已加载的模型权重，每个子进程使用1个torch线程，0或1为不使用')
 
 
     args = parser.parse_args()
@@ -101,7 +105,11 @@ def main():
                     shallow_diffusion,
                     only_diffusion,
                     use_spk_mix,
-                    args.feature_retrieval)
+                    args.feature_retrieval,
+                    compiled=args.compile,
+                    onnx_threads=args.onnx_threads)
+    if args.feature_cache_mb > 0:
+        svc_model.feature_cache = FeatureCache("inference/feature_cache", args.feature_cache_mb * 1024 * 1024)
     
     infer_tool.mkdir(["raw", "results"])
     
@@ -116,28 +124,30 @@ def main():
         if "." not in raw_audio_path:
             raw_audio_path += ".wav"
         infer_tool.format_wav(raw_audio_path)
-        for spk in spk_list:
-            kwarg = {
-                "raw_audio_path" : raw_audio_path,
-                "spk" : spk,
-                "tran" : tran,
-                "slice_db" : slice_db,
-                "cluster_infer_ratio" : cluster_infer_ratio,
-                "auto_predict_f0" : auto_predict_f0,
-                "noice_scale" : noice_scale,
-                "pad_seconds" : pad_seconds,
-                "clip_seconds" : clip,
-                "lg_num": lg,
-                "lgr_num" : lgr,
-                "f0_predictor" : f0p,
-                "enhancer_adaptive_key" : enhancer_adaptive_key,
-                "cr_threshold" : cr_threshold,
-                "k_step":k_step,
-                "use_spk_mix":use_spk_mix,
-                "second_encoding":second_encoding,
-                "loudness_envelope_adjustment":loudness_envelope_adjustment
-            }
-            audio = svc_model.slice_inference(**kwarg)
+        kwarg = {
+            "raw_audio_path" : raw_audio_path,
+            "slice_db" : slice_db,
+            "cluster_infer_ratio" : cluster_infer_ratio,
+            "auto_predict_f0" : auto_predict_f0,
+            "noice_scale" : noice_scale,
+            "pad_seconds" : pad_seconds,
+            "clip_seconds" : clip,
+            "lg_num": lg,
+            "lgr_num" : lgr,
+            "f0_predictor" : f0p,
+            "enhancer_adaptive_key" : enhancer_adaptive_key,
+            "cr_threshold" : cr_threshold,
+            "k_step":k_step,
+            "second_encoding":second_encoding,
+            "loudness_envelope_adjustment":loudness_envelope_adjustment,
+            "workers":args.workers
+        }
+        if use_spk_mix:
+            audios = [svc_model.slice_inference(spk=spk_list[0], tran=tran, use_spk_mix=True, **kwarg)]
+        else:
+            # 多个说话人共用切片、F0 和内容编码，只有合成部分分别进行
+            audios = svc_model.slice_inference_multi(targets=[(spk, tran) for spk in spk_list], **kwarg)
+        for spk, audio in zip(spk_list, audios):
             key = "auto" if auto_predict_f0 else f"{tran}key"
             cluster_name = "" if cluster_infer_ratio == 0 else f"_{cluster_infer_ratio}"
             isdiffusion = "sovits"
@@ -149,7 +159,7 @@ def main():
                 spk = "spk_mix"
             res_path = f'results/{clean_name}_{key}_{spk}{cluster_name}_{isdiffusion}_{f0p}.{wav_format}'
             soundfile.write(res_path, audio, svc_model.target_sample, format=wav_format)
-            svc_model.clear_empty()
+        svc_model.clear_empty()
             
 if __name__ == '__main__':
     main()
@@ -152,12 +152,14 @@ class TextEncoder(nn.Module):
             kernel_size,
             p_dropout)
 
-    def forward(self, x, x_mask, f0=None, noice_scale=1):
+    def forward(self, x, x_mask, f0=None, noice_scale=1, noise=None):
         x = x + self.f0_emb(f0).transpose(1, 2)
         x = self.enc_(x * x_mask, x_mask)
         stats = self.proj(x) * x_mask
         m, logs = torch.split(stats, self.out_channels, dim=1)
-        z = (m + torch.randn_like(m) * torch.exp(logs) * noice_scale) * x_mask
+        if noise is None:
+            noise = torch.randn_like(m)
+        z = (m + noise * torch.exp(logs) * noice_scale) * x_mask
 
         return z, m, logs, x_mask
 
@@ -535,3 +537,54 @@ class SynthesizerTrn(nn.Module):
         o = self.dec(z * c_mask, g=g, f0=f0)
         return o,f0
 
+    def _seed(self, device, seed):
+        if device == torch.device("cuda"):
+            torch.cuda.manual_seed_all(seed)
+        else:
+            torch.manual_seed(seed)
+
+    @torch.no_grad()
+    def infer_batch(self, c, f0, uv, lengths, g, noice_scale=0.35, seed=52468, predict_f0=False, vol = None):
+        """
+        infer() for a zero padded batch: c [B, ssl_dim, T], f0/uv/vol [B, T], lengths [B], g [B] speaker ids.
+        Every item gets the noise infer() would draw for it alone and is decoded on its own unpadded frames,
+        so each output matches infer() on that item to float rounding, not bit for bit: convolutions, flows and
+        attention run over the padded length, which changes the order of their sums (around 1e-6 on audio in
+        [-1, 1]). Returns a list of (o [1, 1, samples], f0 [1, frames]).
+        """
+        lengths = lengths.to(c.device)
+        x_mask = torch.unsqueeze(commons.sequence_mask(lengths, c.size(2)), 1).to(c.dtype)
+        g = self.emb_g(g.reshape(-1, 1)).transpose(1, 2)
+
+        vol = self.emb_vol(vol[:,:,None]).transpose(1,2) if vol is not None and self.vol_embedding else 0
+        # masked after the sum too: padded frames must stay zero, as beyond the edge of a single item
+        x = (self.pre(c) * x_mask + self.emb_uv(uv.long()).transpose(1, 2) + vol) * x_mask
+
+        if self.use_automatic_f0_prediction and predict_f0:
+            # the f0 decoder adds the speaker embedding to padded frames too; run it per item
+            f0 = f0.clone()
+            for i, n in enumerate(lengths.tolist()):
+                lf0 = 2595. * torch.log10(1. + f0[i:i+1, None, :n] / 700.) / 500
+                norm_lf0 = utils.normalize_f0(lf0, x_mask[i:i+1, :, :n], uv[i:i+1, :n], random_scale=False)
+                pred_lf0 = self.f0_decoder(x[i:i+1, :, :n], norm_lf0, x_mask[i:i+1, :, :n], spk_emb=g[i:i+1])
+                f0[i, :n] = (700 * (torch.pow(10, pred_lf0 * 500 / 2595) - 1))[0, 0]
+
+        # the prior noise and the RNG state left for the decoder, as infer() would have them for each item
+        noise = torch.zeros(c.size(0), self.inter_channels, c.size(2), dtype=x.dtype, device=c.device)
+        rng_states = []
+        for i, n in enumerate(lengths.tolist()):
+            self._seed(c.device, seed)
+            noise[i, :, :n] = torch.randn(1, self.inter_channels, n, dtype=x.dtype, device=c.device)[0]
+            rng_states.append(torch.cuda.get_rng_state(c.device) if c.device.type == "cuda" else torch.get_rng_state())
+
+        z_p, m_p, logs_p, c_mask = self.enc_p(x, x_mask, f0=f0_to_coarse(f0), noice_scale=noice_scale, noise=noise)
+        z = self.flow(z_p, c_mask, g=g, reverse=True) * c_mask
+        outputs = []
+        for i, n in enumerate(lengths.tolist()):
+            if c.device.type == "cuda":
+                torch.cuda.set_rng_state(rng_states[i], c.device)
+            else:
+                torch.set_rng_state(rng_states[i])
+            outputs.append((self.dec(z[i:i+1, :, :n], g=g[i:i+1], f0=f0[i:i+1, :n]), f0[i:i+1, :n]))
+        return outputs
+
@@ -58,7 +58,7 @@ class FFT(nn.Module):
         x = commons.fused_add_tanh_sigmoid_multiply(
           x,
           g_l,
-          torch.IntTensor([self.hidden_channels]))
+          self.hidden_channels)
       y = self.self_attn_layers[i](x, x, self_attn_mask)
       y = self.drop(y)
       x = self.norm_layers_0[i](x + y)
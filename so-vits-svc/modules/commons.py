@@ -127,11 +127,11 @@ def subsequent_mask(length):
 
 
 @torch.jit.script
-def fused_add_tanh_sigmoid_multiply(input_a, input_b, n_channels):
-  n_channels_int = n_channels[0]
+def fused_add_tanh_sigmoid_multiply(input_a, input_b, n_channels: int):
+  # a python int rather than a tensor keeps the slices static for torch.compile
   in_act = input_a + input_b
-  t_act = torch.tanh(in_act[:, :n_channels_int, :])
-  s_act = torch.sigmoid(in_act[:, n_channels_int:, :])
+  t_act = torch.tanh(in_act[:, :n_channels, :])
+  s_act = torch.sigmoid(in_act[:, n_channels:, :])
   acts = t_act * s_act
   return acts
 
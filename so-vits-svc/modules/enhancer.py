@@ -1,8 +1,8 @@
 import numpy as np
 import torch
 import torch.nn.functional as F
-from torchaudio.transforms import Resample
 
+from modules.resample import get_resampler
 from vdecoder.nsf_hifigan.models import load_model
 from vdecoder.nsf_hifigan.nvSTFT import STFT
 
@@ -18,7 +18,6 @@ class Enhancer:
         else:
             raise ValueError(f" [x] Unknown enhancer: {enhancer_type}")
         
-        self.resample_kernel = {}
         self.enhancer_sample_rate = self.enhancer.sample_rate()
         self.enhancer_hop_size = self.enhancer.hop_size()
         
@@ -45,10 +44,7 @@ class Enhancer:
         if sample_rate == adaptive_sample_rate:
             audio_res = audio
         else:
-            key_str = str(sample_rate) + str(adaptive_sample_rate)
-            if key_str not in self.resample_kernel:
-                self.resample_kernel[key_str] = Resample(sample_rate, adaptive_sample_rate, lowpass_filter_width = 128).to(self.device)
-            audio_res = self.resample_kernel[key_str](audio)
+            audio_res = get_resampler(sample_rate, adaptive_sample_rate, lowpass_filter_width = 128, device = self.device)(audio)
         
         n_frames = int(audio_res.size(-1) // self.enhancer_hop_size + 1)
         
@@ -65,10 +61,7 @@ class Enhancer:
         
         # resample the enhanced output
         if adaptive_factor != 0:
-            key_str = str(adaptive_sample_rate) + str(enhancer_sample_rate)
-            if key_str not in self.resample_kernel:
-                self.resample_kernel[key_str] = Resample(adaptive_sample_rate, enhancer_sample_rate, lowpass_filter_width = 128).to(self.device)
-            enhanced_audio =  self.resample_kernel[key_str](enhanced_audio)
+            enhanced_audio = get_resampler(adaptive_sample_rate, enhancer_sample_rate, lowpass_filter_width = 128, device = self.device)(enhanced_audio)
         
         # pad the silence frames
         if start_frame > 0:
@@ -109,7 +109,6 @@ class WN(torch.nn.Module):
 
   def forward(self, x, x_mask, g=None, **kwargs):
     output = torch.zeros_like(x)
-    n_channels_tensor = torch.IntTensor([self.hidden_channels])
 
     if g is not None:
       g = self.cond_layer(g)
@@ -125,7 +124,7 @@ class WN(torch.nn.Module):
       acts = commons.fused_add_tanh_sigmoid_multiply(
           x_in,
           g_l,
-          n_channels_tensor)
+          self.hidden_channels)
       acts = self.drop(acts)
 
       res_skip_acts = self.res_skip_layers[i](acts)
@@ -0,0 +1,55 @@
+import torch
+import torch.ao.nn.quantized.dynamic as nnqd
+from torch.ao.quantization import quantize_dynamic
+from torch.nn.utils import remove_weight_norm
+from torch.nn.utils.weight_norm import WeightNorm
+
+# the parts of SynthesizerTrn that infer() spends its time in: text encoder, flow and NSF decoder
+QUANTIZED_MODULES = ("enc_p", "flow", "dec")
+# quantize_dynamic only maps Linear by default; the dynamic Conv1d is what the model is made of
+QUANTIZED_LAYERS = {torch.nn.Linear: nnqd.Linear, torch.nn.Conv1d: nnqd.Conv1d}
+
+
+def remove_weight_norms(model):
+    # folds every weight_norm into a plain weight, as quantization needs
+    for module in model.modules():
+        for hook in list(module._forward_pre_hooks.values()):
+            if isinstance(hook, WeightNorm):
+                remove_weight_norm(module, hook.name)
+
+
+def quantize_int8(net_g):
+    # Dynamic int8 quantization of net_g in place, for CPU inference: the weights of every Linear and
+    # Conv1d of QUANTIZED_MODULES are stored as int8, and their inputs are quantized on the fly at every
+    # call. Embeddings, the ConvTranspose1d upsamplers of the decoder and everything else stay float32
+    remove_weight_norms(net_g)
+    for name in QUANTIZED_MODULES:
+        quantize_dynamic(getattr(net_g, name), set(QUANTIZED_LAYERS), dtype=torch.qint8,
+                         mapping=QUANTIZED_LAYERS, inplace=True)
+    return net_g
+
+
+def checkpoint_quantization(checkpoint_path):
+    # the "quantized" entry of a checkpoint: "int8" for one written by compress_model.py --int8, None for a
+    # float one. Its tensors are memory mapped where torch can (2.1 and later) instead of read
+    try:
+        checkpoint_dict = torch.load(checkpoint_path, map_location="cpu", mmap=True)
+    except TypeError:
+        checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
+    return checkpoint_dict.get("quantized")
+
+
+def load_int8_checkpoint(checkpoint_path, net_g):
+    # loads a checkpoint written by compress_model.py --int8 into a float SynthesizerTrn built from the
+    # same config, quantizing net_g first so that its layers take the int8 weights
+    checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
+    if checkpoint_dict.get("quantized") != "int8":
+        raise RuntimeError(f"{checkpoint_path} is not an int8 checkpoint (see compress_model.py --int8)")
+    quantize_int8(net_g.eval())
+    missing, unexpected = net_g.load_state_dict(checkpoint_dict["model"], strict=False)
+    # the posterior encoder is only used for training and is left out of released models
+    missing = [k for k in missing if not k.startswith("enc_q.")]
+    if missing or unexpected:
+        raise RuntimeError(f"{checkpoint_path} is not an int8 checkpoint of this model "
+                           f"(missing: {missing[:5]}, unexpected: {unexpected[:5]})")
+    return net_g
@@ -0,0 +1,22 @@
+import threading
+
+import torch
+from torchaudio.transforms import Resample
+
+# Process wide cache of torchaudio Resample transforms. Building one computes its windowed sinc kernel,
+# which is not free for wide filters or awkward rate ratios, so every (orig_freq, new_freq, width, device)
+# is built once and then shared by Svc, the enhancer and the vocoder. A Resample holds no state besides its
+# kernel, so the same one can be used from several threads.
+_resamplers = {}
+_lock = threading.Lock()
+
+
+def get_resampler(orig_freq, new_freq, lowpass_filter_width=6, device="cpu"):
+    key = (int(orig_freq), int(new_freq), lowpass_filter_width, str(torch.device(device)))
+    with _lock:
+        resampler = _resamplers.get(key)
+        if resampler is None:
+            resampler = Resample(int(orig_freq), int(new_freq), lowpass_filter_width=lowpass_filter_width).to(device)
+            _resamplers[key] = resampler
+        return resampler
+
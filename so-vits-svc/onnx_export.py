@@ -4,7 +4,11 @@ import json
 import torch
 
 import utils
-from onnxexport.model_onnx_speaker_mix import SynthesizerTrn
+try:
+    from onnxexport.model_onnx_speaker_mix import SynthesizerTrn
+except ImportError as e:
+    raise ImportError(f"onnx_export.py exports the SynthesizerTrn of onnxexport/model_onnx_speaker_mix.py, which could not be "
+                      f"imported: {e}") from e
 
 parser = argparse.ArgumentParser(description='SoVitsSvc OnnxExport')
 
@@ -1,7 +1,11 @@
 import torch
 
 import utils
-from onnxexport.model_onnx import SynthesizerTrn
+try:
+    from onnxexport.model_onnx import SynthesizerTrn
+except ImportError as e:
+    raise ImportError(f"onnx_export_old.py exports the SynthesizerTrn of onnxexport/model_onnx.py, which could not be "
+                      f"imported: {e}") from e
 
 
 def main(NetExport):
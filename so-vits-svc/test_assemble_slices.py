@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import torch
+
+from inference.infer_tool import pad_array, split_list_by_n
+
+PAD_SECONDS = 0.5
+
+
+def fake_model(hop_size, extra):
+    # two outputs per slice, derived from its audio and `extra` samples longer (or shorter) than it
+    def infer_slice(padded, global_frame):
+        n = len(padded) + extra
+        base = np.resize(padded, n) * 0.5 + 0.2 + 0.01 * np.sin(np.arange(n) * 0.003 + global_frame)
+        out = torch.from_numpy(base.astype(np.float32))
+        return [out, -out], n // hop_size
+    return infer_slice
+
+
+def reference_assembly(audio_data, sr, infer_slice, hop_size, clip_seconds, lg_num, lgr_num):
+    # assemble_slices as it was before the preallocated buffers: Python lists, crossfaded by rebuilding them.
+    # The slices are at the model's sample rate here, but lengths go through the same float rounding
+    per_size = int(clip_seconds * sr)
+    lg_size = int(lg_num * sr)
+    lg_size_r = int(lg_size * lgr_num)
+    lg_size_c_l = (lg_size - lg_size_r) // 2
+    lg_size_c_r = lg_size - lg_size_r - lg_size_c_l
+    lg = np.linspace(0, 1, lg_size_r) if lg_size != 0 else 0
+    pad_len = int(sr * PAD_SECONDS)
+    audios = [[], []]
+    global_frame = 0
+    for slice_tag, data in audio_data:
+        length = int(np.ceil(len(data) / sr * sr))
+        if slice_tag:
+            for audio in audios:
+                audio.extend(list(np.zeros(length)))
+            global_frame += length // hop_size
+            continue
+        pieces = split_list_by_n(data, per_size, lg_size) if per_size != 0 else [data]
+        for k, dat in enumerate(pieces):
+            per_length = int(np.ceil(len(dat) / sr * sr)) if clip_seconds != 0 else length
+            out_audios, out_frame = infer_slice(np.concatenate([np.zeros(pad_len), dat, np.zeros(pad_len)]),
+                                                global_frame)
+            global_frame += out_frame
+            for i, out_audio in enumerate(out_audios):
+                audio = audios[i]
+                _audio = pad_array(out_audio.numpy()[pad_len:-pad_len], per_length)
+                if lg_size != 0 and k != 0:
+                    lg1 = audio[-(lg_size_r + lg_size_c_r):-lg_size_c_r] if lgr_num != 1 else audio[-lg_size:]
+                    lg2 = _audio[lg_size_c_l:lg_size_c_l + lg_size_r] if lgr_num != 1 else _audio[0:lg_size]
+                    lg_pre = lg1 * (1 - lg) + lg2 * lg
+                    audio = audio[0:-(lg_size_r + lg_size_c_r)] if lgr_num != 1 else audio[0:-lg_size]
+                    audio.extend(lg_pre)
+                    _audio = _audio[lg_size_c_l + lg_size_r:] if lgr_num != 1 else _audio[lg_size:]
+                audio.extend(list(_audio))
+                audios[i] = audio
+    return [np.array(audio) for audio in audios]
+
+
+def track(sr):
+    rng = np.random.default_rng(0)
+    return [(False, rng.uniform(-0.5, 0.5, int(sr * 1.3))), (True, np.zeros(int(sr * 0.4))),
+            (False, rng.uniform(-0.5, 0.5, int(sr * 2.7))), (False, rng.uniform(-0.5, 0.5, int(sr * 0.25)))]
+
+
+@pytest.mark.parametrize("clip_seconds, lg_num, lgr_num", [(0, 0, 0.75), (1, 0, 0.75), (1, 0.2, 0.75),
+                                                          (1, 0.2, 1), (0.7, 0.1, 0.5)])
+@pytest.mark.parametrize("extra", [0, -7, 13])
+def test_matches_the_list_based_assembly(svc, clip_seconds, lg_num, lgr_num, extra):
+    sr = svc.target_sample
+    audio_data = track(sr)
+    infer_slice = fake_model(svc.hop_size, extra)
+    segments = []
+    outputs = svc.assemble_slices(audio_data, sr, infer_slice, 2, pad_seconds=PAD_SECONDS,
+                                  clip_seconds=clip_seconds, lg_num=lg_num, lgr_num=lgr_num,
+                                  on_segment=lambda index, total, audios: segments.append([a.copy() for a in audios]))
+    expected = reference_assembly(audio_data, sr, infer_slice, svc.hop_size, clip_seconds, lg_num, lgr_num)
+    for output, reference in zip(outputs, expected):
+        assert output.dtype == np.float32
+        np.testing.assert_array_equal(output, reference.astype(np.float32))
+    # the segments handed out on the way add up to the whole output
+    assert len(segments) == len(audio_data)
+    for i, output in enumerate(outputs):
+        np.testing.assert_array_equal(np.concatenate([segment[i] for segment in segments]), output)
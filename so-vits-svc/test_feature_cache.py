@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+import pytest
+
+from inference.feature_cache import FeatureCache
+
+
+def features(frames, units=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((units, frames)), 200 + rng.random(frames), (rng.random(frames) > 0.5)
+
+
+def test_round_trip_is_memory_mapped_and_read_only(tmp_path):
+    cache = FeatureCache(tmp_path)
+    c, f0, uv = features(50)
+    cache.put("clave", c, f0, uv)
+    got_c, got_f0, got_uv = cache.get("clave")
+    np.testing.assert_array_equal(got_c, c.astype(np.float32))
+    np.testing.assert_array_equal(got_f0, f0.astype(np.float32))
+    np.testing.assert_array_equal(got_uv, uv.astype(np.float32))
+    assert isinstance(got_c, np.memmap)
+    with pytest.raises(ValueError):
+        got_c[0, 0] = 1
+    assert cache.get("otra") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_keys_depend_on_the_audio_and_every_param():
+    wav = np.zeros(1000, dtype=np.float32)
+    key = FeatureCache.make_key(wav, "rmvpe", 0.05)
+    assert FeatureCache.make_key(wav.astype(np.float64), "rmvpe", 0.05) == key
+    assert FeatureCache.make_key(wav, "pm", 0.05) != key
+    assert FeatureCache.make_key(wav, "rmvpe", 0.06) != key
+    wav[0] = 1e-3
+    assert FeatureCache.make_key(wav, "rmvpe", 0.05) != key
+
+
+def test_evicts_least_recently_used_across_processes(tmp_path):
+    writer = FeatureCache(tmp_path)
+    writer.put("a", *features(100))
+    blob = writer.stats()["bytes"]
+    # another process on the same directory, with room for two entries
+    events = []
+    other = FeatureCache(tmp_path, max_bytes=2 * blob, on_event=events.append)
+    other.put("b", *features(100, seed=1))
+    assert other.get("a") is not None
+    other.put("c", *features(100, seed=2))
+    assert writer.get("b") is None
+    assert writer.get("a") is not None and writer.get("c") is not None
+    assert events == ["hit", "eviction"]
+    assert other.stats()["entries"] == 2
+
+
+def test_counters_are_exact_under_concurrent_lookups(tmp_path):
+    cache = FeatureCache(tmp_path)
+    cache.put("a", *features(10))
+    events = []
+    cache.on_event = events.append
+
+    def lookups():
+        for i in range(200):
+            cache.get("a" if i % 2 else "falta")
+
+    threads = [threading.Thread(target=lookups) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.hits, cache.misses) == (400, 400)
+    assert sorted(set(events)) == ["hit", "miss"] and len(events) == 800
+
+
+def test_slice_inference_reuses_cached_features(svc, song, tmp_path, monkeypatch):
+    audio, sr = song
+    cache = FeatureCache(tmp_path)
+    monkeypatch.setattr(svc, "feature_cache", cache)
+    first = svc.slice_inference(audio, "a", 0, -40, 0, False, 0.4, audio_sr=sr, prefetch=0)
+    assert cache.misses > 0 and cache.hits == 0
+    misses = cache.misses
+    # another speaker and transpose use the same F0 and units
+    second = svc.slice_inference(audio, "b", 3, -40, 0, False, 0.4, audio_sr=sr, prefetch=0)
+    assert cache.misses == misses and cache.hits == misses
+    again = svc.slice_inference(audio, "a", 0, -40, 0, False, 0.4, audio_sr=sr, prefetch=0)
+    np.testing.assert_array_equal(again, first)
+    assert second.shape == first.shape
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+import torch
+
+from conftest import build_synthesizer
+from inference.batch_encoder import encode_batch
+
+# infer_batch runs the prior encoder, flows and attention over the padded length, so the sums of each item are
+# taken in a different order than infer() takes them alone: the audio (in [-1, 1]) matches to float rounding,
+# measured around 1e-7 on this model and 1e-6 on trained ones
+ATOL = 1e-5
+
+
+def slice_inputs(hps, lengths, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    items = []
+    for i, n in enumerate(lengths):
+        c = torch.randn(1, hps.model.ssl_dim, n, generator=g)
+        f0 = 180 + 60 * torch.rand(1, n, generator=g)
+        uv = (torch.rand(1, n, generator=g) > 0.2).float()
+        items.append((c, f0 * uv, uv, torch.LongTensor([i % 2])))
+    return items
+
+
+def pad(tensors):
+    n = max(t.size(-1) for t in tensors)
+    return torch.cat([torch.nn.functional.pad(t, [0, n - t.size(-1)]) for t in tensors])
+
+
+@pytest.mark.parametrize("lengths", [(40, 33, 25), (97, 64, 20, 5)])
+@pytest.mark.parametrize("predict_f0", [False, True])
+def test_infer_batch_matches_infer(tiny_hps, lengths, predict_f0):
+    torch.manual_seed(0)
+    net_g = build_synthesizer(tiny_hps).eval()
+    items = slice_inputs(tiny_hps, lengths)
+    c, f0, uv = (pad([item[k] for item in items]) for k in range(3))
+    outs = net_g.infer_batch(c, f0, uv, torch.LongTensor(lengths), torch.cat([sid for *_, sid in items]),
+                             noice_scale=0.4, predict_f0=predict_f0)
+    assert len(outs) == len(items)
+    for (c, f0, uv, sid), (audio, out_f0) in zip(items, outs):
+        ref_audio, ref_f0 = net_g.infer(c, f0, uv, g=sid, noice_scale=0.4, predict_f0=predict_f0)
+        assert audio.shape == ref_audio.shape
+        # predicted f0 is in Hz and goes through exp(), so it is compared relative to its size
+        torch.testing.assert_close(out_f0, ref_f0, rtol=1e-5, atol=1e-3)
+        torch.testing.assert_close(audio, ref_audio, rtol=0, atol=ATOL)
+
+
+class PerItemEncoder:
+    # a speech encoder that is not one of the fairseq ones: encode_batch must run it once per waveform
+    def __init__(self):
+        self.calls = []
+
+    def encoder(self, wav):
+        self.calls.append(wav.numel())
+        return wav[: wav.numel() // 320 * 320].reshape(1, -1, 320).transpose(1, 2)
+
+
+def test_encode_batch_runs_other_encoders_per_waveform():
+    encoder = PerItemEncoder()
+    wavs = [torch.randn(n) for n in (16000, 9600, 3200)]
+    units = encode_batch(encoder, "whisper-ppg", wavs)
+    assert encoder.calls == [16000, 9600, 3200]
+    assert [u.shape for u in units] == [(1, 320, 50), (1, 320, 30), (1, 320, 10)]
+
+
+def test_encode_batch_matches_single_hubert_forward():
+    # the path vencoder's ContentVec768L12 takes, on a small random fairseq HuBERT
+    hubert = pytest.importorskip("fairseq.models.hubert.hubert")
+    from fairseq.data.dictionary import Dictionary
+    from fairseq.tasks.hubert_pretraining import HubertPretrainingConfig
+
+    dictionary = Dictionary()
+    for i in range(10):
+        dictionary.add_symbol(str(i))
+    torch.manual_seed(0)
+    model = hubert.HubertModel(hubert.HubertConfig(label_rate=50, encoder_layers=12, encoder_embed_dim=96,
+                                                   encoder_ffn_embed_dim=128, encoder_attention_heads=4,
+                                                   final_dim=32, extractor_mode="default"),
+                               HubertPretrainingConfig(label_rate=50, labels=["km"]), [dictionary]).eval()
+
+    class ContentVec:
+        def __init__(self):
+            self.model = model
+
+        def encoder(self, wav):
+            with torch.no_grad():
+                return model.extract_features(source=wav.reshape(1, -1), padding_mask=None,
+                                              output_layer=12)[0].transpose(1, 2)
+
+    speech_encoder = ContentVec()
+    wavs = [torch.randn(n) for n in (16000, 11200, 7000)]
+    for wav, units in zip(wavs, encode_batch(speech_encoder, "vec768l12", wavs)):
+        reference = speech_encoder.encoder(wav)
+        assert units.shape == reference.shape
+        torch.testing.assert_close(units, reference, rtol=0, atol=1e-4)
+
+
+def test_batched_slice_inference_matches_one_slice_at_a_time(svc, song):
+    audio, sr = song
+    args = (audio, "a", 0, -40, 0, False, 0.4)
+    single = svc.slice_inference(*args, audio_sr=sr, batch_size=1, prefetch=0)
+    batched = svc.slice_inference(*args, audio_sr=sr, batch_size=3, prefetch=0)
+    assert batched.shape == single.shape
+    np.testing.assert_allclose(batched, single, rtol=0, atol=ATOL)
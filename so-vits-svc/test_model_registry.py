@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from conftest import build_synthesizer
+
+
+@pytest.fixture(scope="module")
+def model_paths(tiny_config, tiny_hps):
+    paths = []
+    for seed in range(3):
+        torch.manual_seed(seed)
+        path = os.path.join(os.path.dirname(tiny_config), f"G_voz{seed}.pth")
+        torch.save({"model": build_synthesizer(tiny_hps).state_dict(), "iteration": 0, "learning_rate": 1e-4,
+                    "optimizer": None}, path)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def new_registry():
+    try:
+        from inference.model_registry import ModelRegistry
+    except ImportError as e:
+        pytest.skip(f"speech encoder not available: {e}")
+    return ModelRegistry
+
+
+def load(models, path, config):
+    return models.get(path, config, device="cpu", cluster_model_path="")
+
+
+def test_loaded_models_are_reused(new_registry, model_paths, tiny_config):
+    models = new_registry()
+    first = load(models, model_paths[0], tiny_config)
+    assert load(models, model_paths[0], tiny_config) is first
+    # other Svc arguments make another model
+    assert models.get(model_paths[0], tiny_config, device="cpu", cluster_model_path="", nsf_hifigan_enhance=False) \
+        is not first
+    assert models.stats()["hits"] == 1 and models.stats()["misses"] == 2
+
+
+def test_models_share_speech_encoder_and_f0_predictor(new_registry, model_paths, tiny_config, song):
+    models = new_registry()
+    a, b = (load(models, path, tiny_config) for path in model_paths[:2])
+    assert a.hubert_model is b.hubert_model
+    assert a.load_f0_predictor("pm") is b.load_f0_predictor("pm")
+    stats = models.stats()
+    assert stats["speech_encoders"] == 1 and stats["f0_predictors"] == 1
+    # the weights of each voice are still their own
+    audio, sr = song
+    out_a = a.slice_inference(audio, "a", 0, -40, 0, False, 0.4, audio_sr=sr, prefetch=0)
+    out_b = b.slice_inference(audio, "a", 0, -40, 0, False, 0.4, audio_sr=sr, prefetch=0)
+    assert not np.allclose(out_a, out_b)
+
+
+def test_least_recently_used_model_is_evicted_over_budget(new_registry, model_paths, tiny_config):
+    models = new_registry()
+    a = load(models, model_paths[0], tiny_config)
+    size = models.resident_bytes()
+    models.max_bytes = 2 * size
+    b = load(models, model_paths[1], tiny_config)
+    assert load(models, model_paths[0], tiny_config) is a
+    c = load(models, model_paths[2], tiny_config)
+    assert models.resident_bytes() == 2 * size
+    assert models.stats()["evictions"] == 1
+    assert load(models, model_paths[0], tiny_config) is a
+    assert load(models, model_paths[2], tiny_config) is c
+    # b was loaded again as a new object, and whoever still holds the old one can keep using it
+    assert load(models, model_paths[1], tiny_config) is not b
+    assert b.net_g_ms is not None
+
+
+def test_a_model_over_the_whole_budget_still_loads(new_registry, model_paths, tiny_config):
+    models = new_registry(max_bytes=1)
+    load(models, model_paths[0], tiny_config)
+    assert models.stats()["models"] == 1
+    b = load(models, model_paths[1], tiny_config)
+    assert models.stats()["models"] == 1 and models.stats()["evictions"] == 1
+    assert load(models, model_paths[1], tiny_config) is b
+    models.unload(b)
+    assert models.stats()["models"] == 0 and models.resident_bytes() == 0
@@ -0,0 +1,106 @@
+import importlib
+import os
+
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+import utils
+from conftest import build_synthesizer, load_svc
+from eval_int8 import log_spectral_distance
+from eval_onnx import snr
+
+onnxruntime = pytest.importorskip("onnxruntime")
+
+# the models eval_onnx.py compares by default; test_release_model_parity runs when they are there
+RELEASE_MODEL = "logs/44k/G_37600.pth"
+RELEASE_ONNX_MODEL = "checkpoints/TransformerFlow/TransformerFlow_SoVits.onnx"
+RELEASE_CONFIG = "logs/44k/config.json"
+
+
+class ExportedSynthesizer(torch.nn.Module):
+    # SynthesizerTrn with the inputs and outputs onnx_export.py gives it (onnxexport/ is not needed for a
+    # single speaker model without volume embedding): c [1, frames, units] gathered through mel2ph, noise given
+    def __init__(self, net_g):
+        super().__init__()
+        self.net_g = net_g
+
+    def forward(self, c, f0, mel2ph, uv, noise, sid):
+        net_g = self.net_g
+        c = torch.gather(F.pad(c, [0, 0, 1, 0]), 1, mel2ph.unsqueeze(2).repeat([1, 1, c.shape[-1]])).transpose(1, 2)
+        g = net_g.emb_g(sid.unsqueeze(0)).transpose(1, 2)
+        x_mask = torch.ones_like(f0).unsqueeze(1)
+        x = net_g.pre(c) * x_mask + net_g.emb_uv(uv.long()).transpose(1, 2)
+        z_p, _, _, c_mask = net_g.enc_p(x, x_mask, f0=utils.f0_to_coarse(f0), noice_scale=1, noise=noise)
+        z = net_g.flow(z_p, c_mask, g=g, reverse=True)
+        return net_g.dec(z * c_mask, g=g, f0=f0)
+
+
+@pytest.fixture(scope="module")
+def onnx_model_path(tiny_hps, tiny_model_path):
+    net_g = build_synthesizer(tiny_hps)
+    utils.load_checkpoint(tiny_model_path, net_g, None)
+    net_g.eval()
+    frames = 100
+    inputs = (torch.rand(1, frames, tiny_hps.model.ssl_dim), torch.rand(1, frames) * 200 + 100,
+              torch.arange(1, frames + 1)[None], torch.ones(1, frames),
+              torch.randn(1, tiny_hps.model.inter_channels, frames), torch.LongTensor([0]))
+    path = tiny_model_path[:-len(".pth")] + ".onnx"
+    torch.onnx.export(ExportedSynthesizer(net_g), inputs, path, opset_version=17, do_constant_folding=False, dynamo=False,
+                      input_names=["c", "f0", "mel2ph", "uv", "noise", "sid"], output_names=["audio"],
+                      dynamic_axes={"c": [0, 1], "f0": [1], "mel2ph": [1], "uv": [1], "noise": [2]})
+    return path
+
+
+def convert(svc, song, repeats=2):
+    # (converted song, fastest seconds spent in the synthesizer over `repeats` runs)
+    audio, sr = song
+    times = []
+    for _ in range(repeats):
+        synthesis = []
+        svc.stage_listener = lambda stage, seconds: synthesis.append(seconds) if stage == "synthesis" else None
+        out = svc.slice_inference(audio, "a", 0, -40, 0, False, 0.4, audio_sr=sr, prefetch=0)
+        times.append(sum(synthesis))
+    svc.stage_listener = None
+    return out, min(times)
+
+
+def check_parity_and_latency(reference_model, onnx_model, song, min_snr, max_slowdown):
+    reference, torch_seconds = convert(reference_model, song)
+    out, onnx_seconds = convert(onnx_model, song)
+    assert out.shape == reference.shape
+    assert snr(reference, out) > min_snr
+    assert log_spectral_distance(reference, out) < 1
+    assert onnx_seconds < torch_seconds * max_slowdown
+
+
+def test_onnx_model_matches_torch(svc, tiny_config, onnx_model_path, song):
+    onnx_svc = load_svc(onnx_model_path, tiny_config, onnx_threads=1)
+    # same weights, same noise: the two differ by float rounding only. Timings of a model this small are
+    # noisy, so onnxruntime only must not be much slower here
+    check_parity_and_latency(svc, onnx_svc, song, min_snr=80, max_slowdown=2)
+
+
+@pytest.mark.skipif(not (os.path.exists(RELEASE_MODEL) and os.path.exists(RELEASE_ONNX_MODEL)
+                         and os.path.exists(RELEASE_CONFIG)), reason="no exported release model")
+def test_release_model_parity(song):
+    reference_model = load_svc(RELEASE_MODEL, RELEASE_CONFIG)
+    onnx_model = load_svc(RELEASE_ONNX_MODEL, RELEASE_CONFIG)
+    check_parity_and_latency(reference_model, onnx_model, song, min_snr=40, max_slowdown=1)
+
+
+def test_onnx_diffusion_rejects_other_samplers():
+    from inference.onnx_backend import OnnxDiffusion
+
+    # the method is checked before the sessions are used, so no exported model is needed
+    diffusion = OnnxDiffusion.__new__(OnnxDiffusion)
+    units = torch.zeros(1, 10, 768)
+    with pytest.raises(NotImplementedError, match="dpm-solver"):
+        diffusion(units, torch.zeros(1, 10, 1), torch.zeros(1, 10, 1), method="dpm-solver++")
+
+
+@pytest.mark.skipif(importlib.util.find_spec("onnxexport") is not None, reason="onnxexport is installed")
+def test_export_without_onnxexport_fails_clearly():
+    with pytest.raises(ImportError, match="onnxexport/model_onnx_speaker_mix.py"):
+        importlib.import_module("onnx_export")
@@ -0,0 +1,42 @@
+import threading
+import time
+
+import numpy as np
+import torch
+
+
+class ProbePredictor:
+    # wraps an F0 predictor and records the most threads that were inside compute_f0_uv at once
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.name = predictor.name
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+    def compute_f0_uv(self, wav, p_len=None):
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+        try:
+            time.sleep(0.01)
+            return self.predictor.compute_f0_uv(wav, p_len=p_len)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def test_prefetch_matches_and_uses_the_f0_predictor_one_thread_at_a_time(svc, song, monkeypatch):
+    audio, sr = song
+    args = (audio, "a", 0, -40, 0, False, 0.4)
+    # short clips, so that there are more slices than prefetch threads
+    reference = svc.slice_inference(*args, audio_sr=sr, clip_seconds=1)
+
+    probe = ProbePredictor(svc.load_f0_predictor("pm"))
+    monkeypatch.setattr(svc, "load_f0_predictor", lambda *a, **k: probe)
+    threads = torch.get_num_threads()
+    out = svc.slice_inference(*args, audio_sr=sr, clip_seconds=1, prefetch=3)
+
+    np.testing.assert_allclose(out, reference, rtol=0, atol=1e-6)
+    assert probe.most_active == 1
+    assert torch.get_num_threads() == threads
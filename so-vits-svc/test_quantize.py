@@ -0,0 +1,33 @@
+import shutil
+
+import torch
+
+from compress_model import quantizeModel
+from conftest import load_svc
+from modules.quantize import checkpoint_quantization
+
+
+def quantized_layers(svc):
+    return sum(type(m).__module__.startswith("torch.ao.nn.quantized") for m in svc.net_g_ms.modules())
+
+
+def test_int8_checkpoints_are_recognised_by_their_mark_not_their_name(tmp_path, tiny_config, tiny_model_path, song):
+    # the file names say the opposite of what the files are
+    quantized_path = str(tmp_path / "G_0_release.pth")
+    quantizeModel(tiny_config, tiny_model_path, quantized_path)
+    float_path = str(tmp_path / "G_0_int8.pth")
+    shutil.copy(tiny_model_path, float_path)
+    assert checkpoint_quantization(quantized_path) == "int8"
+    assert checkpoint_quantization(float_path) is None
+
+    int8 = load_svc(quantized_path, tiny_config)
+    assert int8.quantized == "int8" and quantized_layers(int8) > 0
+    fp32 = load_svc(float_path, tiny_config)
+    assert fp32.quantized is None and quantized_layers(fp32) == 0
+
+    audio, sr = song
+    args = (audio[:sr * 4], "a", 0, -40, 0, False, 0.4)
+    reference = torch.from_numpy(fp32.slice_inference(*args, audio_sr=sr))
+    out = torch.from_numpy(int8.slice_inference(*args, audio_sr=sr))
+    assert out.shape == reference.shape
+    assert torch.isfinite(out).all()
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+import torch
+from torchaudio.transforms import Resample
+
+from modules.resample import get_resampler
+
+
+def test_get_resampler_builds_each_transform_once():
+    resampler = get_resampler(44100, 16000)
+    assert get_resampler(44100.0, 16000) is resampler
+    assert get_resampler(44100, 16000, lowpass_filter_width=128) is not resampler
+    assert get_resampler(16000, 44100) is not resampler
+    wav = torch.randn(1, 4410)
+    torch.testing.assert_close(resampler(wav), Resample(44100, 16000)(wav), rtol=0, atol=0)
+
+
+def test_arrays_need_their_sample_rate(svc):
+    audio = np.zeros(44100, dtype=np.float32)
+    with pytest.raises(ValueError, match="audio_sr"):
+        svc.load_wav(audio)
+    with pytest.raises(ValueError, match="audio_sr"):
+        svc.load_slices(audio, -40)
+    assert svc.load_wav(audio, 22050).shape == (88200,)
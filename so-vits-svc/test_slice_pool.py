@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+import torch
+
+from inference.slice_pool import SlicePool, can_fork
+
+pytestmark = pytest.mark.skipif(not can_fork(), reason="SlicePool needs fork()")
+
+
+def test_slice_pool_matches_serial_conversion(svc, song):
+    audio, sr = song
+    args = (audio, "a", 0, -40, 0, False, 0.4)
+    # clip_seconds cuts the voiced segments into several chunks, crossfaded when stitched back
+    serial = svc.slice_inference(*args, audio_sr=sr, clip_seconds=1, lg_num=0.2)
+    pooled = svc.slice_inference(*args, audio_sr=sr, clip_seconds=1, lg_num=0.2, workers=2)
+    assert pooled.shape == serial.shape
+    np.testing.assert_allclose(pooled, serial, rtol=0, atol=1e-6)
+
+
+def test_slice_pool_workers_run_torch_on_one_thread(svc):
+    torch.ones(1000, 1000) @ torch.ones(1000, 1000)
+    pool = SlicePool(svc, lambda i: (i, torch.get_num_threads()), 2)
+    try:
+        assert list(pool.imap(4)) == [(0, 1), (1, 1), (2, 1), (3, 1)]
+    finally:
+        pool.close()
@@ -19,7 +19,7 @@ import torch
 
 from compress_model import removeOptimizer
 from edgetts.tts_voices import SUPPORTED_LANGUAGES
-from inference.infer_tool import Svc
+from inference.model_registry import ModelRegistry
 from utils import mix_model
 
 logging.getLogger('numba').setLevel(logging.WARNING)
@@ -34,6 +34,9 @@ debug = False
 
 local_model_root = './trained'
 
+# 已加载的模型，切换回来时无需重新加载；同一编码器的模型共用编码器与F0预测器，超出内存预算时卸载最久未用的模型
+registry = ModelRegistry(max_bytes=int(os.environ.get("SVC_MODEL_CACHE_MB", "4096")) * 1024 * 1024)
+
 cuda = {}
 if torch.cuda.is_available():
     for i in range(torch.cuda.device_count()):
@@ -94,7 +97,7 @@ def modelAnalysis(model_path,config_path,cluster_model_path,device,enhance,diff_
             model_path = model_path.name
             config_path = config_path.name
         fr = ".pkl" in cluster_filepath[1]
-        model = Svc(model_path,
+        model = registry.get(model_path,
                 config_path,
                 device=device if device != "Auto" else None,
                 cluster_model_path = cluster_model_path.name if cluster_model_path is not None else "",
@@ -134,9 +137,8 @@ def modelUnload():
     if model is None:
         return sid.update(choices = [],value=""),"没有模型需要卸载!"
     else:
-        model.unload_model()
+        registry.unload(model)
         model = None
-        torch.cuda.empty_cache()
         return sid.update(choices = [],value=""),"模型卸载完毕!"
     
 def vc_infer(output_format, sid, audio_path, truncated_basename, vc_transform, auto_f0, cluster_ratio, slice_db, noise_scale, pad_seconds, cl_num, lg_num, lgr_num, f0_predictor, enhancer_adaptive_key, cr_threshold, k_step, use_spk_mix, second_encoding, loudness_envelope_adjustment):